@@ -29,7 +29,11 @@ from .utils import (  # noqa: F401
     DirtyNameWarning,
     NoBeamPropertiesInLatticeWarning,
     NotUnderstoodPropertyWarning,
+    PerformanceWarning,
     PhysicsWarning,
     UnknownElementWarning,
     VisualizationWarning,
+    get_backend,
+    profiling,
+    set_backend,
 )
@@ -123,12 +123,14 @@ class Aperture(Element):
             ) <= 1.0
 
         return ParticleBeam(
-            particles=incoming.particles,
+            particles=(
+                incoming.phase_space if incoming.is_compact else incoming.particles
+            ),
             energy=incoming.energy,
             particle_charges=incoming.particle_charges,
             survival_probabilities=incoming.survival_probabilities * survived_mask,
             s=incoming.s,
-            species=incoming.species.clone(),
+            species=incoming.species,
         )
 
     def plot(
@@ -108,6 +108,11 @@ class Cavity(Element):
         if isinstance(incoming, ParameterBeam):
             outgoing_mu = (tm @ incoming.mu.unsqueeze(-1)).squeeze(-1)
             outgoing_cov = tm @ incoming.cov @ tm.mT
+        elif incoming.is_compact:
+            rotation, offset = tm[..., :6, :6], tm[..., :6, 6]
+            outgoing_particles = incoming.phase_space @ rotation.mT + offset.unsqueeze(
+                -2
+            )
         else:  # ParticleBeam
             outgoing_particles = incoming.particles @ tm.mT
         delta_energy = (
@@ -132,7 +137,7 @@ class Cavity(Element):
             )
             outgoing_cov[..., 5, 5] = incoming.cov[..., 5, 5]
         else:  # ParticleBeam
-            outgoing_particles[..., 5] = incoming.particles[
+            outgoing_particles[..., 5] = incoming.phase_space[
                 ..., 5
             ] * incoming.energy.unsqueeze(-1) * beta0.unsqueeze(-1) / (
                 outgoing_energy.unsqueeze(-1) * beta1.unsqueeze(-1)
@@ -144,7 +149,7 @@ class Cavity(Element):
                 outgoing_energy.unsqueeze(-1) * beta1.unsqueeze(-1)
             ) * (
                 (
-                    -incoming.particles[..., 4] * beta0.unsqueeze(-1) * k.unsqueeze(-1)
+                    -incoming.tau * beta0.unsqueeze(-1) * k.unsqueeze(-1)
                     + phi.unsqueeze(-1)
                 ).cos()
                 - phi.cos().unsqueeze(-1)
@@ -218,11 +223,9 @@ class Cavity(Element):
             outgoing_cov[..., 5, 4] = outgoing_cov[..., 4, 5]
         else:  # ParticleBeam
             outgoing_particles[..., 4] = outgoing_particles[..., 4] + (
-                T566.unsqueeze(-1) * incoming.particles[..., 5].square()
-                + T556.unsqueeze(-1)
-                * incoming.particles[..., 4]
-                * incoming.particles[..., 5]
-                + T555.unsqueeze(-1) * incoming.particles[..., 4].square()
+                T566.unsqueeze(-1) * incoming.p.square()
+                + T556.unsqueeze(-1) * incoming.tau * incoming.p
+                + T555.unsqueeze(-1) * incoming.tau.square()
             )
 
         if isinstance(incoming, ParameterBeam):
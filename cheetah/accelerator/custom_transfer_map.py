@@ -4,7 +4,7 @@ from matplotlib.patches import Rectangle
 
 from cheetah.accelerator.element import Element
 from cheetah.particles import Beam, Species
-from cheetah.utils import UniqueNameGenerator
+from cheetah.utils import UniqueNameGenerator, matrix_product
 
 generate_unique_name = UniqueNameGenerator(prefix="unnamed_element")
 
@@ -86,15 +86,20 @@ class CustomTransferMap(Element):
             "dtype": first_element_transfer_map.dtype,
         }
 
-        tm = torch.eye(7, **factory_kwargs).repeat((*incoming_beam.energy.shape, 1, 1))
-        for element in elements:
-            tm = (
-                element.first_order_transfer_map(
-                    incoming_beam.energy, incoming_beam.species
-                )
-                @ tm
+        # NOTE: Skippable elements do not change the beam energy, so all transfer maps
+        # can be computed for the incoming beam and composed in a single reduction.
+        transfer_maps = [
+            element.first_order_transfer_map(
+                incoming_beam.energy, incoming_beam.species
             )
-            incoming_beam = element.track(incoming_beam)
+            for element in elements
+        ]
+        identity = torch.eye(7, **factory_kwargs).repeat(
+            (*incoming_beam.energy.shape, 1, 1)
+        )
+        tm = matrix_product(
+            torch.stack(torch.broadcast_tensors(identity, *transfer_maps), dim=-3)
+        )
 
         combined_length = sum(element.length for element in elements)
 
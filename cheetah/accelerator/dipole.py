@@ -9,6 +9,7 @@ from cheetah.particles import Beam, ParticleBeam, Species
 from cheetah.track_methods import base_rmatrix, base_ttensor, rotation_matrix
 from cheetah.utils import UniqueNameGenerator, bmadx, cache_transfer_map
 from cheetah.utils.autograd import sqrta2minusbdiva
+from cheetah.utils.backend import compilable
 
 generate_unique_name = UniqueNameGenerator(prefix="unnamed_element")
 
@@ -232,7 +233,12 @@ class Dipole(Element):
 
         outgoing_beam = ParticleBeam(
             particles=torch.stack(
-                (x, px, y, py, tau, delta, torch.ones_like(x)), dim=-1
+                (
+                    (x, px, y, py, tau, delta)
+                    if incoming.is_compact
+                    else (x, px, y, py, tau, delta, torch.ones_like(x))
+                ),
+                dim=-1,
             ),
             energy=ref_energy,
             particle_charges=incoming.particle_charges,
@@ -242,6 +248,7 @@ class Dipole(Element):
         )
         return outgoing_beam
 
+    @compilable
     def _bmadx_body(
         self,
         x: torch.Tensor,
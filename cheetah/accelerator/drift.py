@@ -143,7 +143,12 @@ class Drift(Element):
 
         outgoing_beam = ParticleBeam(
             particles=torch.stack(
-                [x, px, y, py, tau, delta, torch.ones_like(x)], dim=-1
+                (
+                    [x, px, y, py, tau, delta]
+                    if incoming.is_compact
+                    else [x, px, y, py, tau, delta, torch.ones_like(x)]
+                ),
+                dim=-1,
             ),
             energy=ref_energy,
             particle_charges=incoming.particle_charges,
@@ -9,10 +9,14 @@ from torch import nn
 
 from cheetah.particles import Beam, ParameterBeam, ParticleBeam, Species
 from cheetah.utils import DirtyNameWarning, UniqueNameGenerator, VisualizationWarning
+from cheetah.utils.reversible import linear_transform
 from cheetah.utils.warnings import PhysicsWarning
 
 generate_unique_name = UniqueNameGenerator(prefix="unnamed_element")
 
+# Defining features of each element class as a tuple and a frozenset
+_FROZEN_DEFINING_FEATURES: dict[type, tuple[tuple[str, ...], frozenset[str]]] = {}
+
 
 class Element(ABC, nn.Module):
     """
@@ -31,6 +35,10 @@ class Element(ABC, nn.Module):
     :param dtype: Data type of the element's tensors.
     """
 
+    # Number of dimensions (without vectorisation) of multi-dimensional attributes. All
+    # others are assumed to be scalar (when not vectorised).
+    UNVECTORIZED_NUM_ATTR_DIMS = {}
+
     def __init__(
         self,
         name: str | None = None,
@@ -175,11 +183,13 @@ class Element(ABC, nn.Module):
                 incoming.energy,
                 total_charge=incoming.total_charge,
                 s=new_s,
-                species=incoming.species.clone(),
+                species=incoming.species,
             )
         elif isinstance(incoming, ParticleBeam):
             tm = self.first_order_transfer_map(incoming.energy, incoming.species)
-            new_particles = incoming.particles @ tm.mT
+            new_particles = linear_transform(
+                incoming.phase_space if incoming.is_compact else incoming.particles, tm
+            )
             new_s = incoming.s + self.length
             return ParticleBeam(
                 new_particles,
@@ -187,7 +197,7 @@ class Element(ABC, nn.Module):
                 particle_charges=incoming.particle_charges,
                 survival_probabilities=incoming.survival_probabilities,
                 s=new_s,
-                species=incoming.species.clone(),
+                species=incoming.species,
             )
         else:
             raise TypeError(f"Parameter incoming is of invalid type {type(incoming)}")
@@ -208,6 +218,10 @@ class Element(ABC, nn.Module):
             incoming.energy, incoming.species
         )
 
+        # Only the phase space coordinates are computed for compact beams
+        if incoming.is_compact:
+            second_order_tm = second_order_tm[..., :6, :, :]
+
         outgoing_particles = torch.einsum(
             "...ijk,...j,...k->...i",
             second_order_tm.unsqueeze(-4),  # Add broadcast dimension for particles
@@ -269,11 +283,11 @@ class Element(ABC, nn.Module):
         raise NotImplementedError
 
     def __setattr__(self, name: str, value: Any) -> None:
-        # Check if attribute even exists needed because `__setattr__` can be called
-        # during the initialisation of the object.
-        if hasattr(self, "defining_features") and name in self.defining_features:
-            self._cached_first_order_transfer_map = None
-            self._cached_second_order_transfer_map = None
+        if name in self._frozen_defining_features[1]:
+            # Written to `__dict__` directly to avoid recursing into `__setattr__`
+            self.__dict__["_defining_features_version"] = (
+                self.__dict__.get("_defining_features_version", 0) + 1
+            )
 
         return super().__setattr__(name, value)
 
@@ -303,7 +317,8 @@ class Element(ABC, nn.Module):
         and to save them.
 
         NOTE: When overriding this property, make sure to call the super method and
-            extend the list it returns.
+            extend the list it returns. The defining features must only depend on the
+            element's class, as they are computed once per class for internal use.
         """
         return (
             ["name"]
@@ -311,12 +326,42 @@ class Element(ABC, nn.Module):
             else ["name", "tracking_method"]
         )
 
+    @property
+    def _frozen_defining_features(self) -> tuple[tuple[str, ...], frozenset[str]]:
+        """
+        Defining features as a tuple and as a frozenset for fast membership checks.
+        These are computed only once per element class, so that hot paths like
+        attribute assignment and transfer map caching do not rebuild the list of
+        `defining_features` through the class hierarchy on every call.
+
+        NOTE: This assumes that `defining_features` only depends on the element's class.
+        """
+        cls = self.__class__
+        if cls not in _FROZEN_DEFINING_FEATURES:
+            try:
+                features = tuple(self.defining_features)
+            except AttributeError:
+                # Attributes `defining_features` depends on may not be set yet during
+                # the initialisation of the element
+                return (), frozenset()
+            _FROZEN_DEFINING_FEATURES[cls] = (features, frozenset(features))
+        return _FROZEN_DEFINING_FEATURES[cls]
+
+    @property
+    def defining_features_version(self) -> int:
+        """
+        Counter that is incremented every time one of the element's defining features
+        is assigned a new value. Changes made to tensors in place are not counted and
+        can be detected from the tensors' own version counters.
+        """
+        return self.__dict__.get("_defining_features_version", 0)
+
     @property
     def defining_tensors(self) -> list[str]:
         """Subset of defining features that are of type `torch.Tensor`."""
         return [
             feature
-            for feature in self.defining_features
+            for feature in self._frozen_defining_features[0]
             if isinstance(getattr(self, feature), torch.Tensor)
         ]
 
@@ -329,7 +374,7 @@ class Element(ABC, nn.Module):
                     if isinstance(getattr(self, feature), torch.Tensor)
                     else deepcopy(getattr(self, feature))
                 )
-                for feature in self.defining_features
+                for feature in self._frozen_defining_features[0]
             },
             metadata=deepcopy(self.metadata),
             sanitize_name=False,
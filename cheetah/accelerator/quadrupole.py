@@ -47,6 +47,10 @@ class Quadrupole(Element):
     :param dtype: Data type of the element's tensors.
     """
 
+    UNVECTORIZED_NUM_ATTR_DIMS = Element.UNVECTORIZED_NUM_ATTR_DIMS | {
+        "misalignment": 1
+    }
+
     supported_tracking_methods = ["linear", "second_order", "drift_kick_drift"]
 
     def __init__(
@@ -200,31 +204,27 @@ class Quadrupole(Element):
             x_offset, y_offset, self.tilt, x, px, y, py
         )
 
-        for _ in range(self.num_steps):
-            rel_p = 1 + pz  # Particle's relative momentum (P/P0)
-            k1 = b1.unsqueeze(-1) / (self.length.unsqueeze(-1) * rel_p)
+        # The step coefficients only depend on `pz`, which is constant inside the
+        # quadrupole, and are therefore computed once for all steps
+        rel_p = 1 + pz  # Particle's relative momentum (P/P0)
+        k1 = b1.unsqueeze(-1) / (self.length.unsqueeze(-1) * rel_p)
 
-            tx, dzx = bmadx.calculate_quadrupole_coefficients(-k1, step_length, rel_p)
-            ty, dzy = bmadx.calculate_quadrupole_coefficients(k1, step_length, rel_p)
+        tx, dzx = bmadx.calculate_quadrupole_coefficients(-k1, step_length, rel_p)
+        ty, dzy = bmadx.calculate_quadrupole_coefficients(k1, step_length, rel_p)
+        dz_low_energy = bmadx.low_energy_z_correction(pz, p0c, mc2, step_length)
 
+        for _ in range(self.num_steps):
             z = (
                 z
-                + dzx[0] * x.square()
-                + dzx[1] * x * px
+                + x * (dzx[0] * x + dzx[1] * px)
                 + dzx[2] * px.square()
-                + dzy[0] * y.square()
-                + dzy[1] * y * py
+                + y * (dzy[0] * y + dzy[1] * py)
                 + dzy[2] * py.square()
+                + dz_low_energy
             )
 
-            x_next = tx[0][0] * x + tx[0][1] * px
-            px_next = tx[1][0] * x + tx[1][1] * px
-            y_next = ty[0][0] * y + ty[0][1] * py
-            py_next = ty[1][0] * y + ty[1][1] * py
-
-            x, px, y, py = x_next, px_next, y_next, py_next
-
-            z = z + bmadx.low_energy_z_correction(pz, p0c, mc2, step_length)
+            x, px = tx[0][0] * x + tx[0][1] * px, tx[1][0] * x + tx[1][1] * px
+            y, py = ty[0][0] * y + ty[0][1] * py, ty[1][0] * y + ty[1][1] * py
 
         # s = s + l
         x, px, y, py = bmadx.offset_particle_unset(
@@ -240,7 +240,12 @@ class Quadrupole(Element):
 
         outgoing_beam = ParticleBeam(
             particles=torch.stack(
-                (x, px, y, py, tau, delta, torch.ones_like(x)), dim=-1
+                (
+                    (x, px, y, py, tau, delta)
+                    if incoming.is_compact
+                    else (x, px, y, py, tau, delta, torch.ones_like(x))
+                ),
+                dim=-1,
             ),
             energy=ref_energy,
             particle_charges=incoming.particle_charges,
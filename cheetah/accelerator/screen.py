@@ -3,15 +3,17 @@ from typing import Literal
 import matplotlib.pyplot as plt
 import torch
 from matplotlib.patches import Rectangle
-from torch.distributions import MultivariateNormal
 
 from cheetah.accelerator.element import Element
 from cheetah.particles import Beam, ParameterBeam, ParticleBeam, Species
 from cheetah.utils import (
     UniqueNameGenerator,
+    binned_kde_histogram_2d,
     cache_transfer_map,
     cloud_in_cell_charge_deposition,
+    gaussian_histogram_2d,
     kde_histogram_2d,
+    nearest_grid_point_charge_deposition,
 )
 
 generate_unique_name = UniqueNameGenerator(prefix="unnamed_element")
@@ -21,15 +23,19 @@ class Screen(Element):
     """
     Diagnostic screen in a particle accelerator.
 
-    NOTE: The three methods for generating the screen's reading differ primarily in
+    NOTE: The four methods for generating the screen's reading differ primarily in
         terms of performance, with "histogram" being the fastest, followed by
-        "cloud-in-cell" (ca. 1.5x slower than "histogram"), and "kde" being the slowest
-        (ca. 280x slower than "histogram"). However, "histogram" does not provide useful
-        gradients and is incompatible with vectorisation, while both features are
-        supported by "kde" and "cloud-in-cell".
-
-    NOTE: Vectorised `ParameterBeam`s can currently not be recorded by `Screen`
-        elements.
+        "cloud-in-cell" (ca. 1.5x slower than "histogram"), "binned-kde" (about as fast
+        as "cloud-in-cell") and "kde" being the slowest (ca. 280x slower than
+        "histogram"). However, "histogram" does not provide useful gradients with
+        respect to the particle positions, while the other methods do. "binned-kde"
+        approximates the smooth images of "kde" by convolving a finely binned
+        cloud-in-cell deposition with the Gaussian kernel. All four methods support
+        vectorisation.
+
+    NOTE: Readings of `ParameterBeam`s are computed analytically for any method as the
+        probability of the transverse Gaussian distribution in every pixel, and are
+        vectorised like those of `ParticleBeam`s.
 
     :param resolution: Resolution of the camera sensor looking at the screen given as
         tuple or list `(width, height)` in pixels.
@@ -39,10 +45,15 @@ class Screen(Element):
     :param misalignment: Misalignment of the screen in meters given as a Tensor
         `(x, y)`.
     :param method: Method used to generate the screen's reading. Can be either
-        "histogram", "kde", or "cloud-in-cell", defaults to "cloud-in-cell".
-        KDE and cloud-in-cell methods allow backward differentiation.
-    :param kde_bandwidth: Bandwidth used for the kernel density estimation in meters.
-        Controls the smoothness of the distribution.
+        "histogram", "kde", "binned-kde", or "cloud-in-cell", defaults to
+        "cloud-in-cell". KDE, binned KDE and cloud-in-cell methods allow backward
+        differentiation.
+    :param kde_bandwidth: Bandwidth used for the (binned) kernel density estimation in
+        meters. Controls the smoothness of the distribution.
+    :param deposition_backend: Backend of the cloud-in-cell deposition of the
+        "cloud-in-cell" and "binned-kde" methods. Can be either "scatter" or "sort",
+        defaults to "scatter". "sort" is slower, but its readings are bitwise
+        reproducible. See `CloudInCellStencil`.
     :param is_blocking: If `True` the screen is blocking and will stop the beam.
     :param is_active: If `True` the screen is active and will record the beam's
         distribution. If `False` the screen is inactive and will not record the beam's
@@ -60,14 +71,22 @@ class Screen(Element):
     :param dtype: Data type of the element's tensors.
     """
 
+    UNVECTORIZED_NUM_ATTR_DIMS = Element.UNVECTORIZED_NUM_ATTR_DIMS | {
+        "pixel_size": 1,
+        "misalignment": 1,
+    }
+
     def __init__(
         self,
         resolution: tuple[int, int] | list[int] = (1024, 1024),
         pixel_size: torch.Tensor | None = None,
         binning: int = 1,
         misalignment: torch.Tensor | None = None,
-        method: Literal["histogram", "kde", "cloud-in-cell"] = "cloud-in-cell",
+        method: Literal[
+            "histogram", "kde", "binned-kde", "cloud-in-cell"
+        ] = "cloud-in-cell",
         kde_bandwidth: torch.Tensor | None = None,
+        deposition_backend: Literal["scatter", "sort"] = "scatter",
         is_blocking: bool = False,
         is_active: bool = False,
         name: str | None = None,
@@ -87,8 +106,19 @@ class Screen(Element):
         assert method in [
             "histogram",
             "kde",
+            "binned-kde",
             "cloud-in-cell",
-        ], f"Invalid method {method}. Must be 'histogram', 'kde', or 'cloud-in-cell'."
+        ], (
+            f"Invalid method {method}. Must be 'histogram', 'kde', 'binned-kde', or "
+            "'cloud-in-cell'."
+        )
+        assert deposition_backend in [
+            "scatter",
+            "sort",
+        ], (
+            f"Invalid deposition backend {deposition_backend}. Must be 'scatter' or "
+            "'sort'."
+        )
 
         self.register_buffer_or_parameter(
             "pixel_size",
@@ -114,6 +144,7 @@ class Screen(Element):
         self.resolution = resolution
         self.binning = binning
         self.method = method
+        self.deposition_backend = deposition_backend
         self.is_blocking = is_blocking
         self.is_active = is_active
 
@@ -187,31 +218,7 @@ class Screen(Element):
     def track(self, incoming: Beam) -> Beam:
         # Record the beam only when the screen is active
         if self.is_active:
-            copy_of_incoming = incoming.clone()
-
-            if isinstance(incoming, ParameterBeam):
-                broadcasted_mu, _ = torch.broadcast_tensors(
-                    copy_of_incoming.mu, self.misalignment[..., 0]
-                )
-                copy_of_incoming.mu = broadcasted_mu.clone()
-
-                copy_of_incoming.mu[..., 0] -= self.misalignment[..., 0]
-                copy_of_incoming.mu[..., 2] -= self.misalignment[..., 1]
-            elif isinstance(incoming, ParticleBeam):
-                broadcasted_particles, _ = torch.broadcast_tensors(
-                    copy_of_incoming.particles,
-                    self.misalignment[..., 0].unsqueeze(-1).unsqueeze(-1),
-                )
-                copy_of_incoming.particles = broadcasted_particles.clone()
-
-                copy_of_incoming.particles[..., 0] -= self.misalignment[
-                    ..., 0
-                ].unsqueeze(-1)
-                copy_of_incoming.particles[..., 2] -= self.misalignment[
-                    ..., 1
-                ].unsqueeze(-1)
-
-            self.set_read_beam(copy_of_incoming)
+            self.set_read_beam(self._misaligned_copy(incoming))
 
         # Block the beam only when the screen is active and blocking
         if self.is_active and self.is_blocking:
@@ -226,7 +233,11 @@ class Screen(Element):
                 )
             elif isinstance(incoming, ParticleBeam):
                 return ParticleBeam(
-                    particles=incoming.particles,
+                    particles=(
+                        incoming.phase_space
+                        if incoming.is_compact
+                        else incoming.particles
+                    ),
                     energy=incoming.energy,
                     particle_charges=incoming.particle_charges,
                     survival_probabilities=torch.zeros_like(
@@ -238,6 +249,53 @@ class Screen(Element):
         else:
             return incoming.clone()
 
+    def _misaligned_copy(self, incoming: Beam) -> Beam:
+        """
+        Copy the incoming beam into the coordinate system of the screen, i.e. with the
+        screen's misalignment subtracted from its transverse positions. The particles
+        (or the mean) are copied and shifted in a single operation, which also
+        broadcasts them to the vector shape of the misalignment.
+        """
+        zeros = torch.zeros_like(self.misalignment[..., 0])
+        offset = torch.stack(
+            [
+                self.misalignment[..., 0],
+                zeros,
+                self.misalignment[..., 1],
+                zeros,
+                zeros,
+                zeros,
+                zeros,
+            ],
+            dim=-1,
+        )
+
+        if isinstance(incoming, ParameterBeam):
+            return ParameterBeam(
+                mu=incoming.mu - offset,
+                cov=incoming.cov.clone(),
+                energy=incoming.energy.clone(),
+                total_charge=incoming.total_charge.clone(),
+                s=incoming.s.clone(),
+                species=incoming.species.clone(),
+            )
+        elif isinstance(incoming, ParticleBeam):
+            particles = (
+                incoming.phase_space if incoming.is_compact else incoming.particles
+            )
+            copy_of_incoming = ParticleBeam(
+                particles=particles - offset[..., : particles.shape[-1]].unsqueeze(-2),
+                energy=incoming.energy.clone(),
+                particle_charges=incoming.particle_charges.clone(),
+                survival_probabilities=incoming.survival_probabilities.clone(),
+                s=incoming.s.clone(),
+                species=incoming.species.clone(),
+            )
+            copy_of_incoming.num_dropped_particles = incoming.num_dropped_particles
+            return copy_of_incoming
+        else:
+            raise TypeError(f"Beam is of invalid type {type(incoming)}")
+
     @property
     def reading(self) -> torch.Tensor:
         """Image reading of the screen with shape `(..., height, width).`"""
@@ -250,13 +308,6 @@ class Screen(Element):
                 (int(self.effective_resolution[1]), int(self.effective_resolution[0]))
             )
         elif isinstance(read_beam, ParameterBeam):
-            if torch.numel(read_beam.mu[..., 0]) > 1:
-                raise NotImplementedError(
-                    "`Screen` does not support vectorization of `ParameterBeam`. "
-                    "Please use `ParticleBeam` instead. If this is a feature you would "
-                    "like to see, please open an issue on GitHub."
-                )
-
             transverse_mu = torch.stack(
                 [read_beam.mu[..., 0], read_beam.mu[..., 2]], dim=-1
             )
@@ -271,51 +322,28 @@ class Screen(Element):
                 ],
                 dim=-1,
             )
-            dist = MultivariateNormal(
-                loc=transverse_mu, covariance_matrix=transverse_cov
+            image = gaussian_histogram_2d(
+                mu=transverse_mu,
+                cov=transverse_cov,
+                bin_edges1=self.pixel_bin_edges[0],
+                bin_edges2=self.pixel_bin_edges[1],
+            ).mT
+        elif isinstance(read_beam, ParticleBeam):
+            weights = (
+                read_beam.particle_charges.abs() * read_beam.survival_probabilities
             )
-
-            left = self.extent[0]
-            right = self.extent[1]
-            hstep = self.pixel_size[0] * self.binning
-            bottom = self.extent[2]
-            top = self.extent[3]
-            vstep = self.pixel_size[1] * self.binning
-            x, y = torch.meshgrid(
-                torch.arange(left, right, hstep),
-                torch.arange(bottom, top, vstep),
-                indexing="ij",
+            broadcasted_x, broadcasted_y, broadcasted_weights = torch.broadcast_tensors(
+                read_beam.x, read_beam.y, weights
             )
-            pos = torch.dstack((x, y))
-            image = dist.log_prob(pos).exp().mT
-        elif isinstance(read_beam, ParticleBeam):
+
             if self.method == "histogram":
-                # Catch vectorisation, which is currently not supported by "histogram"
-                if (
-                    len(read_beam.particles.shape) > 2
-                    or len(read_beam.particle_charges.shape) > 1
-                    or len(read_beam.energy.shape) > 0
-                ):
-                    raise NotImplementedError(
-                        "The `'histogram'` method of `Screen` does not support "
-                        "vectorization. Use `'kde'` instead. If this is a feature you "
-                        "would like to see, please open an issue on GitHub."
-                    )
-
-                image_transposed, _ = torch.histogramdd(
-                    torch.stack((read_beam.x, read_beam.y)).mT,
-                    bins=self.pixel_bin_edges,
-                    weight=read_beam.particle_charges.abs()
-                    * read_beam.survival_probabilities,
-                )
-                image = image_transposed.mT
+                image = nearest_grid_point_charge_deposition(
+                    positions=torch.stack([broadcasted_x, broadcasted_y], dim=-1),
+                    bins=self.effective_resolution,
+                    extent=self.extent.reshape(2, 2),
+                    charges=broadcasted_weights,
+                ).mT
             elif self.method == "kde":
-                weights = (
-                    read_beam.particle_charges.abs() * read_beam.survival_probabilities
-                )
-                broadcasted_x, broadcasted_y, broadcasted_weights = (
-                    torch.broadcast_tensors(read_beam.x, read_beam.y, weights)
-                )
                 image = kde_histogram_2d(
                     x1=broadcasted_x,
                     x2=broadcasted_y,
@@ -324,18 +352,23 @@ class Screen(Element):
                     bandwidth=self.kde_bandwidth,
                     weights=broadcasted_weights,
                 ).mT
+            elif self.method == "binned-kde":
+                image = binned_kde_histogram_2d(
+                    x1=broadcasted_x,
+                    x2=broadcasted_y,
+                    bins1=self.pixel_bin_centers[0],
+                    bins2=self.pixel_bin_centers[1],
+                    bandwidth=self.kde_bandwidth,
+                    weights=broadcasted_weights,
+                    backend=self.deposition_backend,
+                ).mT
             elif self.method == "cloud-in-cell":
-                weights = (
-                    read_beam.particle_charges.abs() * read_beam.survival_probabilities
-                )
-                broadcasted_x, broadcasted_y, broadcasted_weights = (
-                    torch.broadcast_tensors(read_beam.x, read_beam.y, weights)
-                )
                 image = cloud_in_cell_charge_deposition(
                     positions=torch.stack([broadcasted_x, broadcasted_y], dim=-1),
                     bins=self.effective_resolution,
                     extent=self.extent.reshape(2, 2),
                     charges=broadcasted_weights,
+                    backend=self.deposition_backend,
                 ).mT
         else:
             raise TypeError(f"Read beam is of invalid type {type(read_beam)}")
@@ -343,13 +376,13 @@ class Screen(Element):
         self.cached_reading = image
         return image
 
-    def get_read_beam(self) -> Beam:
+    def get_read_beam(self) -> Beam | None:
         # Using these get and set methods instead of Python's property decorator to
         # prevent `nn.Module` from intercepting the read beam, which is itself an
         # `nn.Module`, and registering it as a submodule of the screen.
         return self._read_beam
 
-    def set_read_beam(self, value: Beam) -> None:
+    def set_read_beam(self, value: Beam | None) -> None:
         # Using these get and set methods instead of Python's property decorator to
         # prevent `nn.Module` from intercepting the read beam, which is itself an
         # `nn.Module`, and registering it as a submodule of the screen.
@@ -379,5 +412,6 @@ class Screen(Element):
             "misalignment",
             "method",
             "kde_bandwidth",
+            "deposition_backend",
             "is_active",
         ]
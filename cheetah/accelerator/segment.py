@@ -1,3 +1,4 @@
+import warnings
 from copy import deepcopy
 from functools import reduce
 from pathlib import Path
@@ -13,13 +14,19 @@ from cheetah.accelerator.custom_transfer_map import CustomTransferMap
 from cheetah.accelerator.drift import Drift
 from cheetah.accelerator.element import Element
 from cheetah.accelerator.marker import Marker
+from cheetah.accelerator.space_charge_kick import SpaceChargeKick
 from cheetah.converters import bmad, elegant, nxtables
-from cheetah.particles import Beam, Species
+from cheetah.particles import Beam, ParameterBeam, ParticleBeam, Species
 from cheetah.utils import (
+    LossMap,
     UniqueNameGenerator,
+    cumulative_matrix_product,
+    matrix_product,
     merge_element_names,
     squash_index_for_unavailable_dims,
 )
+from cheetah.utils.cache import build_transfer_maps_batched
+from cheetah.utils.profiler import track_profiled
 
 generate_unique_name = UniqueNameGenerator(prefix="unnamed_element")
 
@@ -38,8 +45,18 @@ class Segment(Element):
         element (e.g. control-system addresses or PVs). This information is *not* used
         in simulation and may contain any extra data the user wants to store along with
         the lattice. See :doc:`/examples/including_metadata` for more information.
-    :param device: Device on which to create the element's tensors.
-    :param dtype: Data type of the element's tensors.
+    :param cache_upstream_beams: If `True`, `track` keeps the beams at the boundaries of
+        its tracking plan and, on the next call, resumes tracking from the last boundary
+        upstream of which neither the incoming beam nor any element has changed. This
+        makes re-tracking after changing elements near the end of a long segment much
+        faster, at the cost of keeping one beam per boundary in memory. The cache is
+        neither used nor updated when tracking with `record_losses=True`.
+    :param drop_lost_particles: If `True`, `track` removes the lost particles from a
+        `ParticleBeam` whenever an element, e.g. an `Aperture`, has changed the
+        particles' survival probabilities, so that the cost of tracking through the
+        downstream elements scales with the number of surviving particles. See
+        `ParticleBeam.without_lost_particles`. Cannot be combined with tracking with
+        `record_losses=True`, which keeps all particles.
     """
 
     def __init__(
@@ -48,6 +65,8 @@ class Segment(Element):
         name: str | None = None,
         sanitize_name: bool | None = None,
         metadata: dict | None = None,
+        cache_upstream_beams: bool = False,
+        drop_lost_particles: bool = False,
     ) -> None:
         super().__init__(name=name, sanitize_name=sanitize_name, metadata=metadata)
 
@@ -70,6 +89,9 @@ class Segment(Element):
             else:
                 self.__dict__[element.name] = element
 
+        self.cache_upstream_beams = cache_upstream_beams
+        self.drop_lost_particles = drop_lost_particles
+
     @property
     def element_names(self) -> list[str]:
         """
@@ -228,6 +250,141 @@ class Segment(Element):
             elements=merged_elements, name=self.name, sanitize_name=False
         )
 
+    def with_space_charge(
+        self,
+        incoming_beam: Beam,
+        max_step: torch.Tensor,
+        grid_shape: tuple[int, int, int] = (32, 32, 32),
+        solver: Literal["3d", "2d", "2.5d"] = "3d",
+        except_for: list[str] | None = None,
+    ) -> "Segment":
+        """
+        Return a segment with space charge, where the elements are split into steps no
+        longer than `max_step` using their `split` method, and a `SpaceChargeKick` with
+        the length of the step as its effect length is inserted at the middle of every
+        step. The skippable elements between consecutive kicks are then merged into
+        elements of type `CustomTransferMap`, such that a single transfer map is applied
+        between kicks.
+
+        NOTE: Elements that cannot be split are given half a kick at their entrance and
+            half a kick at their exit instead. Kicks that end up next to each other are
+            merged into one. All kicks share the cache of the integrated Green function
+            of `SpaceChargeKick`, so it is only computed once for beams of similar
+            size.
+
+        :param incoming_beam: Beam that is incoming to the segment. NOTE: This beam is
+            needed to determine the energy of the beam when entering each element, as
+            the transfer maps of merged elements might depend on the beam energy. It is
+            not tracked through the inserted space-charge kicks.
+        :param max_step: Maximum distance between space-charge kicks in meters.
+        :param grid_shape: Number of grid points in (x, y, tau) directions of the
+            inserted space-charge kicks.
+        :param solver: Space-charge solver of the inserted space-charge kicks, see
+            `SpaceChargeKick`.
+        :param except_for: List of names of elements that should not be merged despite
+            being skippable. Usually these are the elements that are changed from one
+            tracking to another. They are still split.
+        :return: Segment with space-charge kicks.
+        """
+        if except_for is None:
+            except_for = []
+
+        # Split the elements and insert kicks, keeping track of which elements may be
+        # merged
+        sliced_elements = []
+        for element in self.flattened().elements:
+            is_mergeable = element.is_skippable and element.name not in except_for
+            if (element.length == 0.0).all():
+                sliced_elements.append((element, is_mergeable))
+                continue
+
+            for piece in element.split(max_step):
+                halves = piece.split(piece.length.abs().max() / 2)
+                if len(halves) == 2:
+                    sliced_elements += [
+                        (halves[0], is_mergeable),
+                        (
+                            SpaceChargeKick(
+                                piece.length,
+                                grid_shape=grid_shape,
+                                solver=solver,
+                                name=f"{piece.name}_space_charge",
+                                sanitize_name=False,
+                            ),
+                            False,
+                        ),
+                        (halves[1], is_mergeable),
+                    ]
+                else:
+                    sliced_elements += [
+                        (
+                            SpaceChargeKick(
+                                piece.length / 2,
+                                grid_shape=grid_shape,
+                                solver=solver,
+                                name=f"{piece.name}_space_charge_entrance",
+                                sanitize_name=False,
+                            ),
+                            False,
+                        ),
+                        (piece, is_mergeable),
+                        (
+                            SpaceChargeKick(
+                                piece.length / 2,
+                                grid_shape=grid_shape,
+                                solver=solver,
+                                name=f"{piece.name}_space_charge_exit",
+                                sanitize_name=False,
+                            ),
+                            False,
+                        ),
+                    ]
+
+        # Merge adjacent kicks and runs of mergeable elements between kicks
+        new_elements = []
+        mergeable_elements = []
+        tracked_beam = incoming_beam
+        for element, is_mergeable in sliced_elements + [(None, False)]:
+            if is_mergeable:
+                mergeable_elements.append(element)
+                continue
+
+            if len(mergeable_elements) == 1:
+                new_elements.append(mergeable_elements[0])
+            elif len(mergeable_elements) > 1:
+                new_elements.append(
+                    CustomTransferMap.from_merging_elements(
+                        mergeable_elements, incoming_beam=tracked_beam
+                    )
+                )
+            mergeable_elements = []
+
+            if element is None:
+                break
+            elif isinstance(element, SpaceChargeKick):
+                if len(new_elements) > 0 and isinstance(
+                    new_elements[-1], SpaceChargeKick
+                ):
+                    new_elements[-1] = SpaceChargeKick(
+                        new_elements[-1].effect_length + element.effect_length,
+                        grid_shape=grid_shape,
+                        solver=solver,
+                        name=merge_element_names(
+                            new_elements[-1].name, element.name, use_shared_prefix=False
+                        ),
+                        sanitize_name=False,
+                    )
+                else:
+                    new_elements.append(element)
+            else:
+                # Only elements that cannot be merged may change the beam energy
+                tracked_beam = element.track(tracked_beam)
+                new_elements.append(element)
+
+        return self.__class__(
+            elements=new_elements, name=self.name, sanitize_name=False
+        )
+
     def without_inactive_markers(
         self, except_for: list[str] | None = None
     ) -> "Segment":
@@ -535,16 +692,298 @@ class Segment(Element):
         self, energy: torch.Tensor, species: Species
     ) -> torch.Tensor:
         if self.is_skippable:
-            tm = torch.eye(7, device=energy.device, dtype=energy.dtype)
-            for element in self.elements:
-                tm = element.first_order_transfer_map(energy, species) @ tm
-            return tm
+            return matrix_product(
+                self._stacked_first_order_transfer_maps(energy, species)
+            )
         else:
             return None
 
-    def track(self, incoming: Beam) -> Beam:
+    def cumulative_first_order_transfer_maps(
+        self, energy: torch.Tensor, species: Species
+    ) -> torch.Tensor | None:
+        """
+        Compute the first-order transfer maps from the start of the segment to the end
+        of each of its elements. All cumulative maps are computed at once using a
+        parallel prefix scan, i.e. with a number of batched matrix multiplications that
+        only grows logarithmically with the number of elements.
+
+        NOTE: Like `first_order_transfer_map`, this is only possible if the segment is
+            skippable. Otherwise, `None` is returned.
+
+        :param energy: Reference energy of the incoming beam.
+        :param species: Species of the particles in the incoming beam.
+        :return: Tensor of shape `(..., num_elements, 7, 7)`, where the `i`-th map
+            transforms the beam from the start of the segment to the end of the `i`-th
+            element.
+        """
         if self.is_skippable:
-            return super()._track_first_order(incoming)
+            return cumulative_matrix_product(
+                self._stacked_first_order_transfer_maps(energy, species)
+            )
+        else:
+            return None
+
+    def precompute_first_order_transfer_maps(
+        self, energy: torch.Tensor, species: Species
+    ) -> None:
+        """
+        Build the first-order transfer maps of all elements in the segment (including
+        nested segments) and store them in the elements' transfer map caches. Elements
+        of the same type are grouped, so that their maps are computed with a single
+        batched call of the map kernel per group instead of one call per element. This
+        speeds up rebuilding the transfer maps after changing the settings of many
+        elements at once, e.g. before tracking or computing the segment's transfer map.
+
+        NOTE: Elements whose transfer maps are still cached for the passed energy and
+            species are skipped. Transfer maps are only cached if neither the energy nor
+            the species require gradients, so in that case this method does nothing.
+
+        :param energy: Reference energy of the incoming beam.
+        :param species: Species of the particles in the incoming beam.
+        """
+        build_transfer_maps_batched(
+            self.flattened().elements, "first_order_transfer_map", energy, species
+        )
+
+    def _stacked_first_order_transfer_maps(
+        self, energy: torch.Tensor, species: Species
+    ) -> torch.Tensor:
+        """
+        Stack the first-order transfer maps of all elements along the third to last
+        dimension, broadcasting their vector dimensions.
+        """
+        if len(self.elements) == 0:
+            return energy.new_zeros((*energy.shape, 0, 7, 7))
+
+        transfer_maps = [
+            element.first_order_transfer_map(energy, species)
+            for element in self.elements
+        ]
+        return torch.stack(torch.broadcast_tensors(*transfer_maps), dim=-3)
+
+    def track(
+        self, incoming: Beam, record_losses: bool = False
+    ) -> Beam | tuple[ParticleBeam, LossMap]:
+        """
+        Track a beam through the segment.
+
+        :param incoming: Beam entering the segment.
+        :param record_losses: If `True`, additionally record where the particles of an
+            incoming `ParticleBeam` are lost along the segment, in the same tracking
+            pass. See `LossMap`. All particles are kept, so this raises a `ValueError`
+            if `drop_lost_particles` is `True`, and tracks through the full segment
+            with a warning if `cache_upstream_beams` is `True`.
+        :return: Beam exiting the segment, or a tuple of the beam exiting the segment
+            and the `LossMap` of the particles if `record_losses` is `True`.
+        """
+        if record_losses:
+            if self.drop_lost_particles:
+                raise ValueError(
+                    "Recording losses keeps all particles and cannot be combined with "
+                    "`drop_lost_particles=True`."
+                )
+            if self.cache_upstream_beams:
+                warnings.warn(
+                    "Recording losses tracks through the full segment. The upstream "
+                    "beam cache is neither used nor updated.",
+                    stacklevel=2,
+                )
+            return self._track_recording_losses(incoming)
+
+        todos = self.tracking_plan()
+
+        if len(todos) == 1 and todos[0] is self:
+            # A segment of a single element is profiled as that element
+            return track_profiled(
+                self.elements[0] if len(self.elements) == 1 else self,
+                super()._track_first_order,
+                incoming,
+            )
+        elif self.cache_upstream_beams:
+            return self._track_with_upstream_beam_cache(incoming, todos)
+        else:
+            self.__dict__.pop("_upstream_beam_cache", None)
+
+            for todo in todos:
+                incoming = self._track_todo(todo, incoming)
+
+            return incoming
+
+    def _track_todo(self, todo: Element, incoming: Beam) -> Beam:
+        """
+        Track a beam through one step of the tracking plan. Subsegments record
+        themselves when profiling, so only other elements are recorded here.
+        """
+        if isinstance(todo, Segment):
+            outgoing = todo.track(incoming)
+        else:
+            outgoing = track_profiled(todo, todo.track, incoming)
+
+        if (
+            self.drop_lost_particles
+            and isinstance(outgoing, ParticleBeam)
+            and outgoing is not incoming
+        ):
+            outgoing.num_dropped_particles = incoming.num_dropped_particles
+            if outgoing.survival_probabilities is not incoming.survival_probabilities:
+                outgoing = outgoing.without_lost_particles()
+
+        return outgoing
+
+    def _track_recording_losses(
+        self, incoming: ParticleBeam
+    ) -> tuple[ParticleBeam, LossMap]:
+        """
+        Track a `ParticleBeam` through the flattened segment, recording for every
+        particle the first element at which its survival probability drops and the
+        position at the end of that element, and the number of macroparticles lost at
+        every element.
+
+        Losses are detected after every step of the tracking plan whose outgoing
+        survival probabilities are not those of its incoming beam, so that any element
+        changing the survival probabilities is recorded, not just `Aperture`s. Runs of
+        skippable elements cannot lose particles and are passed at no extra cost.
+        """
+        assert isinstance(
+            incoming, ParticleBeam
+        ), "Recording losses is currently only supported for `ParticleBeam`."
+
+        # NOTE: The flattened segment is cached like the tracking plan, so that its own
+        # tracking plan is reused across calls. It is written to `__dict__` directly, so
+        # that it is not registered as a submodule of this segment.
+        flattened_key = self._flattened_key()
+        if flattened_key != self.__dict__.get("_flattened_segment_key"):
+            self.__dict__["_flattened_segment"] = self.flattened()
+            self.__dict__["_flattened_segment_key"] = flattened_key
+        flattened = self.__dict__["_flattened_segment"]
+
+        element_indices = torch.full_like(
+            incoming.survival_probabilities, -1, dtype=torch.long
+        )
+        loss_s = torch.full_like(incoming.survival_probabilities, float("nan"))
+        num_lost_per_element = [
+            torch.zeros_like(incoming.survival_probabilities[..., 0])
+            for _ in flattened.elements
+        ]
+
+        beam = incoming
+        num_elements_passed = 0
+        for todo in flattened.tracking_plan():
+            outgoing = flattened._track_todo(todo, beam)
+            num_elements_passed += (
+                len(todo.elements) if isinstance(todo, Segment) else 1
+            )
+
+            if outgoing.survival_probabilities is not beam.survival_probabilities:
+                # Losses in a run of elements are attributed to its last element
+                element_index = num_elements_passed - 1
+                survival_drop = (
+                    beam.survival_probabilities - outgoing.survival_probabilities
+                ).clamp(min=0.0)
+                is_newly_lost = (survival_drop > 0) & (element_indices < 0)
+
+                element_indices = torch.where(
+                    is_newly_lost, element_index, element_indices
+                )
+                loss_s = torch.where(is_newly_lost, outgoing.s.unsqueeze(-1), loss_s)
+                num_lost_per_element[element_index] = survival_drop.sum(dim=-1)
+
+            beam = outgoing
+
+        loss_map = LossMap(
+            element_names=flattened.element_names,
+            element_indices=element_indices,
+            s=loss_s,
+            num_lost_per_element=torch.stack(
+                torch.broadcast_tensors(*num_lost_per_element), dim=-1
+            ),
+        )
+
+        return beam, loss_map
+
+    def _flattened_key(self) -> tuple:
+        """
+        Identity of the elements that `flattened` resolves the segment to, computed
+        without building the flattened segment.
+        """
+        return tuple(
+            element._flattened_key() if isinstance(element, Segment) else id(element)
+            for element in self.elements
+        )
+
+    def _track_with_upstream_beam_cache(
+        self, incoming: Beam, todos: list[Element]
+    ) -> Beam:
+        """
+        Track through the tracking plan, resuming from the beam cached at the last
+        boundary of the plan upstream of which neither the incoming beam nor any of the
+        elements have changed since the previous call.
+
+        Changes are detected with the same validity keys that are used to cache transfer
+        maps, i.e. by the identity and version of the elements' defining tensors. Beams
+        that require gradients are not cached, so that the autograd graph is never
+        reused across calls.
+        """
+        todo_keys = [_upstream_validity_key(todo) for todo in todos]
+        incoming_key = _beam_validity_key(incoming)
+
+        cache = self.__dict__.get("_upstream_beam_cache")
+        if (
+            cache is None
+            or cache["todos"] is not todos
+            or cache["incoming"] is not incoming
+            or cache["incoming_key"] != incoming_key
+        ):
+            cache = {
+                "todos": todos,
+                "incoming": incoming,
+                "incoming_key": incoming_key,
+                "boundaries": [],
+            }
+            # NOTE: The cache is written to `__dict__` directly, so that the beams it
+            # holds are not registered as submodules of this segment.
+            self.__dict__["_upstream_beam_cache"] = cache
+
+        # Find the last boundary up to which nothing has changed
+        num_unchanged = 0
+        for (cached_key, _), todo_key in zip(cache["boundaries"], todo_keys):
+            if cached_key != todo_key:
+                break
+            num_unchanged += 1
+        del cache["boundaries"][num_unchanged:]
+
+        beam = cache["boundaries"][-1][1] if num_unchanged > 0 else incoming
+        is_caching = not _beam_requires_grad(beam)
+        for todo, todo_key in zip(todos[num_unchanged:], todo_keys[num_unchanged:]):
+            beam = self._track_todo(todo, beam)
+
+            is_caching = is_caching and not _beam_requires_grad(beam)
+            if is_caching:
+                cache["boundaries"].append((todo_key, beam))
+
+        return beam
+
+    def tracking_plan(self) -> list[Element]:
+        """
+        Return the sequence of elements that `track` steps through, where runs of
+        consecutive skippable elements are grouped into subsegments so that their
+        transfer maps can be combined.
+
+        The plan is compiled once and cached. It is only rebuilt when the elements of
+        the segment or their skippability (e.g. because their `tracking_method` was
+        changed) differ from when the plan was last compiled.
+
+        :return: List of elements and subsegments to track through in order. If the
+            entire segment is skippable, the list contains only the segment itself.
+        """
+        plan_key = tuple(
+            (id(element), element.is_skippable) for element in self.elements
+        )
+        if plan_key == self.__dict__.get("_tracking_plan_key"):
+            return self.__dict__["_tracking_plan"]
+
+        if all(is_skippable for _, is_skippable in plan_key):
+            todos = [self]
         else:
             todos = []
             continuous_skippable_elements = []
@@ -556,9 +995,7 @@ class Segment(Element):
                     # If a non-skippable element is found, merge the skippable elements
                     # and append them before the non-skippable element
                     if len(continuous_skippable_elements) > 0:
-                        todos.append(
-                            self.__class__(elements=continuous_skippable_elements)
-                        )
+                        todos.append(self._merged_run(continuous_skippable_elements))
                         continuous_skippable_elements = []
 
                     todos.append(element)
@@ -566,12 +1003,26 @@ class Segment(Element):
             # If there are still skippable elements at the end of the segment append
             # them as well
             if len(continuous_skippable_elements) > 0:
-                todos.append(self.__class__(elements=continuous_skippable_elements))
+                todos.append(self._merged_run(continuous_skippable_elements))
 
-            for todo in todos:
-                incoming = todo.track(incoming)
+        # NOTE: The plan is written to `__dict__` directly, so that the subsegments it
+        # holds are not registered as submodules of this segment.
+        self.__dict__["_tracking_plan"] = todos
+        self.__dict__["_tracking_plan_key"] = plan_key
 
-            return incoming
+        return todos
+
+    def _merged_run(self, elements: list[Element]) -> "Segment":
+        """
+        Create the subsegment for a run of consecutive skippable elements in the
+        tracking plan, named after the first and last element of the run.
+        """
+        name = (
+            elements[0].name
+            if len(elements) == 1
+            else f"{elements[0].name}...{elements[-1].name}"
+        )
+        return self.__class__(elements=elements, name=name, sanitize_name=False)
 
     def clone(self) -> "Segment":
         return self.__class__(
@@ -579,6 +1030,8 @@ class Segment(Element):
             name=self.name,
             metadata=deepcopy(self.metadata),
             sanitize_name=False,
+            cache_upstream_beams=self.cache_upstream_beams,
+            drop_lost_particles=self.drop_lost_particles,
         )
 
     def split(self, resolution: torch.Tensor) -> list[Element]:
@@ -677,6 +1130,28 @@ class Segment(Element):
         """
         attr_name_tuple = attr_names if isinstance(attr_names, tuple) else (attr_names,)
 
+        # Linear optics of a `ParameterBeam` through a skippable segment can be computed
+        # for all positions at once from the cumulative transfer maps
+        if isinstance(incoming, ParameterBeam) and self.is_skippable:
+            segment = (
+                self
+                if resolution is None
+                else self.__class__(
+                    elements=self.split(resolution),
+                    name=f"{self.name}_split",
+                    sanitize_name=False,
+                )
+            )
+            beams_along_segment = segment._parameter_beams_along_segment(incoming)
+            broadcasted_results = tuple(
+                getattr(beams_along_segment, attr_name) for attr_name in attr_name_tuple
+            )
+            return (
+                broadcasted_results
+                if isinstance(attr_names, tuple)
+                else broadcasted_results[0]
+            )
+
         results = zip(
             *(
                 tuple(getattr(beam, attr_name) for attr_name in attr_name_tuple)
@@ -699,6 +1174,55 @@ class Segment(Element):
             else broadcasted_results[0]
         )
 
+    def _parameter_beams_along_segment(self, incoming: ParameterBeam) -> ParameterBeam:
+        """
+        Compute the `ParameterBeam`s at the start of the segment and at the end of each
+        of its elements from the cumulative transfer maps of a skippable segment. The
+        positions along the segment are stacked along the last vector dimension of the
+        returned beam.
+
+        :param incoming: Beam that is entering the segment from upstream.
+        :return: Beam with an additional vector dimension of size `num_elements + 1`.
+        """
+        cumulative_tms = self.cumulative_first_order_transfer_maps(
+            incoming.energy, incoming.species
+        )
+        identity = torch.eye(
+            7, device=cumulative_tms.device, dtype=cumulative_tms.dtype
+        ).expand(*cumulative_tms.shape[:-3], 1, 7, 7)
+        tms = torch.cat((identity, cumulative_tms), dim=-3)
+
+        num_positions = tms.shape[-3]
+
+        mu = (tms @ incoming.mu.unsqueeze(-2).unsqueeze(-1)).squeeze(-1)
+        cov = tms @ incoming.cov.unsqueeze(-3) @ tms.mT
+
+        element_lengths = [element.length for element in self.elements]
+        stacked_element_lengths = torch.stack(
+            torch.broadcast_tensors(*element_lengths), dim=-1
+        )
+        element_end_s_positions = torch.cumsum(stacked_element_lengths, dim=-1)
+        s = incoming.s.unsqueeze(-1) + torch.cat(
+            (
+                torch.zeros_like(element_end_s_positions[..., :1]),
+                element_end_s_positions,
+            ),
+            dim=-1,
+        )
+
+        return ParameterBeam(
+            mu=mu,
+            cov=cov,
+            energy=incoming.energy.unsqueeze(-1).expand(
+                *incoming.energy.shape, num_positions
+            ),
+            total_charge=incoming.total_charge.unsqueeze(-1).expand(
+                *incoming.total_charge.shape, num_positions
+            ),
+            s=s,
+            species=incoming.species,
+        )
+
     def set_attrs_on_every_element(
         self,
         filter_type: type[Element] | tuple[type[Element]] | None = None,
@@ -1080,3 +1604,38 @@ class Segment(Element):
             f"{self.__class__.__name__}(elements={elements_repr}, "
             + f"name={repr(self.name)})"
         )
+
+
+def _upstream_validity_key(element: Element) -> tuple:
+    """
+    Build a key to check if an element or any of the elements nested in it have
+    changed, based on the identity and version of their defining tensors.
+    """
+    key = (id(element), element.defining_features_version)
+    for feature_name in element._frozen_defining_features[0]:
+        feature = getattr(element, feature_name)
+        if isinstance(feature, Element):
+            key += (_upstream_validity_key(feature),)
+        elif isinstance(feature, nn.ModuleList):
+            key += tuple(_upstream_validity_key(sub_element) for sub_element in feature)
+        elif isinstance(feature, torch.Tensor):
+            key += (id(feature), feature._version, feature.requires_grad)
+        else:
+            key += (feature,)
+    return key
+
+
+def _beam_validity_key(beam: Beam) -> tuple:
+    """
+    Build a key to check if any of the tensors of a beam (including those of its
+    species) have been replaced or modified in place.
+    """
+    return tuple(
+        (id(tensor), tensor._version)
+        for tensor in (*beam.parameters(), *beam.buffers())
+    )
+
+
+def _beam_requires_grad(beam: Beam) -> bool:
+    """Check if any of the tensors of a beam require gradients."""
+    return any(tensor.requires_grad for tensor in (*beam.parameters(), *beam.buffers()))
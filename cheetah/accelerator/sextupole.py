@@ -42,6 +42,10 @@ class Sextupole(Element):
     :param dtype: Data type of the element's tensors.
     """
 
+    UNVECTORIZED_NUM_ATTR_DIMS = Element.UNVECTORIZED_NUM_ATTR_DIMS | {
+        "misalignment": 1
+    }
+
     supported_tracking_methods = ["linear", "second_order"]
 
     def __init__(
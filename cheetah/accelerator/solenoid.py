@@ -39,6 +39,10 @@ class Solenoid(Element):
     :param dtype: Data type of the element's tensors.
     """
 
+    UNVECTORIZED_NUM_ATTR_DIMS = Element.UNVECTORIZED_NUM_ATTR_DIMS | {
+        "misalignment": 1
+    }
+
     supported_tracking_methods = ["linear"]
 
     def __init__(
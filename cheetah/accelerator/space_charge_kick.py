@@ -1,10 +1,21 @@
+import math
+from collections import OrderedDict
+from typing import Literal
+
 import matplotlib.pyplot as plt
 import torch
 from scipy.constants import elementary_charge, epsilon_0, speed_of_light
 
 from cheetah.accelerator.element import Element
 from cheetah.particles import ParticleBeam
-from cheetah.utils.cloud_in_cell import cloud_in_cell_charge_deposition
+from cheetah.utils.cloud_in_cell import CloudInCellStencil
+
+# Maximum number of Fourier transformed integrated Green functions kept in the cache
+# shared by all space-charge kicks
+_green_function_cache_capacity = 16
+# Fourier transformed integrated Green functions in least recently used order, keyed
+# by grid shape, dtype, device, cell size resolution and quantised cell size
+_green_function_cache = OrderedDict()
 
 
 class SpaceChargeKick(Element):
@@ -30,14 +41,39 @@ class SpaceChargeKick(Element):
      - Compute the corresponding electromagnetic fields and Lorentz force on the grid.
      - Interpolate the Lorentz force to the particles and update their momentum.
 
+    For long bunches and coasting beams, the full 3D solver can be replaced by a
+    transverse-only solver, which computes the transverse fields per unit line density
+    with a 2D Hockney convolution of the transverse charge distribution. With
+    `solver="2d"`, the beam is assumed to be longitudinally uniform over
+    `sqrt(12) * sigma_z`, while with `solver="2.5d"` the kick of every particle is
+    scaled by the local line density, which is deposited on a 1D longitudinal grid.
+    Both neglect the longitudinal space-charge force.
+
     :param effect_length: Length over which the effect is applied in meters.
-    :param grid_shape: Number of grid points in (x, y, tau) directions.
+    :param grid_shape: Number of grid points in (x, y, tau) directions. The 2D solver
+        only uses the number of grid points in x and y, and the 2.5D solver uses the
+        number of grid points in tau for the line density.
     :param grid_extent_x: Dimensions of the grid on which to compute space-charge, as
         multiples of sigma of the beam in the x direction (dimensionless).
     :param grid_extent_y: Dimensions of the grid on which to compute space-charge, as
         multiples of sigma of the beam in the y direction (dimensionless).
     :param grid_extent_tau: Dimensions of the grid on which to compute space-charge, as
         multiples of sigma of the beam in the tau direction (dimensionless).
+    :param solver: Space-charge solver to use. `"3d"` solves the full 3D Poisson
+        equation, while `"2d"` and `"2.5d"` only compute the transverse fields of a
+        longitudinally uniform beam or of a beam with the local line density,
+        respectively.
+    :param deposition_backend: Backend of the cloud-in-cell charge deposition, either
+        `"scatter"` (default) or `"sort"`. The `"sort"` backend is slower, but makes the
+        kick bitwise reproducible. See `CloudInCellStencil`.
+    :param cell_size_resolution: If set, the cell sizes of the grid are rounded up to
+        the next power of `1 + cell_size_resolution`, such that the Fourier transform of
+        the integrated Green function only needs to be computed for a discrete set of
+        cell sizes. It is then kept in a least recently used cache shared by all
+        `SpaceChargeKick`s, so that consecutive kicks on beams of similar size reuse it.
+        This changes the results by up to the relative resolution, and gradients do not
+        flow through the rounded cell sizes. If `None` (default), the exact cell sizes
+        are used and the integrated Green function is computed on every kick.
     :param name: Unique identifier of the element.
     :param sanitize_name: Whether to sanitise the name to be a valid Python variable
         name. This is needed if you want to use the `segment.element_name` syntax to
@@ -59,6 +95,9 @@ class SpaceChargeKick(Element):
         grid_extent_x: torch.Tensor | None = None,
         grid_extent_y: torch.Tensor | None = None,
         grid_extent_tau: torch.Tensor | None = None,
+        solver: Literal["3d", "2d", "2.5d"] = "3d",
+        deposition_backend: Literal["scatter", "sort"] = "scatter",
+        cell_size_resolution: float | None = None,
         name: str | None = None,
         sanitize_name: bool | None = None,
         metadata: dict | None = None,
@@ -71,7 +110,23 @@ class SpaceChargeKick(Element):
             name=name, sanitize_name=sanitize_name, metadata=metadata, **factory_kwargs
         )
 
+        assert solver in [
+            "3d",
+            "2d",
+            "2.5d",
+        ], f"Invalid solver {solver}. Must be '3d', '2d', or '2.5d'."
+        assert deposition_backend in [
+            "scatter",
+            "sort",
+        ], (
+            f"Invalid deposition backend {deposition_backend}. Must be 'scatter' or "
+            "'sort'."
+        )
+
         self.grid_shape = grid_shape
+        self.solver = solver
+        self.deposition_backend = deposition_backend
+        self.cell_size_resolution = cell_size_resolution
 
         self.register_buffer_or_parameter("effect_length", effect_length)
         # In multiples of sigma
@@ -122,22 +177,32 @@ class SpaceChargeKick(Element):
         )
         return integrated_potential
 
+    def _integrated_transverse_potential(
+        self, x: torch.Tensor, y: torch.Tensor
+    ) -> torch.Tensor:
+        """
+        Computes the antiderivative in x and y of `ln(x^2 + y^2)`, the Green function of
+        the 2D Poisson equation up to a factor, which is odd in both coordinates.
+        """
+        return (
+            x * y * (x.square() + y.square()).log()
+            - 3 * x * y
+            + x.square() * (y / x).atan()
+            + y.square() * (x / y).atan()
+        )
+
     def _array_rho(
         self,
         beam: ParticleBeam,
-        xp_coordinates: torch.Tensor,
+        stencil: CloudInCellStencil,
         cell_size: torch.Tensor,
-        grid_dimensions: torch.Tensor,
     ) -> torch.Tensor:
         """
         Allocates a 2x larger array in all dimensions (to perform Hockney's method), and
         copies the charge density in one of the "quadrants".
         """
-        charge_grid = cloud_in_cell_charge_deposition(
-            positions=xp_coordinates[..., [0, 2, 4]],
-            bins=self.grid_shape,
-            extent=torch.stack([-grid_dimensions, grid_dimensions], dim=-1),
-            charges=beam.particle_charges * beam.survival_probabilities,
+        charge_grid = stencil.deposit(
+            beam.particle_charges * beam.survival_probabilities
         )
 
         # Normalise by the cell volume to get density
@@ -146,8 +211,8 @@ class SpaceChargeKick(Element):
 
         # Create a new tensor with the doubled dimensions, filled with zeros
         new_dims = tuple(2 * dim for dim in self.grid_shape)
-        new_charge_density = beam.particles.new_zeros(
-            beam.particles.shape[:-2] + new_dims
+        new_charge_density = beam.phase_space.new_zeros(
+            beam.phase_space.shape[:-2] + new_dims
         )
 
         # Copy the original charge_density values to the beginning of the new tensor
@@ -161,152 +226,200 @@ class SpaceChargeKick(Element):
         return new_charge_density
 
     def _integrated_green_function(
-        self, beam: ParticleBeam, cell_size: torch.Tensor
+        self, scaled_cell_size: torch.Tensor
     ) -> torch.Tensor:
         """
         Computes the Integrated Green Function (IGF) in the 2x larger array, as needed
-        for the Hockney method.
+        for the Hockney method, for cells of size `scaled_cell_size` of shape `(..., 3)`
+        in x, y and gamma-scaled tau, or of shape `(..., 2)` in x and y for the
+        transverse Green function of the 2D solvers.
+
+        The IGF of a cell is the difference of the integrated potential between the
+        cell's corners. The integrated potential is therefore evaluated only once on the
+        corners of all cells with non-negative coordinates, and extended to the corners
+        at negative coordinates using that it is odd in every coordinate. The IGF is
+        then even in every coordinate, which is used to mirror it into the other
+        quadrants or octants of the 2x larger array.
         """
-        dx, dy, dtau = (
-            cell_size[..., 0],
-            cell_size[..., 1],
-            cell_size[..., 2] * beam.relativistic_gamma,
-            # The longitudinal dimension is scaled by gamma, since we are solving a
-            # modified Poisson equation in the lab frame (see docstring of the class)
-        )
-        num_grid_points_x, num_grid_points_y, num_grid_points_tau = self.grid_shape
-
-        # Create coordinate grids
-        x = torch.arange(num_grid_points_x, device=beam.particles.device)
-        y = torch.arange(num_grid_points_y, device=beam.particles.device)
-        tau = torch.arange(num_grid_points_tau, device=beam.particles.device)
-        ix_grid, iy_grid, itau_grid = torch.meshgrid(x, y, tau, indexing="ij")
-        x_grid = (
-            ix_grid[None, :, :, :] * dx[..., None, None, None]
-        )  # Shape: [..., nx, ny, nz]
-        y_grid = (
-            iy_grid[None, :, :, :] * dy[..., None, None, None]
-        )  # Shape: [..., nx, ny, nz]
-        tau_grid = (
-            itau_grid[None, :, :, :] * dtau[..., None, None, None]
-        )  # Shape: [..., nx, ny, nz]
-
-        # Compute the Green's function values
-        G_values = (
-            self._integrated_potential(
-                x_grid + 0.5 * dx[..., None, None, None],
-                y_grid + 0.5 * dy[..., None, None, None],
-                tau_grid + 0.5 * dtau[..., None, None, None],
-            )
-            - self._integrated_potential(
-                x_grid - 0.5 * dx[..., None, None, None],
-                y_grid + 0.5 * dy[..., None, None, None],
-                tau_grid + 0.5 * dtau[..., None, None, None],
+        num_dims = scaled_cell_size.shape[-1]
+        dims = tuple(range(-num_dims, 0))
+
+        # Corners at (i - 1/2) * cell size for i = 1, ..., n, the ones at -1/2 cell size
+        # follow from the symmetry of the integrated potential
+        corners = [
+            (
+                (
+                    torch.arange(
+                        1,
+                        num_grid_points + 1,
+                        device=scaled_cell_size.device,
+                        dtype=scaled_cell_size.dtype,
+                    )
+                    - 0.5
+                )
+                * scaled_cell_size[..., i, None]
+            ).reshape(
+                *scaled_cell_size.shape[:-1],
+                *(num_grid_points if j == i else 1 for j in range(num_dims)),
             )
-            - self._integrated_potential(
-                x_grid + 0.5 * dx[..., None, None, None],
-                y_grid - 0.5 * dy[..., None, None, None],
-                tau_grid + 0.5 * dtau[..., None, None, None],
+            for i, num_grid_points in enumerate(self.grid_shape[:num_dims])
+        ]
+        integrated_potential = (
+            self._integrated_potential(*corners)
+            if num_dims == 3
+            else self._integrated_transverse_potential(*corners)
+        )
+        for dim in dims:
+            integrated_potential = torch.cat(
+                [-integrated_potential.narrow(dim, 0, 1), integrated_potential],
+                dim=dim,
             )
-            - self._integrated_potential(
-                x_grid + 0.5 * dx[..., None, None, None],
-                y_grid + 0.5 * dy[..., None, None, None],
-                tau_grid - 0.5 * dtau[..., None, None, None],
+
+        # Sum over the corners of every cell with alternating signs
+        green_func_values = integrated_potential
+        for dim in dims:
+            green_func_values = green_func_values.diff(dim=dim)
+
+        # Fill the grid with double dimensions with the IGF and its mirror images,
+        # leaving the middle plane of each dimension empty
+        for dim in dims:
+            num_grid_points = green_func_values.shape[dim]
+            green_func_values = torch.cat(
+                [
+                    green_func_values,
+                    torch.zeros_like(green_func_values.narrow(dim, 0, 1)),
+                    green_func_values.narrow(dim, 1, num_grid_points - 1).flip(dim),
+                ],
+                dim=dim,
             )
-            + self._integrated_potential(
-                x_grid + 0.5 * dx[..., None, None, None],
-                y_grid - 0.5 * dy[..., None, None, None],
-                tau_grid - 0.5 * dtau[..., None, None, None],
+
+        return green_func_values
+
+    def _integrated_green_function_ft(
+        self, scaled_cell_size: torch.Tensor
+    ) -> torch.Tensor:
+        """
+        Gets the Fourier transform of the IGF in the 2x larger array for the (for the 3D
+        solver gamma-scaled) cell sizes returned by `_cell_size`. If the cell sizes are
+        quantised, it is taken from the cache shared by all space-charge kicks where
+        possible. `scaled_cell_size` needs to have a single flattened vector dimension.
+        """
+        num_dims = scaled_cell_size.shape[-1]
+        if self.cell_size_resolution is None:
+            return torch.fft.rfftn(
+                self._integrated_green_function(scaled_cell_size),
+                dim=list(range(-num_dims, 0)),
             )
-            + self._integrated_potential(
-                x_grid - 0.5 * dx[..., None, None, None],
-                y_grid + 0.5 * dy[..., None, None, None],
-                tau_grid - 0.5 * dtau[..., None, None, None],
+
+        levels = (
+            (scaled_cell_size.detach().log() / math.log1p(self.cell_size_resolution))
+            .round()
+            .to(torch.int64)
+            .tolist()
+        )
+        keys = [
+            (
+                self.grid_shape[:num_dims],
+                scaled_cell_size.dtype,
+                scaled_cell_size.device,
+                self.cell_size_resolution,
+                tuple(level),
             )
-            + self._integrated_potential(
-                x_grid - 0.5 * dx[..., None, None, None],
-                y_grid - 0.5 * dy[..., None, None, None],
-                tau_grid + 0.5 * dtau[..., None, None, None],
+            for level in levels
+        ]
+
+        green_functions_ft = {}
+        for key in dict.fromkeys(keys):
+            if key in _green_function_cache:
+                green_functions_ft[key] = _green_function_cache[key]
+                _green_function_cache.move_to_end(key)
+
+        missing_keys = [
+            key for key in dict.fromkeys(keys) if key not in green_functions_ft
+        ]
+        if len(missing_keys) > 0:
+            missing_scaled_cell_size = (
+                torch.tensor(
+                    [key[-1] for key in missing_keys],
+                    device=scaled_cell_size.device,
+                    dtype=scaled_cell_size.dtype,
+                )
+                * math.log1p(self.cell_size_resolution)
+            ).exp()
+            missing_green_functions_ft = torch.fft.rfftn(
+                self._integrated_green_function(missing_scaled_cell_size),
+                dim=list(range(-num_dims, 0)),
             )
-            - self._integrated_potential(
-                x_grid - 0.5 * dx[..., None, None, None],
-                y_grid - 0.5 * dy[..., None, None, None],
-                tau_grid - 0.5 * dtau[..., None, None, None],
+            for key, value in zip(missing_keys, missing_green_functions_ft):
+                green_functions_ft[key] = value
+                _green_function_cache[key] = value
+            while len(_green_function_cache) > _green_function_cache_capacity:
+                _green_function_cache.popitem(last=False)
+
+        if len(green_functions_ft) == 1:
+            # Broadcast over the vector dimension instead of copying
+            return next(iter(green_functions_ft.values())).unsqueeze(0)
+        return torch.stack([green_functions_ft[key] for key in keys])
+
+    def _cell_size(
+        self, beam: ParticleBeam, grid_dimensions: torch.Tensor
+    ) -> torch.Tensor:
+        """
+        Computes the size of the grid cells, such that the grid spans `grid_dimensions`
+        in every direction. If `cell_size_resolution` is set, the cell sizes in x, y and
+        gamma-scaled tau are rounded up to the next power of `1 + cell_size_resolution`,
+        so that the IGF can be reused from the cache for beams of similar size, and the
+        grid spans at least `grid_dimensions`. `beam` needs to have a flattened vector
+        shape.
+        """
+        cell_size = (
+            2
+            * grid_dimensions
+            / torch.tensor(
+                self.grid_shape,
+                device=grid_dimensions.device,
+                dtype=grid_dimensions.dtype,
             )
         )
+        if self.cell_size_resolution is None:
+            return cell_size
 
-        # Initialize the grid with double dimensions
-        green_func_values = beam.particles.new_zeros(
-            (
-                *beam.particles.shape[:-2],
-                2 * num_grid_points_x,
-                2 * num_grid_points_y,
-                2 * num_grid_points_tau,
-            )
-        )
+        gamma_scaling = self._gamma_scaling(beam)
+        levels = (
+            (cell_size * gamma_scaling).detach().log()
+            / math.log1p(self.cell_size_resolution)
+        ).ceil()
 
-        # Fill the grid with G_values and its periodic copies
-        green_func_values[
-            ..., :num_grid_points_x, :num_grid_points_y, :num_grid_points_tau
-        ] = G_values
-        green_func_values[
-            ..., num_grid_points_x + 1 :, :num_grid_points_y, :num_grid_points_tau
-        ] = G_values[..., 1:, :, :].flip(
-            dims=[-3]
-        )  # Reverse x, excluding the first element
-        green_func_values[
-            ..., :num_grid_points_x, num_grid_points_y + 1 :, :num_grid_points_tau
-        ] = G_values[..., :, 1:, :].flip(
-            dims=[-2]
-        )  # Reverse y, excluding the first element
-        green_func_values[
-            ..., :num_grid_points_x, :num_grid_points_y, num_grid_points_tau + 1 :
-        ] = G_values[..., :, :, 1:].flip(
-            dims=[-1]
-        )  # Reverse s, excluding the first element
-        green_func_values[
-            ..., num_grid_points_x + 1 :, num_grid_points_y + 1 :, :num_grid_points_tau
-        ] = G_values[..., 1:, 1:, :].flip(
-            dims=[-3, -2]
-        )  # Reverse the x and y dimensions
-        green_func_values[
-            ..., :num_grid_points_x, num_grid_points_y + 1 :, num_grid_points_tau + 1 :
-        ] = G_values[..., :, 1:, 1:].flip(
-            dims=[-2, -1]
-        )  # Reverse the y and s dimensions
-        green_func_values[
-            ..., num_grid_points_x + 1 :, :num_grid_points_y, num_grid_points_tau + 1 :
-        ] = G_values[..., 1:, :, 1:].flip(
-            dims=[-3, -1]
-        )  # Reverse the x and s dimensions
-        green_func_values[
-            ...,
-            num_grid_points_x + 1 :,
-            num_grid_points_y + 1 :,
-            num_grid_points_tau + 1 :,
-        ] = G_values[..., 1:, 1:, 1:].flip(
-            dims=[-3, -2, -1]
-        )  # Reverse all dimensions
+        return (levels * math.log1p(self.cell_size_resolution)).exp() / gamma_scaling
 
-        return green_func_values
+    def _gamma_scaling(self, beam: ParticleBeam) -> torch.Tensor:
+        """
+        Factors of shape `(..., 3)` by which the x, y and tau dimensions are scaled for
+        the IGF. The longitudinal dimension is scaled by gamma, since we are solving a
+        modified Poisson equation in the lab frame (see docstring of the class).
+        """
+        return torch.stack(
+            [
+                torch.ones_like(beam.relativistic_gamma),
+                torch.ones_like(beam.relativistic_gamma),
+                beam.relativistic_gamma,
+            ],
+            dim=-1,
+        )
 
     def _solve_poisson_equation(
         self,
         beam: ParticleBeam,
-        xp_coordinates: torch.Tensor,
-        cell_size,
-        grid_dimensions,
+        stencil: CloudInCellStencil,
+        cell_size: torch.Tensor,
     ) -> torch.Tensor:  # Works only for ParticleBeam at this stage
         """
         Solves the Poisson equation for the given charge density, using FFT convolution.
         """
-        charge_density = self._array_rho(
-            beam, xp_coordinates, cell_size, grid_dimensions
-        )
+        charge_density = self._array_rho(beam, stencil, cell_size)
         charge_density_ft = torch.fft.rfftn(charge_density, dim=[1, 2, 3])
-        integrated_green_function = self._integrated_green_function(beam, cell_size)
-        integrated_green_function_ft = torch.fft.rfftn(
-            integrated_green_function, dim=[1, 2, 3]
+        integrated_green_function_ft = self._integrated_green_function_ft(
+            cell_size * self._gamma_scaling(beam)
         )
         potential_ft = charge_density_ft * integrated_green_function_ft
         potential = (1.0 / (4 * torch.pi * epsilon_0)) * torch.fft.irfftn(
@@ -321,50 +434,78 @@ class SpaceChargeKick(Element):
             : charge_density.shape[-1] // 2,
         ]
 
+    def _inverse_gamma_square(self, beam: ParticleBeam) -> torch.Tensor:
+        """
+        Computes `1 / gamma^2`, by which the electric field is reduced by the magnetic
+        field of the moving beam, or zero for a beam at rest.
+        """
+        igamma2 = torch.zeros_like(beam.relativistic_gamma)
+        igamma2[beam.relativistic_gamma != 0] = (
+            beam.relativistic_gamma[beam.relativistic_gamma != 0].square().reciprocal()
+        )
+        return igamma2
+
+    def _potential_gradient(
+        self, potential: torch.Tensor, cell_size: torch.Tensor
+    ) -> torch.Tensor:
+        """
+        Computes the gradient of the potential on the grid using central differences,
+        with 0 boundary conditions. The components of the gradient along the grid
+        dimensions, which are given by the last dimension of `cell_size`, are stacked
+        along the last dimension.
+        """
+        num_dims = cell_size.shape[-1]
+        inv_cell_size = cell_size.reciprocal()
+
+        gradients = []
+        for i, dim in enumerate(range(-num_dims, 0)):
+            num_grid_points = potential.shape[dim]
+            central_difference = (
+                potential.narrow(dim, 2, num_grid_points - 2)
+                - potential.narrow(dim, 0, num_grid_points - 2)
+            ) * (0.5 * inv_cell_size[..., i]).reshape(
+                *inv_cell_size.shape[:-1], *(1,) * num_dims
+            )
+            boundary = torch.zeros_like(potential.narrow(dim, 0, 1))
+            gradients.append(
+                torch.cat([boundary, central_difference, boundary], dim=dim)
+            )
+
+        return torch.stack(gradients, dim=-1)
+
     def _E_plus_vB_field(
         self,
         beam: ParticleBeam,
-        xp_coordinates: torch.Tensor,
+        stencil: CloudInCellStencil,
         cell_size: torch.Tensor,
-        grid_dimensions: torch.Tensor,
     ) -> torch.Tensor:
         """
         Computes the force field from the potential and the particle positions and
-        velocities, as in https://doi.org/10.1063/1.2837054.
+        velocities, as in https://doi.org/10.1063/1.2837054. The three components of the
+        field are stacked along the last dimension.
         """
-        inv_cell_size = cell_size.reciprocal()
-        igamma2 = torch.zeros_like(beam.relativistic_gamma)
-        igamma2[beam.relativistic_gamma != 0] = (
-            beam.relativistic_gamma[beam.relativistic_gamma != 0].square().reciprocal()
-        )
-        potential = self._solve_poisson_equation(
-            beam, xp_coordinates, cell_size, grid_dimensions
-        )
-
-        grad_x = torch.zeros_like(potential)
-        grad_y = torch.zeros_like(potential)
-        grad_tau = torch.zeros_like(potential)
-
-        # Compute the gradients of the potential, using central differences, with 0
-        # boundary conditions
-        grad_x[..., 1:-1, :, :] = (
-            potential[..., 2:, :, :] - potential[..., :-2, :, :]
-        ) * (0.5 * inv_cell_size[..., 0, None, None, None])
-        grad_y[..., :, 1:-1, :] = (
-            potential[..., :, 2:, :] - potential[..., :, :-2, :]
-        ) * (0.5 * inv_cell_size[..., 1, None, None, None])
-        grad_tau[..., :, :, 1:-1] = (
-            potential[..., :, :, 2:] - potential[..., :, :, :-2]
-        ) * (0.5 * inv_cell_size[..., 2, None, None, None])
+        potential = self._solve_poisson_equation(beam, stencil, cell_size)
 
         # Scale the gradients with lorentz factor
-        grad_x = -igamma2[..., None, None, None] * grad_x
-        grad_y = -igamma2[..., None, None, None] * grad_y
-        grad_tau = -igamma2[..., None, None, None] * grad_tau
-
-        return grad_x, grad_y, grad_tau
+        return -self._inverse_gamma_square(beam)[
+            ..., None, None, None, None
+        ] * self._potential_gradient(potential, cell_size)
 
     def _compute_forces(
+        self,
+        beam: ParticleBeam,
+        stencil: CloudInCellStencil,
+        cell_size: torch.Tensor,
+    ) -> torch.Tensor:
+        """
+        Interpolates the space charge force from the grid onto the macroparticles,
+        using the same stencil as the deposition of their charge onto the grid. `beam`
+        needs to have a flattened vector shape.
+        """
+        field = self._E_plus_vB_field(beam, stencil, cell_size)
+        return stencil.interpolate(field) * elementary_charge
+
+    def _compute_transverse_forces(
         self,
         beam: ParticleBeam,
         xp_coordinates: torch.Tensor,
@@ -372,107 +513,71 @@ class SpaceChargeKick(Element):
         grid_dimensions: torch.Tensor,
     ) -> torch.Tensor:
         """
-        Interpolates the space charge force from the grid onto the macroparticles.
-        Reciprocal function of _deposit_charge_on_grid. `beam` needs to have a flattened
-        vector shape.
+        Computes the space charge force on the macroparticles with the 2D or 2.5D
+        solver. The transverse field per unit line density is found by solving the 2D
+        Poisson equation for the transverse charge distribution, normalised to unit
+        charge, with the Hockney method. It is interpolated to the particles and scaled
+        by the line density of the beam, which is either assumed uniform or deposited on
+        a 1D longitudinal grid. The longitudinal force is zero. `beam` needs to have a
+        flattened vector shape.
         """
-        grad_x, grad_y, grad_z = self._E_plus_vB_field(
-            beam, xp_coordinates, cell_size, grid_dimensions
-        )
-        grid_shape = self.grid_shape
-        interpolated_forces = beam.particles.new_zeros(
-            (*beam.particles.shape[:-1], 3)
-        )  # (..., num_particles, 3)
-
-        # Get particle positions
-        particle_positions = xp_coordinates[..., [0, 2, 4]]
-        normalized_positions = (
-            particle_positions + grid_dimensions.unsqueeze(-2)
-        ) / cell_size.unsqueeze(-2)
-
-        # Find indices of the lower corners of the cells containing the particles
-        cell_indices = normalized_positions.floor().to(torch.int)
-
-        # Calculate the weights for all surrounding cells
-        offsets = torch.tensor(
-            [
-                [0, 0, 0],
-                [0, 0, 1],
-                [0, 1, 0],
-                [0, 1, 1],
-                [1, 0, 0],
-                [1, 0, 1],
-                [1, 1, 0],
-                [1, 1, 1],
-            ],
-            device=cell_indices.device,
+        charges = beam.particle_charges * beam.survival_probabilities
+        total_charge = charges.sum(dim=-1, keepdim=True)
+        num_x, num_y = self.grid_shape[:2]
+
+        transverse_stencil = CloudInCellStencil(
+            positions=xp_coordinates[..., [0, 2]],
+            bins=self.grid_shape[:2],
+            extent=torch.stack(
+                [-grid_dimensions[..., :2], grid_dimensions[..., :2]], dim=-1
+            ),
+            backend=self.deposition_backend,
         )
-        surrounding_indices = cell_indices.unsqueeze(-2) + offsets.unsqueeze(
-            -3
-        )  # Shape:(.., num_particles, 8, 3)
-        weights = (
-            1 - (normalized_positions.unsqueeze(-2) - surrounding_indices).abs()
-        )  # Shape: (..., num_particles, 8, 3)
-        cell_weights = weights.prod(dim=-1)  # Shape: (..., num_particles, 8)
-
-        # Extract forces from the grids
-        surrounding_indices_flattened = surrounding_indices.flatten(
-            start_dim=-3, end_dim=-2
-        )  # Shape: (..., num_particles * 8, 3)
-        idx_vector = (
-            torch.arange(cell_indices.shape[0], device=cell_indices.device)
-            .repeat(8 * beam.particles.shape[-2], 1)
-            .T
-        )  # Shape: (..., num_particles * 8)
-        idx_x = surrounding_indices_flattened[..., 0]
-        idx_y = surrounding_indices_flattened[..., 1]
-        idx_tau = surrounding_indices_flattened[..., 2]
-        valid_mask = (
-            (idx_x >= 0)
-            & (idx_x < grid_shape[0])
-            & (idx_y >= 0)
-            & (idx_y < grid_shape[1])
-            & (idx_tau >= 0)
-            & (idx_tau < grid_shape[2])
+        charge_density = transverse_stencil.deposit(charges / total_charge) / (
+            cell_size[..., :2].prod(dim=-1)[..., None, None]
         )
 
-        # Keep dimensions, and set F to zero if non-valid
-        force_indices = (
-            idx_vector,
-            idx_x.clamp(min=0, max=grid_shape[0] - 1),
-            idx_y.clamp(min=0, max=grid_shape[1] - 1),
-            idx_tau.clamp(min=0, max=grid_shape[2] - 1),
+        # The 2D Green function is -ln(r^2) / (4 pi epsilon_0)
+        charge_density_ft = torch.fft.rfftn(
+            charge_density, s=(2 * num_x, 2 * num_y), dim=[-2, -1]
         )
-
-        Fx_values = grad_x[force_indices].where(valid_mask, 0)
-        Fy_values = grad_y[force_indices].where(valid_mask, 0)
-        Fz_values = grad_z[force_indices].where(
-            valid_mask, 0
-        )  # (..., 8 * num_particles)
-
-        # Compute interpolated forces
-        # Cell weights validation is taken care of by the F_x, F_y, F_z values
-        cell_weights_with_e = cell_weights.flatten(start_dim=-2) * elementary_charge
-        values_x = cell_weights_with_e * Fx_values
-        values_y = cell_weights_with_e * Fy_values
-        values_z = cell_weights_with_e * Fz_values
-
-        forces_to_add = torch.stack([values_x, values_y, values_z], dim=-1)
-
-        index_tensor = (
-            torch.arange(beam.num_particles, device=beam.particles.device)
-            .repeat_interleave(8)
-            .unsqueeze(0)
-            .unsqueeze(-1)
-            .expand(beam.particles.shape[0], 8 * beam.particles.shape[-2], 3)
+        potential_ft = charge_density_ft * self._integrated_green_function_ft(
+            cell_size[..., :2]
         )
+        potential = (-1.0 / (4 * torch.pi * epsilon_0)) * torch.fft.irfftn(
+            potential_ft, s=(2 * num_x, 2 * num_y), dim=[-2, -1]
+        )[..., :num_x, :num_y]
+        field = -self._inverse_gamma_square(beam)[
+            ..., None, None, None
+        ] * self._potential_gradient(potential, cell_size[..., :2])
 
-        # Add the forces to the particles
-        accumulated_forces = torch.scatter_add(
-            interpolated_forces, dim=1, index=index_tensor, src=forces_to_add
-        )
+        if self.solver == "2d":
+            # Uniform distribution with the same RMS length as the beam
+            line_density = total_charge / (
+                math.sqrt(12) * (beam.relativistic_beta * beam.sigma_tau).unsqueeze(-1)
+            )
+        else:
+            longitudinal_stencil = CloudInCellStencil(
+                positions=xp_coordinates[..., [4]],
+                bins=self.grid_shape[2:],
+                extent=torch.stack(
+                    [-grid_dimensions[..., 2:], grid_dimensions[..., 2:]], dim=-1
+                ),
+                backend=self.deposition_backend,
+            )
+            line_density_grid = (
+                longitudinal_stencil.deposit(charges) / cell_size[..., 2:]
+            )
+            line_density = longitudinal_stencil.interpolate(
+                line_density_grid.unsqueeze(-1)
+            ).squeeze(-1)
 
-        return accumulated_forces
+        transverse_forces = transverse_stencil.interpolate(field) * (
+            elementary_charge * line_density
+        ).unsqueeze(-1)
+        return torch.cat(
+            [transverse_forces, torch.zeros_like(transverse_forces[..., :1])], dim=-1
+        )
 
     def track(self, incoming: ParticleBeam) -> ParticleBeam:
         """
@@ -485,13 +590,20 @@ class SpaceChargeKick(Element):
             incoming, ParticleBeam
         ), "SpaceChargeKick tracking is currently only supported for `ParticleBeam`."
 
+        # Compact beams are kicked in their 6-dimensional storage, so that they never
+        # need to be expanded to the full 7-dimensional particle vectors
+        incoming_particles = (
+            incoming.phase_space if incoming.is_compact else incoming.particles
+        )
+        num_coordinates = incoming_particles.shape[-1]
+
         # This flattening is a hack to only think about one vector dimension in the
         # following code. It is reversed at the end of the function.
 
         # Make sure that the incoming beam has at least one vector dimension by
         # broadcasting with a dummy dimension (1,).
         vector_shape = torch.broadcast_shapes(
-            incoming.particles.shape[:-2],
+            incoming_particles.shape[:-2],
             incoming.energy.shape,
             incoming.particle_charges.shape[:-1],
             incoming.survival_probabilities.shape[:-1],
@@ -499,7 +611,8 @@ class SpaceChargeKick(Element):
         )
         vectorized_incoming = ParticleBeam(
             particles=torch.broadcast_to(
-                incoming.particles, (*vector_shape, incoming.num_particles, 7)
+                incoming_particles,
+                (*vector_shape, incoming.num_particles, num_coordinates),
             ),
             energy=torch.broadcast_to(incoming.energy, vector_shape),
             particle_charges=torch.broadcast_to(
@@ -510,20 +623,24 @@ class SpaceChargeKick(Element):
                 (*vector_shape, incoming.num_particles),
             ),
             species=incoming.species,
-            device=incoming.particles.device,
-            dtype=incoming.particles.dtype,
+            device=incoming_particles.device,
+            dtype=incoming_particles.dtype,
         )
 
         flattened_incoming = ParticleBeam(
-            particles=vectorized_incoming.particles.flatten(end_dim=-3),
+            particles=(
+                vectorized_incoming.phase_space.flatten(end_dim=-3)
+                if incoming.is_compact
+                else vectorized_incoming.particles.flatten(end_dim=-3)
+            ),
             energy=vectorized_incoming.energy.flatten(end_dim=-1),
             particle_charges=vectorized_incoming.particle_charges.flatten(end_dim=-2),
             survival_probabilities=(
                 vectorized_incoming.survival_probabilities.flatten(end_dim=-2)
             ),
             species=incoming.species,
-            device=vectorized_incoming.particles.device,
-            dtype=vectorized_incoming.particles.dtype,
+            device=incoming_particles.device,
+            dtype=incoming_particles.dtype,
         )
         flattened_length_effect = self.effect_length.flatten(end_dim=-1)
 
@@ -536,24 +653,33 @@ class SpaceChargeKick(Element):
             ],
             dim=-1,
         )
-        cell_size = (
-            2
-            * grid_dimensions
-            / torch.tensor(
-                self.grid_shape,
-                device=grid_dimensions.device,
-                dtype=grid_dimensions.dtype,
+        cell_size = self._cell_size(flattened_incoming, grid_dimensions)
+        if self.cell_size_resolution is not None:
+            grid_dimensions = (
+                0.5
+                * cell_size
+                * torch.tensor(
+                    self.grid_shape, device=cell_size.device, dtype=cell_size.dtype
+                )
             )
-        )
         dt = flattened_length_effect / (
             speed_of_light * flattened_incoming.relativistic_beta
         )
 
         # Change coordinates to apply the space charge effect
         xp_coordinates = flattened_incoming.to_xyz_pxpypz()
-        forces = self._compute_forces(
-            flattened_incoming, xp_coordinates, cell_size, grid_dimensions
-        )
+        if self.solver == "3d":
+            stencil = CloudInCellStencil(
+                positions=xp_coordinates[..., [0, 2, 4]],
+                bins=self.grid_shape,
+                extent=torch.stack([-grid_dimensions, grid_dimensions], dim=-1),
+                backend=self.deposition_backend,
+            )
+            forces = self._compute_forces(flattened_incoming, stencil, cell_size)
+        else:
+            forces = self._compute_transverse_forces(
+                flattened_incoming, xp_coordinates, cell_size, grid_dimensions
+            )
         xp_coordinates[..., 1] = xp_coordinates[..., 1] + forces[..., 0] * dt.unsqueeze(
             -1
         )
@@ -566,7 +692,7 @@ class SpaceChargeKick(Element):
 
         # Reverse the flattening of the vector dimensions
         outgoing_vector_shape = torch.broadcast_shapes(
-            incoming.particles.shape[:-2],
+            incoming_particles.shape[:-2],
             incoming.energy.shape,
             incoming.particle_charges.shape[:-1],
             incoming.survival_probabilities.shape[:-1],
@@ -574,7 +700,7 @@ class SpaceChargeKick(Element):
         )
         outgoing = ParticleBeam.from_xyz_pxpypz(
             xp_coordinates=xp_coordinates.reshape(
-                (*outgoing_vector_shape, incoming.num_particles, 7)
+                (*outgoing_vector_shape, incoming.num_particles, num_coordinates)
             ),
             energy=incoming.energy,
             particle_charges=incoming.particle_charges,
@@ -606,4 +732,7 @@ class SpaceChargeKick(Element):
             "grid_extent_x",
             "grid_extent_y",
             "grid_extent_tau",
+            "solver",
+            "deposition_backend",
+            "cell_size_resolution",
         ]
@@ -41,6 +41,10 @@ class TransverseDeflectingCavity(Element):
     :param dtype: Data type of the element's tensors.
     """
 
+    UNVECTORIZED_NUM_ATTR_DIMS = Element.UNVECTORIZED_NUM_ATTR_DIMS | {
+        "misalignment": 1
+    }
+
     supported_tracking_methods = ["drift_kick_drift"]
 
     def __init__(
@@ -198,7 +202,12 @@ class TransverseDeflectingCavity(Element):
 
         outgoing_beam = ParticleBeam(
             particles=torch.stack(
-                (x, px, y, py, tau, delta, torch.ones_like(x)), dim=-1
+                (
+                    (x, px, y, py, tau, delta)
+                    if incoming.is_compact
+                    else (x, px, y, py, tau, delta, torch.ones_like(x))
+                ),
+                dim=-1,
             ),
             energy=ref_energy,
             particle_charges=incoming.particle_charges,
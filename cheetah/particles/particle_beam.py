@@ -1,6 +1,7 @@
 import itertools
+import weakref
 from pathlib import Path
-from typing import Literal
+from typing import Any, Callable, Literal
 
 import numpy as np
 import torch
@@ -15,9 +16,7 @@ from cheetah.utils import (
     elementwise_linspace,
     format_axis_with_prefixed_unit,
     match_distribution_moments,
-    unbiased_weighted_covariance,
-    unbiased_weighted_covariance_matrix,
-    unbiased_weighted_std,
+    unbiased_weighted_mean_and_covariance_matrix,
 )
 
 
@@ -25,7 +24,14 @@ class ParticleBeam(Beam):
     """
     Beam of charged particles, where each particle is simulated.
 
-    :param particles: List of 7-dimensional particle vectors.
+    Particles can either be stored with a constant seventh coordinate of 1, which allows
+    transfer maps to be applied as a single matrix product, or in a compact form with
+    only the 6 phase space coordinates, which reduces the memory of the beam and of all
+    beams kept alive for automatic differentiation by a seventh. Compact beams are
+    created by passing 6-dimensional particle vectors or with `as_compact_beam`.
+
+    :param particles: List of 7-dimensional particle vectors, or of 6-dimensional
+        particle vectors for a compact beam.
     :param energy: Reference energy of the beam in eV.
     :param particle_charges: Charges of the macroparticles in the beam in C.
     :param survival_probabilities: Vector of probabilities that each particle has
@@ -57,6 +63,10 @@ class ParticleBeam(Beam):
         "p": 1,
     }
 
+    # Number of lost particles removed from the beam by `without_lost_particles`. As a
+    # class attribute, this also defaults to 0 for beams unpickled from older versions.
+    num_dropped_particles = 0
+
     def __init__(
         self,
         particles: torch.Tensor,
@@ -71,15 +81,18 @@ class ParticleBeam(Beam):
         factory_kwargs = {"device": device, "dtype": dtype}
         super().__init__()
 
-        assert (
-            particles.shape[-2] > 0 and particles.shape[-1] == 7
-        ), "Particle vectors must be 7-dimensional."
+        assert particles.shape[-2] > 0 and particles.shape[-1] in (
+            6,
+            7,
+        ), "Particle vectors must be 6- or 7-dimensional."
 
         self.species = (
             species if species is not None else Species("electron", **factory_kwargs)
         )
 
-        self.register_buffer("particles", particles)
+        self.register_buffer(
+            "compact_particles" if particles.shape[-1] == 6 else "particles", particles
+        )
         self.register_buffer("energy", energy)
         self.register_buffer(
             "particle_charges",
@@ -1002,7 +1015,7 @@ class ParticleBeam(Beam):
             )
 
         # For now only support non-vectorised particle distributions
-        if len(self.particles.shape) != 2:
+        if len(self._particle_storage.shape) != 2:
             raise ValueError(
                 "Only non-vectorised particle distributions are supported."
             )
@@ -1130,7 +1143,7 @@ class ParticleBeam(Beam):
             dim=-1,
         )
 
-        phase_space = self.particles[..., :6]
+        phase_space = self.phase_space
         phase_space = (
             (phase_space.mT - old_mu.unsqueeze(-1))
             / old_sigma.unsqueeze(-1)
@@ -1141,8 +1154,8 @@ class ParticleBeam(Beam):
         particles = torch.ones(
             *phase_space.shape[:-1],
             7,
-            device=self.particles.device,
-            dtype=self.particles.dtype,
+            device=self._particle_storage.device,
+            dtype=self._particle_storage.dtype,
         )
         particles[..., :6] = phase_space
 
@@ -1165,16 +1178,15 @@ class ParticleBeam(Beam):
         """
         from cheetah.particles.parameter_beam import ParameterBeam  # No circular import
 
+        mu, cov = self._moments()
+
         return ParameterBeam(
-            mu=(self.particles * self.survival_probabilities.unsqueeze(-1)).sum(dim=-2)
-            / self.survival_probabilities.sum(dim=-1, keepdim=True),
-            cov=unbiased_weighted_covariance_matrix(
-                self.particles, weights=self.survival_probabilities
-            ),
+            mu=torch.cat((mu, mu.new_ones((*mu.shape[:-1], 1))), dim=-1),
+            cov=torch.nn.functional.pad(cov, (0, 1, 0, 1)),
             energy=self.energy,
             total_charge=self.total_charge,
-            device=self.particles.device,
-            dtype=self.particles.dtype,
+            device=self._particle_storage.device,
+            dtype=self._particle_storage.dtype,
         )
 
     def linspaced(self, num_particles: int) -> "ParticleBeam":
@@ -1205,8 +1217,8 @@ class ParticleBeam(Beam):
             survival_probabilities=self.survival_probabilities,
             s=self.s,
             species=self.species,
-            device=self.particles.device,
-            dtype=self.particles.dtype,
+            device=self._particle_storage.device,
+            dtype=self._particle_storage.dtype,
         )
 
     def randomly_subsampled(
@@ -1232,11 +1244,13 @@ class ParticleBeam(Beam):
         )
 
         randomly_permuted_particle_indices = torch.randperm(
-            self.num_particles, generator=random_state, device=self.particles.device
+            self.num_particles,
+            generator=random_state,
+            device=self._particle_storage.device,
         )
         subsampled_particle_indices = randomly_permuted_particle_indices[:num_particles]
 
-        subsampled_particles = self.particles[subsampled_particle_indices]
+        subsampled_particles = self._particle_storage[subsampled_particle_indices]
         subsampled_particle_charges = self.particle_charges[subsampled_particle_indices]
         subsampled_survival_probabilities = self.survival_probabilities[
             subsampled_particle_indices
@@ -1248,8 +1262,8 @@ class ParticleBeam(Beam):
             particle_charges=subsampled_particle_charges,
             survival_probabilities=subsampled_survival_probabilities,
             species=self.species,
-            device=self.particles.device,
-            dtype=self.particles.dtype,
+            device=self._particle_storage.device,
+            dtype=self._particle_storage.dtype,
         )
 
         if adjust_particle_charges:
@@ -1259,6 +1273,74 @@ class ParticleBeam(Beam):
 
         return subsampled_beam
 
+    def without_lost_particles(self) -> "ParticleBeam":
+        """
+        Create a new beam without the particles that have been lost, i.e. whose
+        survival probability is zero. Since lost particles do not contribute to the
+        beam's charge or statistics, these are unchanged, while tracking the new beam
+        only costs as much as tracking its surviving particles.
+
+        For beams whose survival probabilities are vectorised, the surviving particles
+        of every vector entry are packed to the front, and the beam is truncated to the
+        largest number of surviving particles of any entry. Entries with fewer surviving
+        particles are padded with lost particles.
+
+        NOTE: The number of particles of the new beam depends on the survival
+            probabilities, so that this synchronises with the device. At least one
+            particle is always kept.
+
+        :return: New beam without the lost particles, or this beam if no particles can
+            be removed. The number of removed particles is added to the new beam's
+            `num_dropped_particles`.
+        """
+        is_alive = self.survival_probabilities > 0
+        num_kept = max(int(is_alive.sum(dim=-1).max()), 1)
+        if num_kept == self.num_particles:
+            return self
+
+        if is_alive.dim() == 1:
+            # Lost particles are the same for all vector entries
+            kept_indices = is_alive.nonzero().squeeze(-1)
+            if kept_indices.numel() == 0:
+                kept_indices = kept_indices.new_zeros(1)
+            particles = self._particle_storage[..., kept_indices, :]
+            particle_charges = self.particle_charges[..., kept_indices]
+            survival_probabilities = self.survival_probabilities[kept_indices]
+        else:
+            vector_shape = torch.broadcast_shapes(
+                self._particle_storage.shape[:-2],
+                self.particle_charges.shape[:-1],
+                is_alive.shape[:-1],
+            )
+            # Stable sorting moves the surviving particles of every vector entry to
+            # the front without changing their order
+            kept_indices = torch.argsort(
+                is_alive.logical_not(), dim=-1, stable=True
+            ).broadcast_to((*vector_shape, self.num_particles))[..., :num_kept]
+            particles = self._particle_storage.broadcast_to(
+                (*vector_shape, *self._particle_storage.shape[-2:])
+            ).take_along_dim(kept_indices.unsqueeze(-1), dim=-2)
+            particle_charges = self.particle_charges.broadcast_to(
+                (*vector_shape, self.num_particles)
+            ).take_along_dim(kept_indices, dim=-1)
+            survival_probabilities = self.survival_probabilities.broadcast_to(
+                (*vector_shape, self.num_particles)
+            ).take_along_dim(kept_indices, dim=-1)
+
+        beam = self.__class__(
+            particles=particles,
+            energy=self.energy,
+            particle_charges=particle_charges,
+            survival_probabilities=survival_probabilities,
+            s=self.s,
+            species=self.species,
+        )
+        beam.num_dropped_particles = (
+            self.num_dropped_particles + self.num_particles - beam.num_particles
+        )
+
+        return beam
+
     @classmethod
     def from_xyz_pxpypz(
         cls,
@@ -1274,7 +1356,9 @@ class ParticleBeam(Beam):
         """
         Create a beam from a tensor of position and momentum coordinates in SI units.
         This tensor should have shape (..., num_particles, 7), where the last dimension
-        is the moment vector $(x, p_x, y, p_y, z, p_z, 1)$.
+        is the moment vector $(x, p_x, y, p_y, z, p_z, 1)$. If it has shape
+        (..., num_particles, 6) without the constant seventh coordinate, a compact beam
+        is created.
         """
         beam = cls(
             particles=xp_coordinates.clone(),
@@ -1302,12 +1386,12 @@ class ParticleBeam(Beam):
             1 + (p / (beam.species.mass_kg * constants.speed_of_light)).square()
         ).sqrt()
 
-        beam.particles[..., 1] = xp_coordinates[..., 1] / p0.unsqueeze(-1)
-        beam.particles[..., 3] = xp_coordinates[..., 3] / p0.unsqueeze(-1)
-        beam.particles[..., 4] = -xp_coordinates[
+        beam.phase_space[..., 1] = xp_coordinates[..., 1] / p0.unsqueeze(-1)
+        beam.phase_space[..., 3] = xp_coordinates[..., 3] / p0.unsqueeze(-1)
+        beam.phase_space[..., 4] = -xp_coordinates[
             ..., 4
         ] / beam.relativistic_beta.unsqueeze(-1)
-        beam.particles[..., 5] = (gamma - beam.relativistic_gamma.unsqueeze(-1)) / (
+        beam.phase_space[..., 5] = (gamma - beam.relativistic_gamma.unsqueeze(-1)) / (
             (beam.relativistic_beta * beam.relativistic_gamma).unsqueeze(-1)
         )
 
@@ -1318,7 +1402,8 @@ class ParticleBeam(Beam):
         Extracts the position and momentum coordinates in SI units, from the
         beam's `particles`, and returns it as a tensor with shape
         (..., num_particles, 7). For each particle, the obtained vector is
-        $(x, p_x, y, p_y, z, p_z, 1)$.
+        $(x, p_x, y, p_y, z, p_z, 1)$. For compact beams, the constant seventh
+        coordinate is omitted and the tensor has shape (..., num_particles, 6).
         """
         p0 = (
             self.relativistic_gamma
@@ -1327,17 +1412,17 @@ class ParticleBeam(Beam):
             * constants.speed_of_light
         )  # Reference momentum in (kg m/s)
         gamma = self.relativistic_gamma.unsqueeze(-1) * (
-            1.0 + self.particles[..., 5] * self.relativistic_beta.unsqueeze(-1)
+            1.0 + self.p * self.relativistic_beta.unsqueeze(-1)
         )
         beta = (1 - gamma.square().reciprocal()).sqrt()
         momentum = gamma * self.species.mass_kg * beta * constants.speed_of_light
 
-        px = self.particles[..., 1] * p0.unsqueeze(-1)
-        py = self.particles[..., 3] * p0.unsqueeze(-1)
-        zs = self.particles[..., 4] * -self.relativistic_beta.unsqueeze(-1)
+        px = self.px * p0.unsqueeze(-1)
+        py = self.py * p0.unsqueeze(-1)
+        zs = self.tau * -self.relativistic_beta.unsqueeze(-1)
         p = (momentum.square() - px.square() - py.square()).sqrt()
 
-        xp_coords = self.particles.clone()
+        xp_coords = self._particle_storage.clone()
         xp_coords[..., 1] = px
         xp_coords[..., 3] = py
         xp_coords[..., 4] = zs
@@ -1681,20 +1766,151 @@ class ParticleBeam(Beam):
 
         NOTE: This does not account for lost particles.
         """
-        return self.particles.shape[-2]
+        return self._particle_storage.shape[-2]
 
     @property
     def num_particles_survived(self) -> torch.Tensor:
         """Number of macroparticles that have survived."""
         return self.survival_probabilities.sum(dim=-1)
 
+    @property
+    def is_compact(self) -> bool:
+        """
+        Whether the particles are stored compactly with only the 6 phase space
+        coordinates instead of with the constant seventh coordinate.
+        """
+        return "compact_particles" in self._buffers
+
+    @property
+    def particles(self) -> torch.Tensor:
+        """
+        7-dimensional particle vectors of shape `(..., num_particles, 7)`, where the
+        seventh coordinate is always 1.
+
+        NOTE: For compact beams, this is built from the stored phase space coordinates
+            on first access and cached until they change, unless they require
+            gradients. Changes made to it in place are therefore not applied to the
+            beam. Use `phase_space` or the coordinate setters, e.g. `beam.x = ...`,
+            instead.
+        """
+        if "particles" in self._buffers:
+            return self._buffers["particles"]
+        if "compact_particles" not in self._buffers:
+            # Not set yet during the initialisation of the beam
+            raise AttributeError("particles")
+
+        return self._cached(
+            "_particles_cache",
+            (self._buffers["compact_particles"],),
+            lambda: torch.cat(
+                (
+                    self._buffers["compact_particles"],
+                    self._buffers["compact_particles"].new_ones(
+                        (*self._buffers["compact_particles"].shape[:-1], 1)
+                    ),
+                ),
+                dim=-1,
+            ),
+        )
+
+    @particles.setter
+    def particles(self, value: torch.Tensor) -> None:
+        # Only reached for compact beams, as `nn.Module` sets buffers directly
+        self._buffers["compact_particles"] = value[..., :6].contiguous()
+
+    @property
+    def phase_space(self) -> torch.Tensor:
+        """
+        Phase space coordinates of the particles of shape `(..., num_particles, 6)`,
+        without the constant seventh coordinate. For beams that are not compact, this
+        is a view of `particles`.
+        """
+        return self._particle_storage[..., :6]
+
+    @property
+    def _particle_storage(self) -> torch.Tensor:
+        """The tensor the particles are actually stored in, with 6 or 7 coordinates."""
+        return self._buffers.get("compact_particles", self._buffers.get("particles"))
+
+    def as_compact_beam(self) -> "ParticleBeam":
+        """
+        Convert the beam to a compact beam that only stores the 6 phase space
+        coordinates of its particles.
+
+        :return: Compact `ParticleBeam` with the same particles as this beam.
+        """
+        return self.__class__(
+            particles=self.phase_space.contiguous(),
+            energy=self.energy,
+            particle_charges=self.particle_charges,
+            survival_probabilities=self.survival_probabilities,
+            s=self.s,
+            species=self.species,
+        )
+
+    def _cached(
+        self,
+        name: str,
+        inputs: tuple[torch.Tensor, ...],
+        compute: Callable[[], Any],
+    ) -> Any:
+        """
+        Get a quantity derived from the passed input tensors from the cache with the
+        passed name, computing it if the cache is empty or any of the input tensors have
+        been replaced or modified in place since it was computed.
+
+        Quantities that are part of an autograd graph are never cached, so that every
+        access builds its own graph and can be backpropagated through independently.
+        """
+        if torch.is_grad_enabled() and any(tensor.requires_grad for tensor in inputs):
+            self.__dict__.pop(name, None)
+            return compute()
+
+        cache = self.__dict__.get(name)
+        if (
+            cache is None
+            or cache["is_grad_enabled"] != torch.is_grad_enabled()
+            or any(
+                ref() is not tensor or version != tensor._version
+                for (ref, version), tensor in zip(cache["inputs"], inputs)
+            )
+        ):
+            # Weak references, such that the cache does not keep replaced tensors alive
+            cache = {
+                "inputs": [(weakref.ref(tensor), tensor._version) for tensor in inputs],
+                "is_grad_enabled": torch.is_grad_enabled(),
+                "result": compute(),
+            }
+            self.__dict__[name] = cache
+        return cache["result"]
+
+    def _moments(self) -> tuple[torch.Tensor, torch.Tensor]:
+        """
+        Weighted mean of shape `(..., 6)` and unbiased weighted covariance matrix of
+        shape `(..., 6, 6)` of the particles' phase space coordinates, weighted by their
+        survival probability.
+
+        Both are computed together in one fused pass over the particles and cached
+        until `particles` or `survival_probabilities` are replaced or modified in
+        place, so that all moment properties of the beam (e.g. `mu_x`, `sigma_x`,
+        `cov_xpx` and the emittances and Twiss parameters derived from them) share a
+        single computation. They are not cached while they require gradients.
+        """
+        return self._cached(
+            "_moment_cache",
+            (self._particle_storage, self.survival_probabilities),
+            lambda: unbiased_weighted_mean_and_covariance_matrix(
+                self.phase_space, weights=self.survival_probabilities
+            ),
+        )
+
     @property
     def x(self) -> torch.Tensor | None:
-        return self.particles[..., 0]
+        return self._particle_storage[..., 0]
 
     @x.setter
     def x(self, value: torch.Tensor) -> None:
-        self.particles[..., 0] = value
+        self._particle_storage[..., 0] = value
 
     @property
     def mu_x(self) -> torch.Tensor | None:
@@ -1702,9 +1918,7 @@ class ParticleBeam(Beam):
         Mean of the :math:`x` coordinates of the particles, weighted by their
         survival probability.
         """
-        return (self.x * self.survival_probabilities).sum(
-            dim=-1
-        ) / self.survival_probabilities.sum(dim=-1)
+        return self._moments()[0][..., 0]
 
     @property
     def sigma_x(self) -> torch.Tensor | None:
@@ -1712,17 +1926,15 @@ class ParticleBeam(Beam):
         Standard deviation of the :math:`x` coordinates of the particles, weighted
         by their survival probability.
         """
-        return unbiased_weighted_std(
-            self.x, weights=self.survival_probabilities, dim=-1
-        )
+        return self._moments()[1][..., 0, 0].sqrt()
 
     @property
     def px(self) -> torch.Tensor | None:
-        return self.particles[..., 1]
+        return self._particle_storage[..., 1]
 
     @px.setter
     def px(self, value: torch.Tensor) -> None:
-        self.particles[..., 1] = value
+        self._particle_storage[..., 1] = value
 
     @property
     def mu_px(self) -> torch.Tensor | None:
@@ -1730,9 +1942,7 @@ class ParticleBeam(Beam):
         Mean of the :math:`px` coordinates of the particles, weighted by their
         survival probability.
         """
-        return (self.px * self.survival_probabilities).sum(
-            dim=-1
-        ) / self.survival_probabilities.sum(dim=-1)
+        return self._moments()[0][..., 1]
 
     @property
     def sigma_px(self) -> torch.Tensor | None:
@@ -1740,89 +1950,71 @@ class ParticleBeam(Beam):
         Standard deviation of the :math:`px` coordinates of the particles, weighted
         by their survival probability.
         """
-        return unbiased_weighted_std(
-            self.px, weights=self.survival_probabilities, dim=-1
-        )
+        return self._moments()[1][..., 1, 1].sqrt()
 
     @property
     def y(self) -> torch.Tensor | None:
-        return self.particles[..., 2]
+        return self._particle_storage[..., 2]
 
     @y.setter
     def y(self, value: torch.Tensor) -> None:
-        self.particles[..., 2] = value
+        self._particle_storage[..., 2] = value
 
     @property
     def mu_y(self) -> float | None:
-        return (self.y * self.survival_probabilities).sum(
-            dim=-1
-        ) / self.survival_probabilities.sum(dim=-1)
+        return self._moments()[0][..., 2]
 
     @property
     def sigma_y(self) -> torch.Tensor | None:
-        return unbiased_weighted_std(
-            self.y, weights=self.survival_probabilities, dim=-1
-        )
+        return self._moments()[1][..., 2, 2].sqrt()
 
     @property
     def py(self) -> torch.Tensor | None:
-        return self.particles[..., 3]
+        return self._particle_storage[..., 3]
 
     @py.setter
     def py(self, value: torch.Tensor) -> None:
-        self.particles[..., 3] = value
+        self._particle_storage[..., 3] = value
 
     @property
     def mu_py(self) -> torch.Tensor | None:
-        return (self.py * self.survival_probabilities).sum(
-            dim=-1
-        ) / self.survival_probabilities.sum(dim=-1)
+        return self._moments()[0][..., 3]
 
     @property
     def sigma_py(self) -> torch.Tensor | None:
-        return unbiased_weighted_std(
-            self.py, weights=self.survival_probabilities, dim=-1
-        )
+        return self._moments()[1][..., 3, 3].sqrt()
 
     @property
     def tau(self) -> torch.Tensor | None:
-        return self.particles[..., 4]
+        return self._particle_storage[..., 4]
 
     @tau.setter
     def tau(self, value: torch.Tensor) -> None:
-        self.particles[..., 4] = value
+        self._particle_storage[..., 4] = value
 
     @property
     def mu_tau(self) -> torch.Tensor | None:
-        return (self.tau * self.survival_probabilities).sum(
-            dim=-1
-        ) / self.survival_probabilities.sum(dim=-1)
+        return self._moments()[0][..., 4]
 
     @property
     def sigma_tau(self) -> torch.Tensor | None:
-        return unbiased_weighted_std(
-            self.tau, weights=self.survival_probabilities, dim=-1
-        )
+        return self._moments()[1][..., 4, 4].sqrt()
 
     @property
     def p(self) -> torch.Tensor | None:
-        return self.particles[..., 5]
+        return self._particle_storage[..., 5]
 
     @p.setter
     def p(self, value: torch.Tensor) -> None:
-        self.particles[..., 5] = value
+        self._particle_storage[..., 5] = value
 
     @property
     def mu_p(self) -> torch.Tensor | None:
-        return (self.p * self.survival_probabilities).sum(
-            dim=-1
-        ) / self.survival_probabilities.sum(dim=-1)
+        return self._moments()[0][..., 5]
 
     @property
     def sigma_p(self) -> torch.Tensor | None:
-        return unbiased_weighted_std(
-            self.p, weights=self.survival_probabilities, dim=-1
-        )
+        return self._moments()[1][..., 5, 5].sqrt()
 
     @property
     def cov_xpx(self) -> torch.Tensor:
@@ -1830,9 +2022,7 @@ class ParticleBeam(Beam):
         Returns the covariance between x and px. :math:`\sigma_{x, px}^2`.
         It is weighted by the survival probability of the particles.
         """
-        return unbiased_weighted_covariance(
-            self.x, self.px, weights=self.survival_probabilities, dim=-1
-        )
+        return self._moments()[1][..., 0, 1]
 
     @property
     def cov_ypy(self) -> torch.Tensor:
@@ -1840,9 +2030,7 @@ class ParticleBeam(Beam):
         Returns the covariance between y and py. :math:`\sigma_{y, py}^2`.
         It is weighted by the survival probability of the particles.
         """
-        return unbiased_weighted_covariance(
-            self.y, self.py, weights=self.survival_probabilities, dim=-1
-        )
+        return self._moments()[1][..., 2, 3]
 
     @property
     def cov_taup(self) -> torch.Tensor:
@@ -1850,9 +2038,7 @@ class ParticleBeam(Beam):
         Returns the covariance between tau and p. :math:`\sigma_{\tau, p}^2`.
         It is weighted by the survival probability of the particles.
         """
-        return unbiased_weighted_covariance(
-            self.tau, self.p, weights=self.survival_probabilities, dim=-1
-        )
+        return self._moments()[1][..., 4, 5]
 
     @property
     def cov_xp(self) -> torch.Tensor:
@@ -1860,9 +2046,7 @@ class ParticleBeam(Beam):
         Returns the covariance between x and p. :math:`\sigma_{x, p}^2`.
         It is weighted by the survival probability of the particles.
         """
-        return unbiased_weighted_covariance(
-            self.x, self.p, weights=self.survival_probabilities, dim=-1
-        )
+        return self._moments()[1][..., 0, 5]
 
     @property
     def cov_pxp(self) -> torch.Tensor:
@@ -1870,9 +2054,7 @@ class ParticleBeam(Beam):
         Returns the covariance between px and p. :math:`\sigma_{px, p}^2`.
         It is weighted by the survival probability of the particles.
         """
-        return unbiased_weighted_covariance(
-            self.px, self.p, weights=self.survival_probabilities, dim=-1
-        )
+        return self._moments()[1][..., 1, 5]
 
     @property
     def cov_yp(self) -> torch.Tensor:
@@ -1880,9 +2062,7 @@ class ParticleBeam(Beam):
         Returns the covariance between y and p. :math:`\sigma_{y, p}^2`.
         It is weighted by the survival probability of the particles.
         """
-        return unbiased_weighted_covariance(
-            self.y, self.p, weights=self.survival_probabilities, dim=-1
-        )
+        return self._moments()[1][..., 2, 5]
 
     @property
     def cov_pyp(self) -> torch.Tensor:
@@ -1890,57 +2070,39 @@ class ParticleBeam(Beam):
         Returns the covariance between py and p. :math:`\sigma_{py, p}^2`.
         It is weighted by the survival probability of the particles.
         """
-        return unbiased_weighted_covariance(
-            self.py, self.p, weights=self.survival_probabilities, dim=-1
-        )
+        return self._moments()[1][..., 3, 5]
 
     @property
     def cov_xy(self) -> torch.Tensor:
-        return unbiased_weighted_covariance(
-            self.x, self.y, weights=self.survival_probabilities, dim=-1
-        )
+        return self._moments()[1][..., 0, 2]
 
     @property
     def cov_xpy(self) -> torch.Tensor:
-        return unbiased_weighted_covariance(
-            self.x, self.py, weights=self.survival_probabilities, dim=-1
-        )
+        return self._moments()[1][..., 0, 3]
 
     @property
     def cov_xtau(self) -> torch.Tensor:
-        return unbiased_weighted_covariance(
-            self.x, self.tau, weights=self.survival_probabilities, dim=-1
-        )
+        return self._moments()[1][..., 0, 4]
 
     @property
     def cov_pxy(self) -> torch.Tensor:
-        return unbiased_weighted_covariance(
-            self.px, self.y, weights=self.survival_probabilities, dim=-1
-        )
+        return self._moments()[1][..., 1, 2]
 
     @property
     def cov_pxpy(self) -> torch.Tensor:
-        return unbiased_weighted_covariance(
-            self.px, self.py, weights=self.survival_probabilities, dim=-1
-        )
+        return self._moments()[1][..., 1, 3]
 
     @property
     def cov_pxtau(self) -> torch.Tensor:
-        return unbiased_weighted_covariance(
-            self.px, self.tau, weights=self.survival_probabilities, dim=-1
-        )
+        return self._moments()[1][..., 1, 4]
 
     @property
     def cov_ytau(self) -> torch.Tensor:
-        return unbiased_weighted_covariance(
-            self.y, self.tau, weights=self.survival_probabilities, dim=-1
-        )
+        return self._moments()[1][..., 2, 4]
 
     @property
     def cov_pytau(self) -> torch.Tensor:
-        return unbiased_weighted_covariance(
-            self.py, self.tau, weights=self.survival_probabilities, dim=-1
-        )
+        return self._moments()[1][..., 3, 4]
 
     @property
     def energies(self) -> torch.Tensor:
@@ -1964,24 +2126,28 @@ class ParticleBeam(Beam):
         ]
 
     def clone(self) -> "ParticleBeam":
-        return self.__class__(
-            particles=self.particles.clone(),
+        beam = self.__class__(
+            particles=self._particle_storage.clone(),
             energy=self.energy.clone(),
             particle_charges=self.particle_charges.clone(),
             survival_probabilities=self.survival_probabilities.clone(),
             s=self.s.clone(),
             species=self.species.clone(),
         )
+        beam.num_dropped_particles = self.num_dropped_particles
+
+        return beam
 
     def __getitem__(self, item: int | slice | torch.Tensor) -> "ParticleBeam":
         vector_shape = torch.broadcast_shapes(
-            self.particles.shape[:-2],
+            self._particle_storage.shape[:-2],
             self.energy.shape,
             self.particle_charges.shape[:-1],
             self.survival_probabilities.shape[:-1],
         )
         broadcasted_particles = torch.broadcast_to(
-            self.particles, (*vector_shape, self.num_particles, 7)
+            self._particle_storage,
+            (*vector_shape, *self._particle_storage.shape[-2:]),
         )
         broadcasted_energy = torch.broadcast_to(self.energy, vector_shape)
         broadcasted_particle_charges = torch.broadcast_to(
@@ -1996,8 +2162,8 @@ class ParticleBeam(Beam):
             energy=broadcasted_energy[item],
             particle_charges=broadcasted_particle_charges[item],
             survival_probabilities=broadcasted_survival_probabilities[item],
-            device=self.particles.device,
-            dtype=self.particles.dtype,
+            device=self._particle_storage.device,
+            dtype=self._particle_storage.dtype,
         )
 
     def __repr__(self) -> str:
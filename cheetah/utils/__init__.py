@@ -1,19 +1,38 @@
 from . import autograd, bmadx  # noqa: F401
-from .cache import cache_transfer_map  # noqa: F401
-from .cloud_in_cell import cloud_in_cell_charge_deposition  # noqa: F401
+from .backend import get_backend, set_backend  # noqa: F401
+from .cache import (  # noqa: F401
+    cache_transfer_map,
+    set_transfer_map_cache_capacity,
+    set_transfer_map_cache_memory_budget,
+)
+from .cloud_in_cell import (  # noqa: F401
+    CloudInCellStencil,
+    cloud_in_cell_charge_deposition,
+    nearest_grid_point_charge_deposition,
+)
 from .device import is_mps_available_and_functional  # noqa: F401
 from .elementwise_linspace import elementwise_linspace  # noqa: F401
-from .kde import kde_histogram_1d, kde_histogram_2d  # noqa: F401
+from .gaussian_histogram import gaussian_histogram_2d  # noqa: F401
+from .kde import (  # noqa: F401
+    binned_kde_histogram_2d,
+    kde_histogram_1d,
+    kde_histogram_2d,
+)
+from .loss_map import LossMap  # noqa: F401
+from .matrix_scan import cumulative_matrix_product, matrix_product  # noqa: F401
 from .names import UniqueNameGenerator, merge_element_names  # noqa: F401
 from .physics import compute_relativistic_factors  # noqa: F401
 from .plot import (  # noqa: F401
     format_axis_as_percentage,
     format_axis_with_prefixed_unit,
 )
+from .profiler import profiling  # noqa: F401
+from .reversible import reversible_linear_tracking  # noqa: F401
 from .statistics import (  # noqa: F401
     match_distribution_moments,
     unbiased_weighted_covariance,
     unbiased_weighted_covariance_matrix,
+    unbiased_weighted_mean_and_covariance_matrix,
     unbiased_weighted_std,
     unbiased_weighted_variance,
 )
@@ -23,6 +42,7 @@ from .warnings import (  # noqa: F401
     DirtyNameWarning,
     NoBeamPropertiesInLatticeWarning,
     NotUnderstoodPropertyWarning,
+    PerformanceWarning,
     PhysicsWarning,
     UnknownElementWarning,
     VisualizationWarning,
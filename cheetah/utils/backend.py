@@ -0,0 +1,86 @@
+import functools
+import warnings
+from typing import Callable, Literal
+
+import torch
+
+from cheetah.utils.warnings import PerformanceWarning
+
+_SUPPORTED_BACKENDS = ("eager", "compiled")
+
+_backend = "eager"
+
+
+def set_backend(backend: Literal["eager", "compiled"]) -> None:
+    """
+    Set the backend used to run the elementwise kernels of Cheetah's tracking methods,
+    such as the Bmad-X tracking utilities used by `"drift_kick_drift"` tracking.
+
+    With the `"eager"` backend (default), every tensor operation is run on its own and
+    materialises a temporary tensor the size of the beam. With the `"compiled"` backend,
+    the kernels are compiled with `torch.compile`, which fuses their chains of
+    elementwise operations into single loops and thereby greatly reduces memory
+    traffic for large beams.
+
+    NOTE: Compiling a kernel takes some time on its first call, and again whenever it
+        is called with tensors of a new shape or data type. If compilation is not
+        available, e.g. because no C++ compiler is installed, a `PerformanceWarning`
+        is raised and the kernel falls back to the eager backend.
+
+    :param backend: Name of the backend, either `"eager"` or `"compiled"`.
+    """
+    global _backend
+
+    if backend not in _SUPPORTED_BACKENDS:
+        raise ValueError(
+            f"Invalid backend {backend}. Supported backends are {_SUPPORTED_BACKENDS}."
+        )
+    _backend = backend
+
+
+def get_backend() -> Literal["eager", "compiled"]:
+    """Get the name of the backend currently in use."""
+    return _backend
+
+
+def compilable(function: Callable) -> Callable:
+    """
+    Decorator for kernels that are compiled with `torch.compile` when the `"compiled"`
+    backend is selected with `set_backend`, and run eagerly otherwise. Compilation
+    happens lazily on the first call with the `"compiled"` backend. If it fails, a
+    `PerformanceWarning` is raised and the kernel permanently falls back to eager mode.
+    """
+    compiled_function = None
+    is_compilation_failed = False
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        nonlocal compiled_function, is_compilation_failed
+
+        # Kernels called from other kernels are compiled as part of those
+        if (
+            _backend == "eager"
+            or is_compilation_failed
+            or torch.compiler.is_compiling()
+        ):
+            return function(*args, **kwargs)
+
+        try:
+            if compiled_function is None:
+                compiled_function = torch.compile(function)
+            return compiled_function(*args, **kwargs)
+        except Exception as error:
+            # Errors that are not caused by compilation are raised again by eager mode
+            result = function(*args, **kwargs)
+
+            is_compilation_failed = True
+            warnings.warn(
+                f"Compiling {function.__qualname__} failed with {repr(error)}. Falling "
+                "back to eager mode.",
+                category=PerformanceWarning,
+                stacklevel=2,
+            )
+
+            return result
+
+    return wrapper
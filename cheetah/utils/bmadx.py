@@ -1,9 +1,12 @@
 import torch
 from scipy.constants import speed_of_light
 
+from cheetah.utils.backend import compilable
+
 double_precision_epsilon = torch.finfo(torch.float64).eps
 
 
+@compilable
 def cheetah_to_bmad_z_pz(
     tau: torch.Tensor, delta: torch.Tensor, ref_energy: torch.Tensor, mc2: float
 ) -> torch.Tensor:
@@ -29,6 +32,7 @@ def cheetah_to_bmad_z_pz(
     return z, pz, p0c
 
 
+@compilable
 def bmad_to_cheetah_z_pz(
     z: torch.Tensor, pz: torch.Tensor, p0c: torch.Tensor, mc2: float
 ) -> tuple[torch.Tensor]:
@@ -54,6 +58,7 @@ def bmad_to_cheetah_z_pz(
     return tau, delta, ref_energy
 
 
+@compilable
 def cheetah_to_bmad_coords(
     cheetah_coords: torch.Tensor, ref_energy: torch.Tensor, mc2: torch.Tensor
 ) -> torch.Tensor:
@@ -82,6 +87,7 @@ def cheetah_to_bmad_coords(
     return bmad_coords, p0c
 
 
+@compilable
 def bmad_to_cheetah_coords(
     bmad_coords: torch.Tensor, p0c: torch.Tensor, mc2: torch.Tensor
 ) -> torch.Tensor:
@@ -111,6 +117,7 @@ def bmad_to_cheetah_coords(
     return cheetah_coords, ref_energy
 
 
+@compilable
 def offset_particle_set(
     x_offset: torch.Tensor,
     y_offset: torch.Tensor,
@@ -144,6 +151,7 @@ def offset_particle_set(
     return x_ele, px_ele, y_ele, py_ele
 
 
+@compilable
 def offset_particle_unset(
     x_offset: torch.Tensor,
     y_offset: torch.Tensor,
@@ -177,6 +185,7 @@ def offset_particle_unset(
     return x_lab, px_lab, y_lab, py_lab
 
 
+@compilable
 def low_energy_z_correction(
     pz: torch.Tensor, p0c: torch.Tensor, mc2: torch.Tensor, ds: torch.Tensor
 ) -> torch.Tensor:
@@ -215,6 +224,7 @@ def low_energy_z_correction(
     return dz
 
 
+@compilable
 def calculate_quadrupole_coefficients(
     k1: torch.Tensor,
     length: torch.Tensor,
@@ -261,6 +271,7 @@ def sqrt_one(x):
     return x / rad
 
 
+@compilable
 def track_a_drift(
     length: torch.Tensor,
     x_in: torch.Tensor,
@@ -296,6 +307,7 @@ def track_a_drift(
     return x_out, y_out, z_out
 
 
+@compilable
 def particle_rf_time(z, pz, p0c, mc2):
     """Returns rf time of Particle p."""
     beta = (
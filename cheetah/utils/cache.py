@@ -1,7 +1,25 @@
 import functools
+import weakref
+from collections import OrderedDict
 
 import torch
 
+from cheetah.utils.profiler import get_active_profile
+from cheetah.utils.transfer_map_structure import register_cached_transfer_map
+
+# Maximum number of transfer maps cached per element and transfer map method
+_capacity = 4
+# Maximum number of bytes taken up by cached transfer maps of all elements together. If
+# `None`, the memory taken up by cached transfer maps is not limited.
+_memory_budget = None
+_memory_usage = 0
+# All cached entries of all elements in least recently used order, used to evict
+# entries when the memory budget is exceeded
+_entries_lru = OrderedDict()
+# Number of dimensions of the transfer maps returned by the transfer map methods that
+# can be built in batches, in addition to their vector dimensions
+_num_transfer_map_dims = {"first_order_transfer_map": 2, "second_order_transfer_map": 3}
+
 
 def cache_transfer_map(func):
     """
@@ -14,55 +32,466 @@ def cache_transfer_map(func):
     @functools.wraps(func)
     def wrapper(self: Element, energy: torch.Tensor, species: Species) -> torch.Tensor:
         # Caching is not supported if any of input tensors require gradients
-        if any(
-            x.requires_grad
-            for x in (energy, species.num_elementary_charges, species.mass_eV)
-        ):
+        if not is_caching_supported(energy, species):
             return func(self, energy, species)
 
-        if not hasattr(self, "_cache"):
-            self._cache = {}
-        if func.__name__ not in self._cache:
-            self._cache[func.__name__] = {}
-        cache = self._cache[func.__name__]
+        cache = _get_cache(self, func.__name__)
+        feature_validity_key = _feature_validity_key(self)
 
-        # Build a validity key to check if element features have changed
-        feature_validity_key = tuple()
-        for feature_name in self.defining_features:
-            feature = getattr(self, feature_name)
-            if isinstance(feature, torch.Tensor):
-                feature_validity_key += (
-                    id(feature),
-                    feature._version,
-                    feature.requires_grad,
-                )
-            else:
-                feature_validity_key += (feature,)
-
-        # Recompute the transfer map if element features have changed
-        if feature_validity_key != cache.get("feature_validity_key", None) or any(
-            not (
-                passed.dtype == cached.dtype
-                and passed.device == cached.device
-                and passed.requires_grad == cached.requires_grad
-                and torch.equal(passed, cached)
+        # Recompute the transfer map if it was not cached for the current element
+        # features, energy and species
+        entry = _lookup_in_cache(cache, feature_validity_key, energy, species)
+        is_hit = entry is not None
+        is_rebuild = not is_hit and len(cache.entries) > 0
+        if not is_hit:
+            entry = _store_in_cache(
+                cache,
+                func(self, energy, species),
+                feature_validity_key,
+                energy,
+                species,
             )
-            for passed, cached in zip(
-                (energy, species.num_elementary_charges, species.mass_eV),
-                (
-                    cache.get("energy"),
-                    cache.get("num_elementary_charges"),
-                    cache.get("mass_eV"),
-                ),
+
+        profile = get_active_profile()
+        if profile is not None:
+            profile.record_cache_access(self, is_hit, is_rebuild, entry.result)
+
+        return entry.result
+
+    return wrapper
+
+
+def is_caching_supported(
+    energy: torch.Tensor, species: "Species"  # noqa: F821
+) -> bool:
+    """
+    Check if transfer maps computed for the passed energy and species can be cached.
+    This is not the case if any of the input tensors require gradients.
+    """
+    return not any(
+        x.requires_grad
+        for x in (energy, species.num_elementary_charges, species.mass_eV)
+    )
+
+
+def is_transfer_map_cached(
+    element: "Element",  # noqa: F821
+    method_name: str,
+    energy: torch.Tensor,
+    species: "Species",  # noqa: F821
+) -> bool:
+    """
+    Check if the element has a valid cached result of the transfer map method
+    `method_name` for the passed energy and species.
+    """
+    return (
+        is_caching_supported(energy, species)
+        and _lookup_in_cache(
+            _get_cache(element, method_name),
+            _feature_validity_key(element),
+            energy,
+            species,
+        )
+        is not None
+    )
+
+
+def store_cached_transfer_map(
+    element: "Element",  # noqa: F821
+    method_name: str,
+    result: torch.Tensor,
+    energy: torch.Tensor,
+    species: "Species",  # noqa: F821
+) -> None:
+    """
+    Write a transfer map computed outside of the element, e.g. in a batch together with
+    other elements, into the element's cache for the transfer map method `method_name`,
+    as if it had been computed by the element for the passed energy and species.
+    """
+    if not is_caching_supported(energy, species):
+        return
+
+    _store_in_cache(
+        _get_cache(element, method_name),
+        result,
+        _feature_validity_key(element),
+        energy,
+        species,
+    )
+
+
+def set_transfer_map_cache_capacity(capacity: int) -> None:
+    """
+    Set the maximum number of transfer maps cached per element and transfer map method.
+    Caching several transfer maps per element avoids recomputing them when alternating
+    between a small set of beam energies or particle species, e.g. during an energy
+    scan. When the capacity is exceeded, the least recently used transfer map of the
+    element is evicted.
+
+    :param capacity: Maximum number of cached transfer maps per element and method.
+        Must be at least 1. Defaults to 4.
+    """
+    global _capacity
+
+    if capacity < 1:
+        raise ValueError("The transfer map cache capacity must be at least 1.")
+
+    _capacity = capacity
+
+
+def set_transfer_map_cache_memory_budget(memory_budget: int | None) -> None:
+    """
+    Set the maximum memory taken up by the cached transfer maps of all elements
+    together. When the budget is exceeded, the least recently used transfer maps across
+    all elements are evicted.
+
+    :param memory_budget: Maximum memory of all cached transfer maps in bytes. If
+        `None` (default), the memory taken up by cached transfer maps is only limited
+        by the capacity per element.
+    """
+    global _memory_budget
+
+    _memory_budget = memory_budget
+    _enforce_memory_budget()
+
+
+class _TransferMapCache:
+    """Cached results of one transfer map method of one element."""
+
+    def __init__(self) -> None:
+        # Entries in least recently used order
+        self.entries = []
+
+    def __getstate__(self) -> dict:
+        # Cached entries are neither copied nor pickled, copies start out empty
+        return {}
+
+    def __setstate__(self, state: dict) -> None:
+        self.entries = []
+
+
+class _TransferMapCacheEntry:
+    """Transfer map cached together with what it is valid for."""
+
+    def __init__(
+        self,
+        cache: _TransferMapCache,
+        result: torch.Tensor,
+        feature_validity_key: tuple,
+        energy: torch.Tensor,
+        species: "Species",  # noqa: F821
+    ) -> None:
+        self.cache_ref = weakref.ref(cache)
+        self.result = result
+        self.feature_validity_key = feature_validity_key
+        self.energy = energy.clone()
+        self.num_elementary_charges = species.num_elementary_charges.clone()
+        self.mass_eV = species.mass_eV.clone()
+        self.input_refs = _input_refs(
+            (energy, species.num_elementary_charges, species.mass_eV)
+        )
+        self.nbytes = result.nbytes if isinstance(result, torch.Tensor) else 0
+
+
+def _get_cache(element: "Element", method_name: str) -> _TransferMapCache:  # noqa: F821
+    """Get the cache of an element's transfer map method, creating it if needed."""
+    if not hasattr(element, "_cache"):
+        element._cache = {}
+    if method_name not in element._cache:
+        element._cache[method_name] = _TransferMapCache()
+    return element._cache[method_name]
+
+
+def _feature_validity_key(element: "Element") -> tuple:  # noqa: F821
+    """Build a validity key to check if element features have changed."""
+    feature_validity_key = (element.defining_features_version,)
+    for feature_name in element._frozen_defining_features[0]:
+        feature = getattr(element, feature_name)
+        if isinstance(feature, torch.Tensor):
+            feature_validity_key += (
+                id(feature),
+                feature._version,
+                feature.requires_grad,
             )
+        else:
+            feature_validity_key += (feature,)
+    return feature_validity_key
+
+
+def _is_entry_identical(
+    entry: _TransferMapCacheEntry,
+    feature_validity_key: tuple,
+    inputs: tuple[torch.Tensor, ...],
+) -> bool:
+    """
+    Check if the cached entry was computed for the same element features and the very
+    same energy and species tensors, which have not been modified since. This check
+    does not launch any comparison kernels and so never synchronises with the device.
+    """
+    return feature_validity_key == entry.feature_validity_key and all(
+        ref() is passed and passed._version == version
+        for (ref, version), passed in zip(entry.input_refs, inputs)
+    )
+
+
+def _is_entry_equal(
+    entry: _TransferMapCacheEntry,
+    feature_validity_key: tuple,
+    inputs: tuple[torch.Tensor, ...],
+) -> bool:
+    """
+    Check if the cached entry was computed for the same element features and energy and
+    species tensors of equal value.
+    """
+    return feature_validity_key == entry.feature_validity_key and all(
+        passed.dtype == cached.dtype
+        and passed.device == cached.device
+        and passed.requires_grad == cached.requires_grad
+        and torch.equal(passed, cached)
+        for passed, cached in zip(
+            inputs, (entry.energy, entry.num_elementary_charges, entry.mass_eV)
+        )
+    )
+
+
+def _lookup_in_cache(
+    cache: _TransferMapCache,
+    feature_validity_key: tuple,
+    energy: torch.Tensor,
+    species: "Species",  # noqa: F821
+) -> _TransferMapCacheEntry | None:
+    """
+    Find the cached entry for the current element features, energy and species, and
+    mark it as most recently used. Returns `None` if there is no such entry.
+
+    Entries are first matched by the identity and version of the energy and species
+    tensors. Only if that fails, the values of the tensors are compared.
+    """
+    inputs = (energy, species.num_elementary_charges, species.mass_eV)
+
+    entry = next(
+        (
+            entry
+            for entry in reversed(cache.entries)
+            if _is_entry_identical(entry, feature_validity_key, inputs)
+        ),
+        None,
+    )
+    if entry is None:
+        entry = next(
+            (
+                entry
+                for entry in reversed(cache.entries)
+                if _is_entry_equal(entry, feature_validity_key, inputs)
+            ),
+            None,
+        )
+        if entry is None:
+            return None
+
+        # Remember the passed tensors, so that the next lookup with them is fast
+        entry.input_refs = _input_refs(inputs)
+
+    if entry is not cache.entries[-1]:
+        cache.entries.remove(entry)
+        cache.entries.append(entry)
+    _entries_lru.move_to_end(id(entry))
+
+    return entry
+
+
+def _input_refs(inputs: tuple[torch.Tensor, ...]) -> list[tuple[weakref.ref, int]]:
+    """Weak references to the input tensors along with their current versions."""
+    return [(weakref.ref(tensor), tensor._version) for tensor in inputs]
+
+
+def _store_in_cache(
+    cache: _TransferMapCache,
+    result: torch.Tensor,
+    feature_validity_key: tuple,
+    energy: torch.Tensor,
+    species: "Species",  # noqa: F821
+) -> _TransferMapCacheEntry:
+    """Store a computed result in the cache along with what it is valid for."""
+    global _memory_usage
+
+    # Entries for outdated element features can never be valid again
+    for entry in [
+        entry
+        for entry in cache.entries
+        if entry.feature_validity_key != feature_validity_key
+    ]:
+        _evict(entry)
+
+    entry = _TransferMapCacheEntry(cache, result, feature_validity_key, energy, species)
+    cache.entries.append(entry)
+    if isinstance(result, torch.Tensor):
+        register_cached_transfer_map(result)
+    _entries_lru[id(entry)] = weakref.ref(
+        entry, functools.partial(_forget_entry, id(entry), entry.nbytes)
+    )
+    _memory_usage += entry.nbytes
+
+    while len(cache.entries) > _capacity:
+        _evict(cache.entries[0])
+    _enforce_memory_budget()
+
+    return entry
+
+
+def _evict(entry: _TransferMapCacheEntry) -> None:
+    """Remove an entry from the cache it is stored in."""
+    cache = entry.cache_ref()
+    if cache is not None and entry in cache.entries:
+        cache.entries.remove(entry)
+
+
+def _forget_entry(entry_id: int, nbytes: int, _: weakref.ref) -> None:
+    """Stop tracking an entry once it has been garbage collected."""
+    global _memory_usage
+
+    if _entries_lru.pop(entry_id, None) is not None:
+        _memory_usage -= nbytes
+
+
+def _enforce_memory_budget() -> None:
+    """Evict the least recently used entries until the memory budget is met."""
+    global _memory_usage
+
+    while (
+        _memory_budget is not None
+        and _memory_usage > _memory_budget
+        and len(_entries_lru) > 0
+    ):
+        entry_id, entry_ref = _entries_lru.popitem(last=False)
+        entry = entry_ref()
+        if entry is not None:
+            _evict(entry)
+            # The entry is now untracked, so account for it here instead of in
+            # `_forget_entry`
+            _memory_usage -= entry.nbytes
+
+
+def build_transfer_maps_batched(
+    elements: list["Element"],  # noqa: F821
+    method_name: str,
+    energy: torch.Tensor,
+    species: "Species",  # noqa: F821
+) -> None:
+    """
+    Compute the transfer maps of many elements with one call of the underlying map
+    kernel per group of elements of the same type, and store the results in the caches
+    of the individual elements.
+
+    Elements of the same type with equal non-tensor defining features and equally
+    shaped defining tensors are grouped. For each group, the defining tensors are
+    stacked along a new leading "element" dimension into a single vectorised element
+    of the same type, whose transfer map is then computed once and scattered back.
+    Elements that already have a valid cached transfer map, and elements whose
+    `method_name` is not cached, are left untouched, as are all elements if
+    `method_name` is neither `"first_order_transfer_map"` nor
+    `"second_order_transfer_map"`.
+
+    :param elements: Elements for which to build the transfer maps.
+    :param method_name: Name of the transfer map method, e.g.
+        `"first_order_transfer_map"`.
+    :param energy: Reference energy of the incoming beam.
+    :param species: Species of the particles in the incoming beam.
+    """
+    if not is_caching_supported(energy, species) or (
+        method_name not in _num_transfer_map_dims
+    ):
+        return
+
+    groups = {}
+    for element in elements:
+        method = getattr(type(element), method_name, None)
+        if not hasattr(method, "__wrapped__") or is_transfer_map_cached(
+            element, method_name, energy, species
         ):
-            cache["result"] = func(self, energy, species)
+            continue
 
-            cache["feature_validity_key"] = feature_validity_key
-            cache["energy"] = energy.clone()
-            cache["num_elementary_charges"] = species.num_elementary_charges.clone()
-            cache["mass_eV"] = species.mass_eV.clone()
+        group_key = (type(element),)
+        for feature_name in element._frozen_defining_features[0]:
+            feature = getattr(element, feature_name)
+            if isinstance(feature, torch.Tensor):
+                group_key += (
+                    feature_name,
+                    feature.shape,
+                    feature.dtype,
+                    feature.device,
+                    feature.requires_grad,
+                )
+            elif feature_name != "name":
+                group_key += (feature_name, feature)
 
-        return cache["result"]
+        try:
+            groups.setdefault(group_key, []).append(element)
+        except TypeError:  # Unhashable non-tensor feature, cannot group this element
+            continue
 
-    return wrapper
+    for group in groups.values():
+        if len(group) > 1:
+            _build_transfer_maps_for_group(group, method_name, energy, species)
+
+
+def _build_transfer_maps_for_group(
+    group: list["Element"],  # noqa: F821
+    method_name: str,
+    energy: torch.Tensor,
+    species: "Species",  # noqa: F821
+) -> None:
+    """
+    Build the transfer maps for a group of elements of the same type with equally
+    shaped defining tensors in a single batched computation.
+    """
+    reference = group[0]
+    defining_tensors = reference.defining_tensors
+    if len(defining_tensors) == 0:
+        return
+
+    # The element dimension is prepended to the vector dimensions of every feature, so
+    # the vector dimensions of all features and the energy need to be aligned first
+    vector_dims = {
+        feature_name: getattr(reference, feature_name).dim()
+        - reference.UNVECTORIZED_NUM_ATTR_DIMS.get(feature_name, 0)
+        for feature_name in defining_tensors
+    }
+    num_vector_dims = max(
+        *vector_dims.values(),
+        energy.dim(),
+        species.num_elementary_charges.dim(),
+        species.mass_eV.dim(),
+    )
+
+    batched_features = {}
+    for feature_name in reference._frozen_defining_features[0]:
+        if feature_name in defining_tensors:
+            stacked = torch.stack([getattr(element, feature_name) for element in group])
+            batched_features[feature_name] = stacked.view(
+                len(group),
+                *([1] * (num_vector_dims - vector_dims[feature_name])),
+                *stacked.shape[1:],
+            )
+        else:
+            batched_features[feature_name] = getattr(reference, feature_name)
+    batched_element = type(reference)(**batched_features, sanitize_name=False)
+
+    batched_result = getattr(batched_element, method_name)(energy, species)
+
+    # The map of a single element has at most `num_vector_dims` vector dimensions, so
+    # only a batched map with one more dimension has the element dimension. Maps that do
+    # not depend on the stacked features, e.g. the identity of a `Screen`, lack it and
+    # are shared by all elements of the group
+    has_element_dim = (
+        batched_result.dim()
+        == num_vector_dims + 1 + _num_transfer_map_dims[method_name]
+    )
+    for i, element in enumerate(group):
+        store_cached_transfer_map(
+            element,
+            method_name,
+            batched_result[i] if has_element_dim else batched_result,
+            energy,
+            species,
+        )
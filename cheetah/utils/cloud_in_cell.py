@@ -1,8 +1,9 @@
 import itertools
 import math
-from typing import Sequence
+from typing import Literal, Sequence
 
 import torch
+import torch.nn.functional as F
 
 
 def cloud_in_cell_charge_deposition(
@@ -10,10 +11,17 @@ def cloud_in_cell_charge_deposition(
     bins: int | Sequence[int],
     extent: torch.Tensor | None = None,
     charges: torch.Tensor | None = None,
+    backend: Literal["scatter", "sort"] = "scatter",
 ) -> torch.Tensor:
     """
     Fast and differentiable Cloud-in-Cell (CIC) charge deposition.
 
+    NOTE: The `"scatter"` backend adds the contributions of the particles to the grid
+        in an order that may vary between runs, e.g. with the number of threads, so the
+        result is only reproducible up to floating point rounding. The `"sort"` backend
+        of `CloudInCellStencil` sums the contributions in a fixed order and is
+        bitwise reproducible.
+
     :param positions: Tensor of particle positions with shape
         `(..., num_particles, num_hist_dims)`, where `num_hist_dims` is the number of
         spatial dimensions for the charge grid.
@@ -25,9 +33,21 @@ def cloud_in_cell_charge_deposition(
         particles outside the specified extent have their weights set to zero.
     :param charges: Particle charges of shape `(..., num_particles)`. If `None`, all
         particles have charge 1.0.
+    :param backend: Deposition backend, either `"scatter"` (default) or `"sort"`. See
+        `CloudInCellStencil`.
     :return: Charge density on the d-dimensional grid with shape
         `(..., *histogram_shape*)`, where `d = num_hist_dims`.
     """
+    assert backend in [
+        "scatter",
+        "sort",
+    ], f"Invalid backend {backend}. Must be 'scatter' or 'sort'."
+
+    if backend == "sort":
+        return CloudInCellStencil(
+            positions=positions, bins=bins, extent=extent, backend="sort"
+        ).deposit(charges)
+
     if extent is None:
         extent = torch.stack([positions.amin(dim=-2), positions.amax(dim=-2)], dim=-1)
     if charges is None:
@@ -64,6 +84,354 @@ def cloud_in_cell_charge_deposition(
     return charge_grid
 
 
+def nearest_grid_point_charge_deposition(
+    positions: torch.Tensor,
+    bins: int | Sequence[int],
+    extent: torch.Tensor | None = None,
+    charges: torch.Tensor | None = None,
+) -> torch.Tensor:
+    """
+    Fast Nearest-Grid-Point (NGP) charge deposition, i.e. a weighted histogram that is
+    vectorised over arbitrary vector dimensions.
+
+    The bin of every particle is computed as a single flattened index into the grid, so
+    that the charges of all particles are deposited with one `scatter_add`. Like in
+    `torch.histogramdd`, every bin includes its left edge and the rightmost bin also
+    includes its right edge.
+
+    NOTE: The deposited charge density is differentiable with respect to the charges,
+        but not with respect to the positions of the particles. Use
+        `cloud_in_cell_charge_deposition` if gradients with respect to the positions are
+        needed.
+
+    :param positions: Tensor of particle positions with shape
+        `(..., num_particles, num_hist_dims)`, where `num_hist_dims` is the number of
+        spatial dimensions for the charge grid.
+    :param bins: Can be a single int or a sequence of ints of length equal to the number
+        of position tensors, specifying the number of bins in each spatial dimension.
+    :param extent: Tensor of shape (..., num_hist_dims, 2) specifying the leftmost and
+        rightmost bin edges in each spatial dimension. If `None`, the extent is inferred
+        from the min and max of the positions in each spatial dimension. Particles
+        outside the extent are not deposited.
+    :param charges: Particle charges of shape `(..., num_particles)`. If `None`, all
+        particles have charge 1.0.
+    :return: Charge density on the d-dimensional grid with shape
+        `(..., *histogram_shape*)`, where `d = num_hist_dims`.
+    """
+    if extent is None:
+        extent = torch.stack([positions.amin(dim=-2), positions.amax(dim=-2)], dim=-1)
+    if charges is None:
+        charges = torch.ones_like(positions[..., 0])
+
+    num_hist_dims = positions.shape[-1]
+    histogram_shape = [bins] * num_hist_dims if isinstance(bins, int) else bins
+    assert (
+        len(histogram_shape) == num_hist_dims
+    ), "Number of bin values must match number of position dimensions."
+
+    flat_bin_indices = torch.zeros_like(positions[..., 0], dtype=torch.long)
+    in_extent = torch.ones_like(positions[..., 0], dtype=torch.bool)
+    for d in range(num_hist_dims):
+        coord = positions[..., d]
+        extent_left_d = extent[..., d, 0].unsqueeze(-1)
+        extent_right_d = extent[..., d, 1].unsqueeze(-1)
+        num_bins_d = histogram_shape[d]
+
+        bin_indices_d = (
+            (coord - extent_left_d) / (extent_right_d - extent_left_d) * num_bins_d
+        ).floor()
+        in_extent = in_extent & (coord >= extent_left_d) & (coord <= extent_right_d)
+        # Clamping moves particles on the rightmost edge into the last bin
+        flat_bin_indices = (
+            flat_bin_indices * num_bins_d
+            + bin_indices_d.clamp(0, num_bins_d - 1).long()
+        )
+
+    vector_shape = positions.shape[:-2]
+    flat_charge_grid = positions.new_zeros(*vector_shape, math.prod(histogram_shape))
+    flat_charge_grid.scatter_add_(
+        dim=-1,
+        index=flat_bin_indices,
+        src=torch.where(in_extent, charges, torch.zeros_like(charges)),
+    )
+
+    return flat_charge_grid.reshape(*vector_shape, *histogram_shape)
+
+
+class CloudInCellStencil:
+    """
+    Cloud-in-Cell (CIC) stencil of particles on a grid, i.e. the flat indices of the
+    `2^d` grid points surrounding every particle and the particle's weights at these
+    grid points. Computing the stencil once allows to deposit charges onto the grid and
+    to interpolate quantities on the grid back to the particles, e.g. in a
+    particle-in-cell space-charge calculation, without recomputing cell indices and
+    weights in between.
+
+    Like in `cloud_in_cell_charge_deposition`, the grid points are at the centres of
+    the bins. Grid points outside the grid, and all grid points of particles outside the
+    extent, have zero weight.
+
+    Charges are deposited with one of two backends. The `"scatter"` backend adds all
+    contributions to the grid with a single `scatter_add`, which is fastest, but adds
+    them in an order that may vary between runs. The `"sort"` backend sorts the
+    particles by the cell they are in once when the stencil is created, and then sums
+    the contributions of every cell with a segmented reduction in the order of the
+    particles. Its result is bitwise reproducible, and the sort is reused by every
+    deposition with the same stencil. As it is slower than the `"scatter"` backend, it
+    is only used when requested explicitly.
+
+    :param positions: Tensor of particle positions with shape
+        `(..., num_particles, num_hist_dims)`, where `num_hist_dims` is the number of
+        spatial dimensions of the grid.
+    :param bins: Can be a single int or a sequence of ints of length equal to the number
+        of position tensors, specifying the number of bins in each spatial dimension.
+    :param extent: Tensor of shape (..., num_hist_dims, 2) specifying the leftmost and
+        rightmost bin edges in each spatial dimension. If `None`, the extent is inferred
+        from the min and max of the positions in each spatial dimension.
+    :param backend: Deposition backend, either `"scatter"` (default) or `"sort"`.
+    """
+
+    def __init__(
+        self,
+        positions: torch.Tensor,
+        bins: int | Sequence[int],
+        extent: torch.Tensor | None = None,
+        backend: Literal["scatter", "sort"] = "scatter",
+    ) -> None:
+        assert backend in [
+            "scatter",
+            "sort",
+        ], f"Invalid backend {backend}. Must be 'scatter' or 'sort'."
+
+        self.backend = backend
+
+        if extent is None:
+            extent = torch.stack(
+                [positions.amin(dim=-2), positions.amax(dim=-2)], dim=-1
+            )
+
+        num_hist_dims = positions.shape[-1]
+        self.histogram_shape = tuple(
+            [bins] * num_hist_dims if isinstance(bins, int) else bins
+        )
+        assert (
+            len(self.histogram_shape) == num_hist_dims
+        ), "Number of bin values must match number of position dimensions."
+
+        extent_left = extent[..., 0].unsqueeze(-2)
+        extent_right = extent[..., 1].unsqueeze(-2)
+        in_extent = ((positions >= extent_left) & (positions <= extent_right)).all(
+            dim=-1
+        )
+        positions_in_bin_space = (positions - extent_left) / (
+            extent_right - extent_left
+        ) * positions.new_tensor(self.histogram_shape) - 0.5
+        positions_in_bin_space_int_components = positions_in_bin_space.floor()
+        positions_in_bin_space_fractional_components = (
+            positions_in_bin_space - positions_in_bin_space_int_components
+        )
+        offsets = torch.tensor([0, 1], device=positions.device)
+
+        # Build the stencil one dimension at a time, such that the grid points are
+        # ordered like `itertools.product([0, 1], repeat=num_hist_dims)`
+        weights = in_extent.to(positions.dtype).unsqueeze(-1)
+        flat_indices = torch.zeros_like(weights, dtype=torch.long)
+        for d, num_bins_d in enumerate(self.histogram_shape):
+            corner_positions_d = (
+                positions_in_bin_space_int_components[..., d].long().unsqueeze(-1)
+                + offsets
+            )
+            fractional_components_d = positions_in_bin_space_fractional_components[
+                ..., d
+            ]
+            corner_weight_factors_d = torch.stack(
+                [1.0 - fractional_components_d, fractional_components_d], dim=-1
+            ) * ((corner_positions_d >= 0) & (corner_positions_d < num_bins_d))
+
+            weights = weights.unsqueeze(-1) * corner_weight_factors_d.unsqueeze(-2)
+            weights = weights.flatten(start_dim=-2)
+            flat_indices = flat_indices.unsqueeze(-1) * num_bins_d + (
+                corner_positions_d.clamp(0, num_bins_d - 1).unsqueeze(-2)
+            )
+            flat_indices = flat_indices.flatten(start_dim=-2)
+
+        self.flat_indices = flat_indices
+        self.weights = weights
+
+        if self.backend == "sort":
+            self._sort_particles_by_cell(positions_in_bin_space_int_components)
+
+    def _sort_particles_by_cell(self, cell_indices: torch.Tensor) -> None:
+        """
+        Sort the particles by the cell whose lower corner is their first stencil point,
+        and count the particles in every cell, for the `"sort"` backend.
+
+        Cells are indexed on a grid padded by one cell on both sides in every
+        dimension, with particles outside the grid clamped into the padding. The flat
+        index of every stencil point is then the flat index of the particle's cell plus
+        an offset that is the same for all particles, so the contributions to every
+        stencil point are sorted by the same order.
+        """
+        padded_shape = tuple(num_bins_d + 2 for num_bins_d in self.histogram_shape)
+        padded_cell_indices = torch.zeros_like(cell_indices[..., 0], dtype=torch.long)
+        padded_offsets = [0]
+        for d, num_bins_d in enumerate(self.histogram_shape):
+            padded_cell_indices = padded_cell_indices * padded_shape[d] + (
+                cell_indices[..., d].long().clamp(-1, num_bins_d - 1) + 1
+            )
+            padded_offsets = [
+                offset * padded_shape[d] + corner
+                for offset in padded_offsets
+                for corner in (0, 1)
+            ]
+
+        self._padded_shape = padded_shape
+        self._padded_offsets = padded_offsets
+        self._sorted_cell_indices, self._sort_order = padded_cell_indices.sort(
+            dim=-1, stable=True
+        )
+        self._num_particles_per_cell = padded_cell_indices.new_zeros(
+            *padded_cell_indices.shape[:-1], math.prod(padded_shape)
+        ).scatter_add_(
+            dim=-1,
+            index=padded_cell_indices,
+            src=torch.ones_like(padded_cell_indices),
+        )
+
+    def _deposit_sorted(self, contributions: torch.Tensor) -> torch.Tensor:
+        """
+        Deposit the contributions of shape `(..., num_particles, 2^d)` of the particles
+        to their stencil points onto the grid with segmented reductions over the
+        particles sorted by cell, for the `"sort"` backend.
+        """
+        vector_shape = torch.broadcast_shapes(
+            contributions.shape[:-2], self._sort_order.shape[:-1]
+        )
+        contributions = contributions.expand(*vector_shape, *contributions.shape[-2:])
+        sort_order = self._sort_order.expand(*vector_shape, -1)
+
+        sorted_contributions = torch.take_along_dim(
+            contributions, sort_order.unsqueeze(-1), dim=-2
+        )
+        # Sums of the contributions of the particles in every cell to each of the
+        # stencil points, of shape `(..., num_padded_cells, 2^d)`
+        cell_sums = SegmentedSum.apply(
+            sorted_contributions,
+            self._num_particles_per_cell.expand(*vector_shape, -1).contiguous(),
+            self._sorted_cell_indices.expand(*vector_shape, -1),
+        )
+
+        num_padded_cells = cell_sums.shape[-2]
+        flat_padded_charge_grid = sum(
+            F.pad(cell_sums[..., : num_padded_cells - offset, i], (offset, 0))
+            for i, offset in enumerate(self._padded_offsets)
+        )
+
+        return flat_padded_charge_grid.reshape(*vector_shape, *self._padded_shape)[
+            (..., *(slice(1, num_bins_d + 1) for num_bins_d in self.histogram_shape))
+        ]
+
+    def deposit(self, charges: torch.Tensor | None = None) -> torch.Tensor:
+        """
+        Deposit the particles' charges onto the grid, with a single scatter operation
+        or with segmented reductions over the sorted particles depending on the
+        backend.
+
+        :param charges: Particle charges of shape `(..., num_particles)`. If `None`, all
+            particles have charge 1.0.
+        :return: Charge density on the grid with shape `(..., *histogram_shape*)`.
+        """
+        contributions = (
+            self.weights * charges.unsqueeze(-1)
+            if charges is not None
+            else self.weights
+        )
+        if self.backend == "sort":
+            return self._deposit_sorted(contributions)
+
+        contributions, flat_indices = torch.broadcast_tensors(
+            contributions, self.flat_indices
+        )
+
+        vector_shape = contributions.shape[:-2]
+        flat_charge_grid = contributions.new_zeros(
+            *vector_shape, math.prod(self.histogram_shape)
+        )
+        flat_charge_grid.scatter_add_(
+            dim=-1,
+            index=flat_indices.flatten(start_dim=-2),
+            src=contributions.flatten(start_dim=-2),
+        )
+
+        return flat_charge_grid.reshape(*vector_shape, *self.histogram_shape)
+
+    def interpolate(self, grid_values: torch.Tensor) -> torch.Tensor:
+        """
+        Interpolate quantities given on the grid to the particles, gathering all of
+        their components with a single indexing operation.
+
+        :param grid_values: Quantities on the grid with shape
+            `(..., *histogram_shape*, num_components)`.
+        :return: Interpolated quantities at the particles with shape
+            `(..., num_particles, num_components)`.
+        """
+        num_hist_dims = len(self.histogram_shape)
+        flat_grid_values = grid_values.flatten(start_dim=-num_hist_dims - 1, end_dim=-2)
+
+        flat_indices = self.flat_indices.flatten(start_dim=-2).unsqueeze(-1)
+
+        # Align the number of vector dimensions, which are then broadcast
+        num_dims = max(flat_grid_values.dim(), flat_indices.dim())
+        flat_grid_values = flat_grid_values[
+            (None,) * (num_dims - flat_grid_values.dim())
+        ]
+        flat_indices = flat_indices[(None,) * (num_dims - flat_indices.dim())]
+
+        stencil_values = torch.take_along_dim(
+            flat_grid_values, flat_indices, dim=-2
+        ).unflatten(-2, self.flat_indices.shape[-2:])
+
+        return (stencil_values * self.weights.unsqueeze(-1)).sum(dim=-2)
+
+
+class SegmentedSum(torch.autograd.Function):
+    """
+    Custom autograd function for summing the values of particles sorted by cell over
+    every cell, i.e. over contiguous segments of the particle dimension, with
+    `torch.segment_reduce`. Unlike `torch.segment_reduce` itself, it supports
+    forward-mode automatic differentiation.
+    """
+
+    @staticmethod
+    def forward(values, segment_lengths, segment_indices):
+        return torch.segment_reduce(
+            values,
+            "sum",
+            lengths=segment_lengths,
+            axis=segment_lengths.dim() - 1,
+            unsafe=True,
+        )
+
+    @staticmethod
+    def setup_context(ctx, inputs, output):
+        _, segment_lengths, segment_indices = inputs
+        ctx.segment_lengths = segment_lengths
+        ctx.segment_indices = segment_indices
+
+    @staticmethod
+    def backward(ctx, grad_output):
+        grad_values = torch.take_along_dim(
+            grad_output, ctx.segment_indices.unsqueeze(-1), dim=-2
+        )
+        return grad_values, None, None
+
+    @staticmethod
+    def jvp(ctx, values_tangent, segment_lengths_tangent, segment_indices_tangent):
+        return SegmentedSum.forward(
+            values_tangent, ctx.segment_lengths, ctx.segment_indices
+        )
+
+
 def _cloud_in_cell_1d(
     positions: torch.Tensor,
     histogram_shape: Sequence[int],
@@ -0,0 +1,108 @@
+import math
+
+import numpy as np
+import torch
+
+
+def gaussian_histogram_2d(
+    mu: torch.Tensor,
+    cov: torch.Tensor,
+    bin_edges1: torch.Tensor,
+    bin_edges2: torch.Tensor,
+) -> torch.Tensor:
+    """
+    Analytically integrate a bivariate normal distribution over the bins of a 2D
+    histogram, vectorised over arbitrary vector dimensions of the distribution.
+
+    The probability of every bin is the double difference of the bivariate normal
+    cumulative distribution function at the bin edges. This is split into the product of
+    the two marginal distribution functions, whose double difference is the outer
+    product of the marginal probabilities of the bins computed with the error function,
+    and a correction for the correlation of the two dimensions. The correction is
+    computed with the formula of Drezner and Wesolowsky as an integral over the
+    correlation angle with Gauss-Legendre quadrature, using 20 points in double
+    precision and 12 points otherwise, and skipped if the distribution is known to be
+    uncorrelated.
+
+    A distribution with zero width in one of the dimensions is a point mass in that
+    dimension, which falls entirely into the bin containing its mean.
+
+    NOTE: The result is exact to numerical precision for correlation coefficients up to
+        about 0.99 in magnitude. Unlike evaluating the probability density at the bin
+        centres, it stays accurate when the distribution is narrower than a bin. Whether
+        the distribution is uncorrelated is only checked on the CPU, because checking it
+        would synchronise with accelerator devices.
+
+    :param mu: Mean of the distribution of shape `(..., 2)`.
+    :param cov: Covariance matrix of the distribution of shape `(..., 2, 2)`.
+    :param bin_edges1: Edges of the bins along the first dimension of shape
+        `(num_bins1 + 1,)`.
+    :param bin_edges2: Edges of the bins along the second dimension of shape
+        `(num_bins2 + 1,)`.
+    :return: Probability of every bin of shape `(..., num_bins1, num_bins2)`.
+    """
+    is_point_mass1 = cov[..., 0, 0] == 0.0
+    is_point_mass2 = cov[..., 1, 1] == 0.0
+    # Placeholders for zero widths avoid divisions by zero, also in the gradients
+    safe_sigma1 = torch.where(is_point_mass1, 1.0, cov[..., 0, 0]).sqrt()
+    safe_sigma2 = torch.where(is_point_mass2, 1.0, cov[..., 1, 1]).sqrt()
+    # A point mass in one dimension is independent of the other dimension
+    correlation = torch.where(
+        is_point_mass1 | is_point_mass2,
+        0.0,
+        cov[..., 0, 1] / (safe_sigma1 * safe_sigma2),
+    )
+
+    # Bin edges in units of standard deviations from the mean
+    offset_edges1 = bin_edges1 - mu[..., 0].unsqueeze(-1)
+    offset_edges2 = bin_edges2 - mu[..., 1].unsqueeze(-1)
+    standardized_edges1 = offset_edges1 / safe_sigma1.unsqueeze(-1)
+    standardized_edges2 = offset_edges2 / safe_sigma2.unsqueeze(-1)
+
+    marginal_probabilities1 = torch.where(
+        is_point_mass1.unsqueeze(-1),
+        (offset_edges1 > 0.0).to(standardized_edges1.dtype),
+        _standard_normal_cdf(standardized_edges1),
+    ).diff(dim=-1)
+    marginal_probabilities2 = torch.where(
+        is_point_mass2.unsqueeze(-1),
+        (offset_edges2 > 0.0).to(standardized_edges2.dtype),
+        _standard_normal_cdf(standardized_edges2),
+    ).diff(dim=-1)
+    histogram = torch.einsum(
+        "...i,...j->...ij", marginal_probabilities1, marginal_probabilities2
+    )
+
+    if (
+        not cov.requires_grad
+        and cov.device.type == "cpu"
+        and torch.all(correlation == 0.0)
+    ):
+        return histogram
+
+    # Drezner-Wesolowsky: Phi_2(h, k, rho) = Phi(h) * Phi(k) + 1 / (2 pi) *
+    #     int_0^asin(rho) exp(-(h^2 + k^2 - 2 h k sin(t)) / (2 cos^2(t))) dt
+    nodes, weights = np.polynomial.legendre.leggauss(
+        20 if cov.dtype == torch.float64 else 12
+    )
+    correlation_angle = torch.asin(correlation).unsqueeze(-1).unsqueeze(-1)
+    h = standardized_edges1.unsqueeze(-1)
+    k = standardized_edges2.unsqueeze(-2)
+    h_square_plus_k_square = h.square() + k.square()
+    h_times_k = h * k
+
+    correction = torch.zeros_like(h_square_plus_k_square)
+    for node, weight in zip(nodes, weights):
+        angle = correlation_angle * (node + 1.0) / 2
+        correction = correction + weight * torch.exp(
+            -(h_square_plus_k_square - 2 * h_times_k * angle.sin())
+            / (2 * angle.cos().square())
+        )
+    correction = correction * correlation_angle / (4 * math.pi)
+
+    return histogram + correction.diff(dim=-2).diff(dim=-1)
+
+
+def _standard_normal_cdf(x: torch.Tensor) -> torch.Tensor:
+    """Cumulative distribution function of the standard normal distribution."""
+    return 0.5 * (1.0 + torch.erf(x / math.sqrt(2.0)))
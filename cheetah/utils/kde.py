@@ -1,6 +1,10 @@
 import math
+from typing import Literal
 
 import torch
+import torch.nn.functional as F
+
+from cheetah.utils.cloud_in_cell import cloud_in_cell_charge_deposition
 
 
 def _kde_marginal_pdf(
@@ -202,3 +206,92 @@ def kde_histogram_2d(
     joint_pdf = _kde_joint_pdf_2d(kernel_values1, kernel_values2, epsilon=epsilon)
 
     return joint_pdf
+
+
+def binned_kde_histogram_2d(
+    x1: torch.Tensor,
+    x2: torch.Tensor,
+    bins1: torch.Tensor,
+    bins2: torch.Tensor,
+    bandwidth: torch.Tensor,
+    weights: torch.Tensor | None = None,
+    epsilon: float | torch.Tensor = 1e-10,
+    oversampling: int = 3,
+    truncation: float = 4.0,
+    backend: Literal["scatter", "sort"] = "scatter",
+) -> torch.Tensor:
+    """
+    Estimate the 2D histogram of the input tensor with a binned kernel density
+    estimation, which approximates `kde_histogram_2d` at a cost that scales with the
+    number of particles plus the number of bins rather than with their product.
+
+    The particles are first deposited onto a grid that is `oversampling` times finer
+    than the bins with the differentiable `cloud_in_cell_charge_deposition`. The grid is
+    then convolved with the Gaussian kernel by two separable 1D convolutions and sampled
+    at the bin coordinates. The grid is padded by the kernel's radius, so that particles
+    outside of the bins still contribute to the bins near the edges.
+
+    NOTE: The bin coordinates need to be evenly spaced. The additional smoothing by the
+        cloud-in-cell deposition decreases with `oversampling`. With the default of 3,
+        the result deviates from `kde_histogram_2d` by about 0.2% of its maximum for a
+        bandwidth of one bin.
+
+    :param x1: Input tensor to compute the histogram with shape :math:`(B, D1)`.
+    :param x2: Input tensor to compute the histogram with shape :math:`(B, D2)`.
+    :param bins1: Evenly spaced bin coordinates along the first dimension.
+    :param bins2: Evenly spaced bin coordinates along the second dimension.
+    :param bandwidth: Gaussian smoothing factor with shape shape `(1,)`.
+    :param weights: Weights of the input tensor of shape :math:`(B, N)`.
+    :param epsilon: A scalar, for numerical stability. Default: 1e-10.
+    :param oversampling: Odd factor by which the grid the particles are deposited on is
+        finer than the bins.
+    :param truncation: Number of bandwidths after which the Gaussian kernel is cut off.
+    :param backend: Backend of the cloud-in-cell deposition, either `"scatter"`
+        (default) or `"sort"`. See `CloudInCellStencil`.
+    :return: Computed histogram of shape :math:`(B, N_{bins}, N_{bins})`.
+    """
+    assert oversampling % 2 == 1, "Oversampling factor must be odd."
+
+    grid_shape = []
+    extent = []
+    kernels = []
+    for bins in (bins1, bins2):
+        bin_width = (bins[-1] - bins[0]) / (len(bins) - 1)
+        grid_spacing = bin_width / oversampling
+        kernel_radius = math.ceil(truncation * float(bandwidth / grid_spacing))
+
+        kernel_offsets = torch.arange(
+            -kernel_radius, kernel_radius + 1, device=bins.device, dtype=bins.dtype
+        )
+        kernels.append(
+            (-0.5 * (kernel_offsets * grid_spacing / bandwidth).square()).exp()
+        )
+
+        num_grid_points = len(bins) * oversampling + 2 * kernel_radius
+        left_edge = bins[0] - bin_width / 2 - kernel_radius * grid_spacing
+        grid_shape.append(num_grid_points)
+        extent.append(
+            torch.stack([left_edge, left_edge + num_grid_points * grid_spacing])
+        )
+
+    positions = torch.stack(torch.broadcast_tensors(x1, x2), dim=-1)
+    charges = (
+        weights.broadcast_to(positions.shape[:-1])
+        if weights is not None
+        else torch.ones_like(positions[..., 0])
+    )
+    vector_shape = positions.shape[:-2]
+
+    charge_grid = cloud_in_cell_charge_deposition(
+        positions, grid_shape, torch.stack(extent), charges, backend=backend
+    ).reshape(-1, 1, *grid_shape)
+    smoothed_grid = F.conv2d(
+        F.conv2d(charge_grid, kernels[0].view(1, 1, -1, 1)),
+        kernels[1].view(1, 1, 1, -1),
+    )
+    histogram = smoothed_grid[
+        ..., oversampling // 2 :: oversampling, oversampling // 2 :: oversampling
+    ].reshape(*vector_shape, len(bins1), len(bins2))
+
+    normalization = histogram.sum(dim=(-2, -1)).unsqueeze(-1).unsqueeze(-1) + epsilon
+    return histogram / normalization
@@ -0,0 +1,63 @@
+import torch
+
+
+class LossMap:
+    """
+    Record of where the particles of a `ParticleBeam` were lost along a segment, as
+    returned by `Segment.track` with `record_losses=True`. A particle counts as lost at
+    the first element at which its survival probability drops.
+
+    :param element_names: Names of the elements of the flattened segment, in order.
+    :param element_indices: Index into `element_names` of the element at which each
+        particle was lost, or -1 if it was not lost. Shape `(..., num_particles)`.
+    :param s: Position along the beamline at the end of the element at which each
+        particle was lost, or NaN if it was not lost. Shape `(..., num_particles)`.
+    :param num_lost_per_element: Sum of the drops of the particles' survival
+        probabilities at every element, i.e. the number of macroparticles lost at each
+        element. Shape `(..., num_elements)`.
+    """
+
+    def __init__(
+        self,
+        element_names: list[str],
+        element_indices: torch.Tensor,
+        s: torch.Tensor,
+        num_lost_per_element: torch.Tensor,
+    ) -> None:
+        self.element_names = element_names
+        self.element_indices = element_indices
+        self.s = s
+        self.num_lost_per_element = num_lost_per_element
+
+    @property
+    def is_lost(self) -> torch.Tensor:
+        """Mask of the particles that were lost. Shape `(..., num_particles)`."""
+        return self.element_indices >= 0
+
+    @property
+    def num_lost(self) -> torch.Tensor:
+        """Total number of macroparticles lost along the segment."""
+        return self.num_lost_per_element.sum(dim=-1)
+
+    def losses_by_element_name(self) -> dict[str, torch.Tensor]:
+        """
+        Get the number of macroparticles lost at every element that lost any, keyed by
+        the element's name.
+
+        :return: Dictionary mapping element names to the number of macroparticles lost
+            at the element. If several elements share a name, their losses are summed.
+        """
+        losses = {}
+        for i, name in enumerate(self.element_names):
+            num_lost = self.num_lost_per_element[..., i]
+            if (num_lost > 0).any():
+                losses[name] = losses[name] + num_lost if name in losses else num_lost
+        return losses
+
+    def __repr__(self) -> str:
+        return (
+            f"{self.__class__.__name__}(element_names={repr(self.element_names)}, "
+            + f"element_indices={repr(self.element_indices)}, "
+            + f"s={repr(self.s)}, "
+            + f"num_lost_per_element={repr(self.num_lost_per_element)})"
+        )
@@ -0,0 +1,65 @@
+import torch
+
+
+def cumulative_matrix_product(matrices: torch.Tensor) -> torch.Tensor:
+    """
+    Compute all cumulative products of a sequence of matrices using a parallel prefix
+    (associative) scan. The matrices are multiplied from the left, as is the case when
+    composing transfer maps along a beamline, i.e. the `i`-th output is
+    `matrices[i] @ ... @ matrices[1] @ matrices[0]`.
+
+    Instead of `n` sequential matrix multiplications, the scan only needs
+    `ceil(log2(n))` batched matrix multiplications.
+
+    :param matrices: Tensor of shape `(..., n, k, k)` holding the `n` matrices of the
+        sequence along the third to last dimension.
+    :return: Tensor of shape `(..., n, k, k)` holding the `n` cumulative products.
+    """
+    num_matrices = matrices.shape[-3]
+
+    result = matrices
+    offset = 1
+    while offset < num_matrices:
+        result = torch.cat(
+            (
+                result[..., :offset, :, :],
+                result[..., offset:, :, :] @ result[..., :-offset, :, :],
+            ),
+            dim=-3,
+        )
+        offset *= 2
+
+    return result
+
+
+def matrix_product(matrices: torch.Tensor) -> torch.Tensor:
+    """
+    Compute the product of a sequence of matrices using a pairwise tree reduction. The
+    matrices are multiplied from the left, as is the case when composing transfer maps
+    along a beamline, i.e. the result is `matrices[n-1] @ ... @ matrices[0]`.
+
+    Instead of `n` sequential matrix multiplications, the reduction only needs
+    `ceil(log2(n))` batched matrix multiplications.
+
+    :param matrices: Tensor of shape `(..., n, k, k)` holding the `n` matrices of the
+        sequence along the third to last dimension.
+    :return: Tensor of shape `(..., k, k)` holding the product of all matrices, or the
+        identity if the sequence is empty.
+    """
+    if matrices.shape[-3] == 0:
+        return torch.eye(
+            matrices.shape[-1], device=matrices.device, dtype=matrices.dtype
+        ).expand(*matrices.shape[:-3], -1, -1)
+
+    result = matrices
+    while result.shape[-3] > 1:
+        if result.shape[-3] % 2 == 1:
+            # Pad with the identity, so that the last matrix has a partner
+            identity = torch.eye(
+                result.shape[-1], device=result.device, dtype=result.dtype
+            ).expand(*result.shape[:-3], 1, -1, -1)
+            result = torch.cat((result, identity), dim=-3)
+
+        result = result[..., 1::2, :, :] @ result[..., 0::2, :, :]
+
+    return result.squeeze(-3)
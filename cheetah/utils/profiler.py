@@ -0,0 +1,254 @@
+import json
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Iterator
+
+import torch
+
+_active_profile = None
+
+
+@contextmanager
+def profiling() -> Iterator["TrackingProfile"]:
+    """
+    Context manager to profile tracking through Cheetah lattices.
+
+    Inside this context, every element tracked by a `Segment` is timed, transfer map
+    cache hits, misses and rebuilds are counted, and the memory allocated for outgoing
+    beams and transfer maps is recorded per element. Runs of consecutive skippable
+    elements, which are tracked with a single merged transfer map, appear as one entry
+    named after their first and last element. Each tracked element is additionally
+    wrapped in a `torch.profiler.record_function` range named after it, so that it shows
+    up in traces recorded with `torch.profiler`.
+
+    Example:
+    ```python
+    with cheetah.profiling() as profile:
+        segment.track(incoming)
+
+    print(profile.summary(sort_by="total_time"))
+    profile.export_chrome_trace("trace.json")
+    ```
+
+    NOTE: Times are measured as wall time on the host. On accelerator backends, where
+        kernels are launched asynchronously, use the `record_function` ranges together
+        with `torch.profiler` to measure device time.
+
+    :return: Profile that is filled while the context is active.
+    """
+    global _active_profile
+
+    profile = TrackingProfile()
+    previous = _active_profile
+    _active_profile = profile
+    try:
+        yield profile
+    finally:
+        _active_profile = previous
+
+
+def get_active_profile() -> "TrackingProfile | None":
+    """Get the profile currently being recorded, or `None` if profiling is off."""
+    return _active_profile
+
+
+class ElementProfile:
+    """Profiling results of a single element (or run of merged elements)."""
+
+    def __init__(self, name: str, element_type: str) -> None:
+        self.name = name
+        self.element_type = element_type
+        self.num_calls = 0
+        self.total_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.num_map_rebuilds = 0
+        self.allocated_bytes = 0
+
+    @property
+    def mean_time(self) -> float:
+        """Mean wall time per call in seconds."""
+        return self.total_time / self.num_calls if self.num_calls > 0 else 0.0
+
+    def __repr__(self) -> str:
+        return (
+            f"{self.__class__.__name__}(name={repr(self.name)}, "
+            + f"element_type={repr(self.element_type)}, "
+            + f"num_calls={self.num_calls}, "
+            + f"total_time={self.total_time}, "
+            + f"cache_hits={self.cache_hits}, "
+            + f"cache_misses={self.cache_misses}, "
+            + f"num_map_rebuilds={self.num_map_rebuilds}, "
+            + f"allocated_bytes={self.allocated_bytes})"
+        )
+
+
+class TrackingProfile:
+    """
+    Profiling results recorded while `profiling` was active. Results are collected per
+    element in `elements`, and can be summarised with `summary` or exported as a Chrome
+    trace with `export_chrome_trace`.
+    """
+
+    # Columns of the summary table as attribute: (header, format, scale)
+    _SUMMARY_COLUMNS = {
+        "name": ("Element", "{}", None),
+        "element_type": ("Type", "{}", None),
+        "num_calls": ("Calls", "{}", None),
+        "total_time": ("Total [ms]", "{:.3f}", 1e3),
+        "mean_time": ("Mean [ms]", "{:.3f}", 1e3),
+        "cache_hits": ("Cache hits", "{}", None),
+        "cache_misses": ("Cache misses", "{}", None),
+        "num_map_rebuilds": ("Map rebuilds", "{}", None),
+        "allocated_bytes": ("Allocated [kB]", "{:.1f}", 1e-3),
+    }
+
+    def __init__(self) -> None:
+        self._element_profiles = {}
+        self._trace_events = []
+        self._start_time = time.perf_counter()
+
+    @property
+    def elements(self) -> list[ElementProfile]:
+        """Profiling results of all recorded elements in the order first seen."""
+        return list(self._element_profiles.values())
+
+    def _get_element_profile(self, element: Any) -> ElementProfile:
+        """Get the profile of an element, creating it if needed."""
+        if id(element) not in self._element_profiles:
+            self._element_profiles[id(element)] = ElementProfile(
+                name=element.name, element_type=element.__class__.__name__
+            )
+        return self._element_profiles[id(element)]
+
+    def record_tracking(
+        self, element: Any, track: Callable[[Any], Any], incoming: Any
+    ) -> Any:
+        """
+        Track a beam through an element with the passed tracking function and record
+        the time it took and the memory allocated for the outgoing beam.
+        """
+        element_profile = self._get_element_profile(element)
+
+        with torch.profiler.record_function(element_profile.name):
+            start = time.perf_counter()
+            outgoing = track(incoming)
+            end = time.perf_counter()
+
+        element_profile.num_calls += 1
+        element_profile.total_time += end - start
+        element_profile.allocated_bytes += _newly_allocated_bytes(incoming, outgoing)
+
+        self._trace_events.append(
+            {
+                "name": element_profile.name,
+                "cat": element_profile.element_type,
+                "ph": "X",
+                "ts": (start - self._start_time) * 1e6,
+                "dur": (end - start) * 1e6,
+                "pid": 0,
+                "tid": 0,
+            }
+        )
+
+        return outgoing
+
+    def record_cache_access(
+        self, element: Any, is_hit: bool, is_rebuild: bool, result: Any = None
+    ) -> None:
+        """
+        Record an access to an element's transfer map cache. A rebuild is a miss for an
+        element that had a cached transfer map before, e.g. for different settings.
+        """
+        element_profile = self._get_element_profile(element)
+
+        if is_hit:
+            element_profile.cache_hits += 1
+        else:
+            element_profile.cache_misses += 1
+            element_profile.num_map_rebuilds += int(is_rebuild)
+            if isinstance(result, torch.Tensor):
+                element_profile.allocated_bytes += result.nbytes
+
+    def summary(self, sort_by: str = "total_time", num_rows: int | None = None) -> str:
+        """
+        Summarise the profiling results as a table with one row per element.
+
+        :param sort_by: Name of the `ElementProfile` attribute to sort the rows by in
+            descending order, e.g. `"total_time"`, `"num_calls"` or `"cache_misses"`.
+        :param num_rows: Maximum number of rows to show. If `None`, all elements are
+            shown.
+        :return: Table of the profiling results as a string.
+        """
+        if sort_by not in self._SUMMARY_COLUMNS:
+            raise ValueError(
+                f"Cannot sort by {sort_by}. Valid options are "
+                f"{list(self._SUMMARY_COLUMNS.keys())}."
+            )
+
+        element_profiles = sorted(
+            self.elements, key=lambda profile: getattr(profile, sort_by), reverse=True
+        )[:num_rows]
+
+        rows = [[header for header, _, _ in self._SUMMARY_COLUMNS.values()]] + [
+            [
+                value_format.format(
+                    getattr(profile, attribute) * scale
+                    if scale is not None
+                    else getattr(profile, attribute)
+                )
+                for attribute, (_, value_format, scale) in self._SUMMARY_COLUMNS.items()
+            ]
+            for profile in element_profiles
+        ]
+        widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+
+        lines = [
+            "  ".join(
+                cell.ljust(width) if i < 2 else cell.rjust(width)
+                for i, (cell, width) in enumerate(zip(row, widths))
+            )
+            for row in rows
+        ]
+        lines.insert(1, "-" * len(lines[0]))
+
+        return "\n".join(lines)
+
+    def export_chrome_trace(self, path: str | Path) -> None:
+        """
+        Export the recorded tracking calls as a trace in the Chrome trace event format,
+        which can be viewed in `chrome://tracing` or https://ui.perfetto.dev.
+
+        :param path: Path of the JSON file to write the trace to.
+        """
+        with Path(path).open("w") as f:
+            json.dump({"traceEvents": self._trace_events}, f)
+
+    def __str__(self) -> str:
+        return self.summary()
+
+
+def track_profiled(element: Any, track: Callable[[Any], Any], incoming: Any) -> Any:
+    """
+    Track a beam through an element with the passed tracking function, recording it in
+    the active profile if profiling is on.
+    """
+    if _active_profile is None:
+        return track(incoming)
+    return _active_profile.record_tracking(element, track, incoming)
+
+
+def _newly_allocated_bytes(incoming: Any, outgoing: Any) -> int:
+    """
+    Number of bytes taken up by the tensors of the outgoing beam that do not share
+    memory with the tensors of the incoming beam.
+    """
+    incoming_data_ptrs = {
+        tensor.data_ptr() for tensor in (*incoming.parameters(), *incoming.buffers())
+    }
+    return sum(
+        tensor.nbytes
+        for tensor in (*outgoing.parameters(), *outgoing.buffers())
+        if tensor.data_ptr() not in incoming_data_ptrs
+    )
@@ -0,0 +1,213 @@
+import weakref
+from contextlib import contextmanager
+from typing import Iterator
+
+import torch
+from torch.utils.weak import WeakTensorKeyDictionary
+
+from cheetah.utils.transfer_map_structure import (
+    has_affine_offset,
+    is_identity_transfer_map,
+)
+
+_is_reversible_linear_tracking_enabled = False
+
+# Maps particle tensors produced by `ReversibleLinearTransform` to the link describing
+# how they were produced, so that consecutive transforms can be chained
+_links = WeakTensorKeyDictionary()
+
+
+@contextmanager
+def reversible_linear_tracking(enabled: bool = True) -> Iterator[None]:
+    """
+    Context manager to enable reversible backpropagation through the linear tracking of
+    `ParticleBeam`s.
+
+    Inside this context, applying a first-order transfer map to particles that require
+    gradients (or with a transfer map that requires gradients) does not keep the
+    incoming particles alive for the backward pass. Instead, only the particles leaving
+    the last of a chain of consecutive linear transforms are kept, and the particles at
+    all earlier points of the chain are reconstructed during the backward pass by
+    applying the inverse transfer maps. Peak memory of the backward pass is then
+    independent of the number of elements in the chain.
+
+    NOTE: Only the forward pass needs to run inside this context. The transfer maps
+        need to be invertible, and since intermediate particles are reconstructed
+        numerically, gradients may deviate slightly from those of regular tracking.
+        Compact beams, see `ParticleBeam.as_compact_beam`, are tracked regularly.
+
+    :param enabled: Whether to enable (`True`) or disable (`False`) reversible linear
+        tracking inside the context.
+    """
+    global _is_reversible_linear_tracking_enabled
+
+    previous = _is_reversible_linear_tracking_enabled
+    _is_reversible_linear_tracking_enabled = enabled
+    try:
+        yield
+    finally:
+        _is_reversible_linear_tracking_enabled = previous
+
+
+def is_reversible_linear_tracking_enabled() -> bool:
+    """Check if reversible linear tracking is currently enabled."""
+    return _is_reversible_linear_tracking_enabled
+
+
+def linear_transform(
+    particles: torch.Tensor, transfer_map: torch.Tensor
+) -> torch.Tensor:
+    """
+    Apply a first-order transfer map to particles, i.e. compute
+    `particles @ transfer_map.mT`. If reversible linear tracking is enabled and
+    gradients are needed, this is done with `ReversibleLinearTransform`. If the transfer
+    map is a cached identity and does not add vector dimensions, the incoming particles
+    are returned without a copy.
+
+    Particles stored compactly without the constant seventh coordinate are transformed
+    as `R @ x + d` instead, where `R` is the upper left 6x6 block of the transfer map
+    and `d` its affine offset. Adding `d` is skipped if it is known to be zero.
+
+    :param particles: Particles of shape `(..., num_particles, 7)`, or of shape
+        `(..., num_particles, 6)` if stored compactly.
+    :param transfer_map: Transfer map of shape `(..., 7, 7)`.
+    :return: Transformed particles of the same shape as the incoming particles, up to
+        broadcasting of the vector dimensions.
+    """
+    if particles.shape[:-2] == torch.broadcast_shapes(
+        particles.shape[:-2], transfer_map.shape[:-2]
+    ) and is_identity_transfer_map(transfer_map):
+        return particles
+    elif particles.shape[-1] == 6:
+        transformed = particles @ transfer_map[..., :6, :6].mT
+        if has_affine_offset(transfer_map):
+            transformed = transformed + transfer_map[..., :6, 6].unsqueeze(-2)
+        return transformed
+    elif (
+        _is_reversible_linear_tracking_enabled
+        and torch.is_grad_enabled()
+        and (particles.requires_grad or transfer_map.requires_grad)
+    ):
+        return ReversibleLinearTransform.apply(particles, transfer_map)
+    else:
+        return particles @ transfer_map.mT
+
+
+class _ReversibleLink:
+    """
+    Record of one application of `ReversibleLinearTransform`, holding what is needed
+    to recover the transformed particles during the backward pass.
+    """
+
+    def __init__(self, output: torch.Tensor, transfer_map: torch.Tensor) -> None:
+        self.output_ref = weakref.ref(output)
+        self.output_version = output._version
+        # Kept until a successor takes over, after which the output can be recovered
+        # from the successor's output
+        self.output = output.detach()
+        self.is_output_reconstructed = False
+        self.transfer_map = transfer_map.detach()
+        self.successor = None
+        self.predecessor_ref = None
+
+    def get_output(self) -> torch.Tensor:
+        """Get the output of the transform, reconstructing it if necessary."""
+        chain = []
+        link = self
+        while True:
+            tensor = link.output_ref()
+            if link.output is not None and (
+                link.is_output_reconstructed
+                or link.output._version == link.output_version
+            ):
+                output = link.output
+                break
+            elif tensor is not None and tensor._version == link.output_version:
+                output = tensor.detach()
+                break
+            elif link.successor is None:
+                raise RuntimeError(
+                    "The particles needed for reversible backpropagation were modified "
+                    "by an inplace operation."
+                )
+            chain.append(link)
+            link = link.successor
+
+        # Walk back from the first link whose output is known
+        for link in reversed(chain):
+            output = output @ torch.linalg.inv(link.successor.transfer_map).mT
+
+        return output
+
+
+class ReversibleLinearTransform(torch.autograd.Function):
+    """
+    Custom autograd function for applying a first-order transfer map to particles,
+    `particles @ transfer_map.mT`, that does not save the incoming particles for the
+    backward pass. They are reconstructed from the outgoing particles instead.
+    Consecutive transforms are chained, such that only the outgoing particles of the
+    last transform in a chain are kept alive.
+    """
+
+    @staticmethod
+    def forward(particles, transfer_map):
+        return particles @ transfer_map.mT
+
+    @staticmethod
+    def setup_context(ctx, inputs, output):
+        particles, transfer_map = inputs
+
+        link = _ReversibleLink(output, transfer_map)
+
+        # Chain onto the transform that produced the incoming particles. Its output no
+        # longer needs to be kept, as it can be reconstructed from this one.
+        predecessor = _links.get(particles)
+        if (
+            predecessor is not None
+            and predecessor.successor is None
+            and output.shape == particles.shape
+        ):
+            predecessor.successor = link
+            predecessor.output = None
+            link.predecessor_ref = weakref.ref(predecessor)
+        _links[output] = link
+
+        ctx.link = link
+        ctx.particles_shape = particles.shape
+        ctx.save_for_backward(transfer_map)
+
+    @staticmethod
+    def backward(ctx, grad_output):
+        (transfer_map,) = ctx.saved_tensors
+        link = ctx.link
+
+        # Prefer the predecessor's output, which may still be alive, over reconstructing
+        # the incoming particles from this transform's output
+        predecessor = (
+            link.predecessor_ref() if link.predecessor_ref is not None else None
+        )
+        if predecessor is not None:
+            particles = predecessor.get_output()
+        else:
+            particles = link.get_output() @ torch.linalg.inv(transfer_map).mT
+
+        grad_particles = grad_transfer_map = None
+        if ctx.needs_input_grad[0]:
+            grad_particles = (grad_output @ transfer_map).sum_to_size(
+                ctx.particles_shape
+            )
+        if ctx.needs_input_grad[1]:
+            grad_transfer_map = (grad_output.mT @ particles).sum_to_size(
+                transfer_map.shape
+            )
+
+        # Hand the incoming particles to the predecessor, whose backward pass usually
+        # runs next, and free this link's reconstructed output
+        if predecessor is not None and predecessor.output is None:
+            predecessor.output = particles
+            predecessor.is_output_reconstructed = True
+        if link.is_output_reconstructed:
+            link.output = None
+            link.is_output_reconstructed = False
+
+        return grad_particles, grad_transfer_map
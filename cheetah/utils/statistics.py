@@ -88,6 +88,32 @@ def unbiased_weighted_covariance_matrix(
     return covariance
 
 
+def unbiased_weighted_mean_and_covariance_matrix(
+    inputs: torch.Tensor, weights: torch.Tensor
+) -> tuple[torch.Tensor, torch.Tensor]:
+    """
+    Compute the weighted mean and the unbiased weighted covariance matrix of a tensor
+    together. All means are computed with a single weighted reduction and all
+    covariances with a single weighted `X^T W X` matrix product of the centred inputs,
+    instead of one pass over the samples per mean, variance or covariance.
+
+    :param inputs: Input tensor of shape (..., sample_size, num_features).
+    :param weights: Weights tensor of shape (..., sample_size).
+    :return: Weighted mean of shape (..., num_features) and unbiased weighted
+        covariance matrix of shape (..., num_features, num_features).
+    """
+    sum_of_weights = weights.sum(dim=-1)
+    correction_factor = sum_of_weights - weights.square().sum(dim=-1) / sum_of_weights
+
+    mean = (weights.unsqueeze(-2) @ inputs).squeeze(-2) / sum_of_weights.unsqueeze(-1)
+    centered_inputs = inputs - mean.unsqueeze(-2)
+    covariance = (
+        (weights.unsqueeze(-1) * centered_inputs).mT @ centered_inputs
+    ) / correction_factor.unsqueeze(-1).unsqueeze(-1)
+
+    return mean, covariance
+
+
 def match_distribution_moments(
     samples: torch.Tensor,
     target_mu: torch.Tensor,
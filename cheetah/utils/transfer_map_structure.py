@@ -0,0 +1,87 @@
+import torch
+from torch.utils.weak import WeakTensorKeyDictionary
+
+# Maps cached transfer map tensors to the version they were inspected at and their
+# structure, or to `None` if they have not been inspected yet
+_structure_by_transfer_map = WeakTensorKeyDictionary()
+
+
+def register_cached_transfer_map(transfer_map: torch.Tensor) -> None:
+    """
+    Register a transfer map stored in the transfer map cache, such that its structure
+    is inspected once when it is first applied to particles and remembered afterwards.
+    The structure of transfer maps that are not registered is never inspected, because
+    inspecting it would cost more than it saves for a transfer map that is only used
+    once.
+
+    :param transfer_map: Cached transfer map of shape `(..., 7, 7)`.
+    """
+    _structure_by_transfer_map[transfer_map] = None
+
+
+def is_identity_transfer_map(transfer_map: torch.Tensor) -> bool:
+    """
+    Check if a transfer map is the identity, such that applying it to particles can be
+    skipped.
+
+    NOTE: Only transfer maps registered with `register_cached_transfer_map` are
+        checked. Transfer maps that require gradients are never considered the
+        identity, as the gradients with respect to them would be lost otherwise.
+        Transfer maps on accelerator devices are not checked either, because checking
+        them would synchronise with the device.
+
+    :param transfer_map: Transfer map of shape `(..., 7, 7)`.
+    :return: `True` if the transfer map is known to be the identity for all vector
+        dimensions, `False` otherwise.
+    """
+    structure = _inspect_structure(transfer_map)
+    return structure is not None and structure[0]
+
+
+def has_affine_offset(transfer_map: torch.Tensor) -> bool:
+    """
+    Check if a transfer map has an affine offset, i.e. non-zero entries in the first
+    six rows of its seventh column, which add constants to the phase space coordinates.
+
+    NOTE: Transfer maps that are not registered with `register_cached_transfer_map`,
+        require gradients or are on accelerator devices are always assumed to have an
+        affine offset, for the same reasons as in `is_identity_transfer_map`.
+
+    :param transfer_map: Transfer map of shape `(..., 7, 7)`.
+    :return: `False` if the affine offset of the transfer map is known to be zero for
+        all vector dimensions, `True` otherwise.
+    """
+    structure = _inspect_structure(transfer_map)
+    return structure is None or structure[1]
+
+
+def _inspect_structure(transfer_map: torch.Tensor) -> tuple[bool, bool] | None:
+    """
+    Inspect whether a cached transfer map is the identity and whether it has an affine
+    offset. The result is remembered until the tensor is modified in place, so that
+    cached transfer maps are only inspected once. Returns `None` if the transfer map is
+    not cached or cannot be inspected.
+    """
+    if (
+        transfer_map.requires_grad
+        or transfer_map.device.type != "cpu"
+        or transfer_map not in _structure_by_transfer_map
+    ):
+        return None
+
+    known = _structure_by_transfer_map.get(transfer_map)
+    if known is not None and known[0] == transfer_map._version:
+        return known[1]
+
+    structure = (
+        bool(
+            (
+                transfer_map
+                == torch.eye(7, device=transfer_map.device, dtype=transfer_map.dtype)
+            ).all()
+        ),
+        bool((transfer_map[..., :6, 6] != 0).any()),
+    )
+    _structure_by_transfer_map[transfer_map] = (transfer_map._version, structure)
+
+    return structure
@@ -64,3 +64,13 @@ class VisualizationWarning(Warning):
     """
 
     ...
+
+
+class PerformanceWarning(Warning):
+    """
+    Warning raised when Cheetah cannot use a faster implementation that was requested,
+    for example because compilation is not available on the current system, and falls
+    back to a slower one.
+    """
+
+    ...
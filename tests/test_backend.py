@@ -0,0 +1,71 @@
+import pytest
+import torch
+
+import cheetah
+from cheetah.utils.backend import compilable
+
+
+def test_set_invalid_backend():
+    """Test that setting an unsupported backend raises an error."""
+    with pytest.raises(ValueError):
+        cheetah.set_backend("fast")
+
+    assert cheetah.get_backend() == "eager"
+
+
+def test_compiled_drift_kick_drift_matches_eager():
+    """
+    Test that `"drift_kick_drift"` tracking through a drift with the compiled backend
+    gives the same result as with the eager backend.
+    """
+    drift = cheetah.Drift(
+        length=torch.tensor(1.0, dtype=torch.float64),
+        tracking_method="drift_kick_drift",
+        dtype=torch.float64,
+    )
+    incoming = cheetah.ParticleBeam.from_parameters(
+        num_particles=10_000,
+        sigma_p=torch.tensor(1e-2),
+        energy=torch.tensor(5e6),
+        dtype=torch.float64,
+    )
+
+    eager_outgoing = drift.track(incoming)
+    cheetah.set_backend("compiled")
+    try:
+        compiled_outgoing = drift.track(incoming)
+    finally:
+        cheetah.set_backend("eager")
+
+    assert torch.allclose(
+        compiled_outgoing.particles, eager_outgoing.particles, atol=1e-15, rtol=1e-12
+    )
+
+
+def test_compilation_failure_falls_back_to_eager(monkeypatch):
+    """
+    Test that a kernel falls back to eager mode with a warning if compilation fails.
+    """
+
+    def failing_compile(*args, **kwargs):
+        raise RuntimeError("Compilation not available")
+
+    monkeypatch.setattr(torch, "compile", failing_compile)
+
+    @compilable
+    def kernel(x: torch.Tensor) -> torch.Tensor:
+        return (x.sin() + 1).sqrt()
+
+    x = torch.linspace(0.0, 1.0, 10)
+
+    cheetah.set_backend("compiled")
+    try:
+        with pytest.warns(cheetah.PerformanceWarning):
+            result = kernel(x)
+        assert torch.allclose(result, (x.sin() + 1).sqrt())
+
+        # Compilation is not attempted again after it has failed once
+        monkeypatch.setattr(torch, "compile", pytest.fail)
+        assert torch.allclose(kernel(x), (x.sin() + 1).sqrt())
+    finally:
+        cheetah.set_backend("eager")
@@ -1,4 +1,7 @@
+import os
+
 import pytest
+import torch
 
 import cheetah
 
@@ -34,3 +37,91 @@ def test_benchmark_ares_lattice(benchmark, beam_cls, tracking_method):
     segment.set_attrs_on_every_element(tracking_method=tracking_method, num_steps=5)
 
     benchmark(segment.track, incoming=incoming)
+
+
+@pytest.mark.parametrize("num_steps", [1, 5, 20])
+def test_benchmark_quadrupole_drift_kick_drift(benchmark, num_steps):
+    """
+    Benchmark for `"drift_kick_drift"` tracking through a quadrupole with a varying
+    number of steps.
+    """
+    incoming = cheetah.ParticleBeam.from_parameters(
+        num_particles=1_000_000, sigma_p=torch.tensor(1e-2)
+    )
+    quadrupole = cheetah.Quadrupole(
+        length=torch.tensor(0.3),
+        k1=torch.tensor(4.0),
+        misalignment=torch.tensor([1e-4, -2e-4]),
+        tilt=torch.tensor(0.1),
+        num_steps=num_steps,
+        tracking_method="drift_kick_drift",
+    )
+
+    benchmark(quadrupole.track, incoming=incoming)
+
+
+@pytest.mark.parametrize("method", ["histogram", "cloud-in-cell", "binned-kde"])
+def test_benchmark_vectorized_screen_reading(benchmark, method):
+    """Benchmark for the reading of a screen over a vectorised misalignment scan."""
+    screen = cheetah.Screen(
+        resolution=(200, 150),
+        pixel_size=torch.tensor((1e-5, 1e-5)),
+        misalignment=torch.stack(
+            [torch.linspace(-5e-4, 5e-4, 16), torch.zeros(16)], dim=-1
+        ),
+        is_active=True,
+        method=method,
+    )
+    screen.track(
+        cheetah.ParticleBeam.from_parameters(
+            num_particles=100_000,
+            sigma_x=torch.tensor(2e-4),
+            sigma_y=torch.tensor(2e-4),
+        )
+    )
+
+    def read_screen():
+        screen.cached_reading = None
+        return screen.reading
+
+    benchmark(read_screen)
+
+
+@pytest.mark.parametrize("backend", ["scatter", "sort"])
+@pytest.mark.parametrize(
+    "num_particles",
+    [
+        10_000,
+        100_000,
+        1_000_000,
+        pytest.param(
+            10_000_000,
+            marks=pytest.mark.skipif(
+                os.environ.get("CHEETAH_LARGE_BENCHMARKS") != "1",
+                reason="Set CHEETAH_LARGE_BENCHMARKS=1 to run benchmarks of 1e7 "
+                "particles",
+            ),
+        ),
+    ],
+    ids=lambda n: f"{n:.0e}",
+)
+@pytest.mark.parametrize(("num_hist_dims", "bins"), [(1, 256), (2, 64), (3, 32)])
+def test_benchmark_cloud_in_cell_deposition(
+    benchmark, num_hist_dims, bins, num_particles, backend
+):
+    """
+    Benchmark for cloud-in-cell charge deposition of Gaussian distributed particles
+    with the `"scatter"` and `"sort"` backends.
+    """
+    positions = torch.randn(num_particles, num_hist_dims)
+    charges = torch.rand(num_particles)
+    extent = torch.tensor([[-3.0, 3.0]] * num_hist_dims)
+
+    benchmark(
+        cheetah.utils.cloud_in_cell_charge_deposition,
+        positions=positions,
+        bins=bins,
+        extent=extent,
+        charges=charges,
+        backend=backend,
+    )
@@ -2,7 +2,11 @@ import pytest
 import torch
 
 from cheetah.utils import is_mps_available_and_functional
-from cheetah.utils.cloud_in_cell import cloud_in_cell_charge_deposition
+from cheetah.utils.cloud_in_cell import (
+    CloudInCellStencil,
+    cloud_in_cell_charge_deposition,
+    nearest_grid_point_charge_deposition,
+)
 
 
 @pytest.mark.parametrize(
@@ -193,7 +197,7 @@ def test_4d_compare_histogramdd(device, dtype):
     bins = (2, 3, 4, 2)
     positions = torch.tensor(
         [[0.5, 0.5, 0.5, 0.5], [1.5, 0.5, 0.5, 1.5], [0.5, 2.5, 3.5, 0.5]],
-        **factory_kwargs
+        **factory_kwargs,
     )
     charges = torch.tensor([1.0, 1.0, 2.0], **factory_kwargs)
 
@@ -257,3 +261,136 @@ def test_2d_some_outside_bounds():
 
     assert result.sum() < charges.sum()
     assert result.sum() == 2.0  # Only the middle particle should contribute
+
+
+@pytest.mark.parametrize("num_hist_dims", [1, 2, 3])
+def test_nearest_grid_point_compare_histogramdd(num_hist_dims):
+    """
+    Test that the Nearest-Grid-Point charge deposition produces the same result as
+    `torch.histogramdd` for randomly distributed particles, including particles outside
+    the extent and on its rightmost edge, and for every entry of a vectorised input.
+    """
+    bins = [7, 5, 3][:num_hist_dims]
+    extent = torch.tensor([[-2.0, 2.0], [-1.0, 3.0], [0.0, 1.0]], dtype=torch.float64)[
+        :num_hist_dims
+    ]
+    positions = torch.randn(4, 1_000, num_hist_dims, dtype=torch.float64) * 1.5
+    positions[:, 0] = extent[:, 1]
+    charges = torch.rand(4, 1_000, dtype=torch.float64)
+
+    result = nearest_grid_point_charge_deposition(positions, bins, extent, charges)
+
+    assert result.shape == (4, *bins)
+    for i in range(4):
+        histogram_result, _ = torch.histogramdd(
+            positions[i],
+            bins=bins,
+            range=extent.flatten().tolist(),
+            weight=charges[i],
+        )
+        assert torch.allclose(result[i], histogram_result)
+
+
+@pytest.mark.parametrize("num_hist_dims", [1, 2, 3, 4])
+def test_stencil_deposit_and_interpolate(num_hist_dims):
+    """
+    Test that depositing charges with a `CloudInCellStencil` matches
+    `cloud_in_cell_charge_deposition`, and that interpolating a linear function given
+    on the grid points back to the particles reproduces it exactly away from the edges.
+    """
+    bins = [7, 5, 6, 4][:num_hist_dims]
+    extent = torch.tensor([[-2.0, 2.0]] * num_hist_dims, dtype=torch.float64)
+    positions = torch.randn(3, 1_000, num_hist_dims, dtype=torch.float64)
+    charges = torch.rand(3, 1_000, dtype=torch.float64)
+
+    stencil = CloudInCellStencil(positions, bins, extent)
+
+    assert stencil.flat_indices.shape == (3, 1_000, 2**num_hist_dims)
+    assert torch.allclose(
+        stencil.deposit(charges),
+        cloud_in_cell_charge_deposition(positions, bins, extent, charges),
+    )
+
+    grid_point_positions = torch.stack(
+        torch.meshgrid(
+            *[
+                (torch.arange(n, dtype=torch.float64) + 0.5) / n * 4.0 - 2.0
+                for n in bins
+            ],
+            indexing="ij",
+        ),
+        dim=-1,
+    )
+    interpolated = stencil.interpolate(grid_point_positions)
+    is_away_from_edges = (positions.abs() < 2.0 - 2.0 / min(bins)).all(dim=-1)
+
+    assert interpolated.shape == (3, 1_000, num_hist_dims)
+    assert torch.allclose(
+        interpolated[is_away_from_edges], positions[is_away_from_edges]
+    )
+
+
+@pytest.mark.parametrize("num_hist_dims", [1, 2, 3, 4])
+def test_sort_backend_matches_scatter_backend(num_hist_dims):
+    """
+    Test that depositing charges with the `"sort"` backend gives the same charge
+    density and gradients as the `"scatter"` backend, including for particles outside
+    the extent and charges with more vector dimensions than the stencil.
+    """
+    bins = [7, 5, 6, 4][:num_hist_dims]
+    extent = torch.tensor([[-2.0, 2.0]] * num_hist_dims, dtype=torch.float64)
+    positions = 1.5 * torch.randn(3, 1_000, num_hist_dims, dtype=torch.float64)
+    positions.requires_grad_(True)
+    charges = torch.rand(2, 3, 1_000, dtype=torch.float64, requires_grad=True)
+
+    results = []
+    for backend in ["scatter", "sort"]:
+        stencil = CloudInCellStencil(positions, bins, extent, backend=backend)
+        charge_grid = stencil.deposit(charges)
+        charge_grid.square().sum().backward()
+        results.append((charge_grid.detach(), positions.grad, charges.grad))
+        positions.grad, charges.grad = None, None
+
+    assert results[1][0].shape == (2, 3, *bins)
+    for scatter_result, sort_result in zip(*results):
+        assert torch.allclose(scatter_result, sort_result)
+    assert torch.allclose(
+        cloud_in_cell_charge_deposition(
+            positions.detach(), bins, extent, charges.detach(), backend="sort"
+        ),
+        results[0][0],
+    )
+
+
+def test_sort_backend_is_deterministic():
+    """
+    Test that the `"sort"` backend gives bitwise identical results independent of the
+    number of threads, and that the `"scatter"` backend is used by default, even if
+    deterministic algorithms are enabled in PyTorch.
+    """
+    positions = torch.randn(100_000, 3)
+    charges = torch.rand(100_000)
+    extent = torch.tensor([[-3.0, 3.0]] * 3)
+
+    num_threads = torch.get_num_threads()
+    try:
+        torch.set_num_threads(1)
+        single_threaded = cloud_in_cell_charge_deposition(
+            positions, 16, extent, charges, backend="sort"
+        )
+        torch.set_num_threads(4)
+        multi_threaded = cloud_in_cell_charge_deposition(
+            positions, 16, extent, charges, backend="sort"
+        )
+    finally:
+        torch.set_num_threads(num_threads)
+
+    assert torch.equal(single_threaded, multi_threaded)
+
+    was_deterministic = torch.are_deterministic_algorithms_enabled()
+    was_warn_only = torch.is_deterministic_algorithms_warn_only_enabled()
+    try:
+        torch.use_deterministic_algorithms(True, warn_only=True)
+        assert CloudInCellStencil(positions, 16, extent).backend == "scatter"
+    finally:
+        torch.use_deterministic_algorithms(was_deterministic, warn_only=was_warn_only)
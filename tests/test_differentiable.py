@@ -145,3 +145,60 @@ def test_requiregrad_at_particlebeam_initialization():
 
     assert beam.x.requires_grad
     assert beam.y.requires_grad
+
+
+def test_reversible_linear_tracking():
+    """
+    Test that reversible linear tracking of a `ParticleBeam` results in the same
+    gradients as regular tracking, while saving no particle tensors for the backward
+    pass.
+    """
+    num_particles = 10_000
+    k1s = [
+        torch.tensor(2.0 * (-1) ** i, dtype=torch.float64, requires_grad=True)
+        for i in range(20)
+    ]
+    incoming = cheetah.ParticleBeam.from_parameters(
+        num_particles=num_particles, energy=torch.tensor(1e8), dtype=torch.float64
+    )
+
+    def compute_gradients(is_reversible: bool) -> tuple[torch.Tensor, int]:
+        elements = [
+            element
+            for k1 in k1s
+            for element in (
+                cheetah.Drift(length=torch.tensor(0.3, dtype=torch.float64)),
+                cheetah.Quadrupole(
+                    length=torch.tensor(0.1, dtype=torch.float64),
+                    k1=k1,
+                    dtype=torch.float64,
+                ),
+            )
+        ]
+
+        num_saved_particle_tensors = 0
+
+        def pack_hook(tensor: torch.Tensor) -> torch.Tensor:
+            nonlocal num_saved_particle_tensors
+            if tensor.numel() >= num_particles * 7:
+                num_saved_particle_tensors += 1
+            return tensor
+
+        with (
+            torch.autograd.graph.saved_tensors_hooks(pack_hook, lambda x: x),
+            cheetah.utils.reversible_linear_tracking(is_reversible),
+        ):
+            beam = incoming
+            for element in elements:
+                beam = element.track(beam)
+
+        gradients = torch.autograd.grad(beam.particles[:, :4].square().sum(), k1s)
+
+        return torch.stack(gradients), num_saved_particle_tensors
+
+    regular_gradients, num_regular_saved = compute_gradients(is_reversible=False)
+    reversible_gradients, num_reversible_saved = compute_gradients(is_reversible=True)
+
+    assert torch.allclose(reversible_gradients, regular_gradients)
+    assert num_regular_saved == len(k1s)
+    assert num_reversible_saved == 0
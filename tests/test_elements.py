@@ -353,6 +353,137 @@ def test_transfer_map_cache_invalidation_species():
     assert not torch.equal(original_transfer_map, updated_transfer_map)
 
 
+def test_transfer_map_cache_hit_without_comparison(monkeypatch):
+    """
+    Test that tracking through a segment whose transfer maps are all cached does not
+    compare the energy and species tensors by value.
+    """
+    segment = cheetah.Segment(
+        elements=[
+            cheetah.Drift(length=torch.tensor(0.5)),
+            cheetah.Quadrupole(length=torch.tensor(0.2), k1=torch.tensor(4.2)),
+            cheetah.Aperture(is_active=True),
+            cheetah.Dipole(length=torch.tensor(0.3), angle=torch.tensor(0.1)),
+            cheetah.Drift(length=torch.tensor(0.5)),
+        ]
+    )
+    incoming = cheetah.ParticleBeam.from_parameters(energy=torch.tensor(155e6))
+
+    segment.track(incoming)
+
+    num_comparisons = 0
+    original_equal = torch.equal
+
+    def counting_equal(*args, **kwargs):
+        nonlocal num_comparisons
+        num_comparisons += 1
+        return original_equal(*args, **kwargs)
+
+    monkeypatch.setattr(torch, "equal", counting_equal)
+
+    segment.track(incoming)
+
+    assert num_comparisons == 0
+
+
+def test_transfer_map_cache_multiple_energies():
+    """
+    Test that transfer maps for several energies are cached at the same time, and that
+    the least recently used one is evicted when the capacity is exceeded.
+    """
+    quadrupole = cheetah.Quadrupole(length=torch.tensor(0.5), k1=torch.tensor(1.0))
+    energies = [torch.tensor(energy) for energy in (100e6, 155e6, 200e6)]
+    species = cheetah.Species("electron")
+
+    cheetah.utils.set_transfer_map_cache_capacity(2)
+    try:
+        first_transfer_map = quadrupole.first_order_transfer_map(energies[0], species)
+        second_transfer_map = quadrupole.first_order_transfer_map(energies[1], species)
+
+        # Alternating between two energies hits the cache
+        assert id(
+            quadrupole.first_order_transfer_map(torch.tensor(100e6), species)
+        ) == id(first_transfer_map)
+        assert id(
+            quadrupole.first_order_transfer_map(torch.tensor(155e6), species)
+        ) == id(second_transfer_map)
+
+        # A third energy evicts the least recently used transfer map
+        quadrupole.first_order_transfer_map(energies[2], species)
+        assert id(quadrupole.first_order_transfer_map(energies[1], species)) == id(
+            second_transfer_map
+        )
+        assert id(quadrupole.first_order_transfer_map(energies[0], species)) != id(
+            first_transfer_map
+        )
+    finally:
+        cheetah.utils.set_transfer_map_cache_capacity(4)
+
+
+def test_transfer_map_cache_memory_budget():
+    """
+    Test that the least recently used transfer maps across all elements are evicted
+    when the memory budget is exceeded.
+    """
+    quadrupoles = [
+        cheetah.Quadrupole(length=torch.tensor(0.5), k1=torch.tensor(k1))
+        for k1 in (1.0, 2.0, 3.0)
+    ]
+    energy = torch.tensor(155e6)
+    species = cheetah.Species("electron")
+
+    transfer_maps = [
+        quadrupole.first_order_transfer_map(energy, species)
+        for quadrupole in quadrupoles
+    ]
+
+    # Only enough memory for the two most recently used transfer maps
+    cheetah.utils.set_transfer_map_cache_memory_budget(2 * transfer_maps[0].nbytes)
+    try:
+        assert id(quadrupoles[0].first_order_transfer_map(energy, species)) != id(
+            transfer_maps[0]
+        )
+        assert id(quadrupoles[2].first_order_transfer_map(energy, species)) == id(
+            transfer_maps[2]
+        )
+    finally:
+        cheetah.utils.set_transfer_map_cache_memory_budget(None)
+
+
+@pytest.mark.for_every_element("element")
+def test_frozen_defining_features(element):
+    """
+    Test that the defining features computed once per element class match the
+    `defining_features` property of every element.
+    """
+    features, feature_set = element._frozen_defining_features
+
+    assert list(features) == element.defining_features
+    assert feature_set == set(element.defining_features)
+
+
+def test_defining_features_version():
+    """
+    Test that assigning a defining feature increments the element's defining features
+    version and invalidates its cached transfer map, while assigning other attributes
+    does not.
+    """
+    quadrupole = cheetah.Quadrupole(length=torch.tensor(0.5), k1=torch.tensor(1.0))
+    energy = torch.tensor(155e6)
+    species = cheetah.Species("electron")
+
+    transfer_map = quadrupole.first_order_transfer_map(energy, species)
+    version = quadrupole.defining_features_version
+
+    quadrupole.metadata = {"pv": "QUAD:01"}
+    assert quadrupole.defining_features_version == version
+    assert quadrupole.first_order_transfer_map(energy, species) is transfer_map
+
+    quadrupole.k1 = torch.tensor(2.0)
+    assert quadrupole.defining_features_version == version + 1
+    assert quadrupole.first_order_transfer_map(energy, species) is not transfer_map
+
+
 @pytest.mark.for_every_element("element")
 @pytest.mark.parametrize("beam_cls", [cheetah.ParameterBeam, cheetah.ParticleBeam])
 def test_consistency(element, beam_cls):
@@ -0,0 +1,99 @@
+import numpy as np
+import pytest
+import torch
+from scipy.stats import multivariate_normal
+
+from cheetah.utils import gaussian_histogram_2d
+
+
+@pytest.mark.parametrize("correlation", [0.0, 0.2, -0.6, 0.9, 0.98])
+def test_gaussian_histogram_2d_matches_scipy(correlation):
+    """
+    Test that the analytic 2D histogram of a bivariate normal distribution matches the
+    double differences of the cumulative distribution function computed by SciPy.
+    """
+    sigma1, sigma2 = 2e-4, 1e-4
+    mu = torch.tensor([1e-5, -2e-5], dtype=torch.float64)
+    cov = torch.tensor(
+        [
+            [sigma1**2, correlation * sigma1 * sigma2],
+            [correlation * sigma1 * sigma2, sigma2**2],
+        ],
+        dtype=torch.float64,
+    )
+    bin_edges1 = torch.linspace(-6e-4, 6e-4, 31, dtype=torch.float64)
+    bin_edges2 = torch.linspace(-3e-4, 3e-4, 21, dtype=torch.float64)
+
+    histogram = gaussian_histogram_2d(mu, cov, bin_edges1, bin_edges2)
+
+    grid1, grid2 = np.meshgrid(bin_edges1.numpy(), bin_edges2.numpy(), indexing="ij")
+    cdf = multivariate_normal(mu.numpy(), cov.numpy()).cdf(
+        np.stack([grid1, grid2], axis=-1).reshape(-1, 2)
+    )
+    expected_histogram = np.diff(np.diff(cdf.reshape(grid1.shape), axis=0), axis=1)
+
+    assert histogram.shape == (30, 20)
+    assert np.allclose(histogram.numpy(), expected_histogram, atol=1e-8)
+
+
+def test_gaussian_histogram_2d_vectorized_and_narrow():
+    """
+    Test that the analytic 2D histogram is vectorised over the distribution parameters,
+    and that it keeps the full probability of a distribution narrower than a bin.
+    """
+    mu = torch.tensor([[0.0, 0.0], [0.25, -0.25], [0.5, 0.5]])
+    cov = torch.tensor([[1e-6, 5e-7], [5e-7, 1e-6]]).repeat(3, 1, 1)
+    bin_edges = torch.linspace(-1.0, 1.0, 5)
+
+    histogram = gaussian_histogram_2d(mu, cov, bin_edges, bin_edges)
+
+    assert histogram.shape == (3, 4, 4)
+    assert torch.allclose(histogram.sum(dim=(-2, -1)), torch.ones(3))
+    assert torch.isclose(histogram[1, 2, 1], torch.tensor(1.0))
+
+
+def test_gaussian_histogram_2d_zero_width():
+    """
+    Test that a distribution with zero width in one dimension is rendered as a point
+    mass in that dimension instead of producing NaNs, and that a distribution with zero
+    width in both dimensions falls entirely into the bin containing its mean, also next
+    to a correlated distribution.
+    """
+    mu = torch.tensor([[0.1, 0.1], [0.6, -0.3], [0.0, 0.0]])
+    cov = torch.tensor(
+        [
+            [[0.0, 0.0], [0.0, 0.04]],
+            [[0.0, 0.0], [0.0, 0.0]],
+            [[0.04, 0.02], [0.02, 0.04]],
+        ]
+    )
+    bin_edges = torch.linspace(-1.0, 1.0, 5)
+
+    histogram = gaussian_histogram_2d(mu, cov, bin_edges, bin_edges)
+
+    assert not histogram.isnan().any()
+    assert torch.allclose(histogram.sum(dim=(-2, -1)), torch.ones(3))
+    assert torch.allclose(histogram[0, [0, 1, 3]], torch.zeros(3, 4))
+    assert torch.allclose(
+        histogram[0, 2],
+        gaussian_histogram_2d(
+            mu[0], torch.tensor([[1e-12, 0.0], [0.0, 0.04]]), bin_edges, bin_edges
+        )[2],
+    )
+    assert torch.isclose(histogram[1, 3, 1], torch.tensor(1.0))
+
+
+def test_gaussian_histogram_2d_zero_width_gradient():
+    """
+    Test that the gradients of a histogram of a distribution with zero width in one
+    dimension are finite.
+    """
+    mu = torch.tensor([0.1, 0.1], requires_grad=True)
+    cov = torch.tensor([[0.0, 0.0], [0.0, 0.04]], requires_grad=True)
+    bin_edges = torch.linspace(-1.0, 1.0, 5)
+
+    histogram = gaussian_histogram_2d(mu, cov, bin_edges, bin_edges)
+    (histogram * torch.arange(16.0).view(4, 4)).sum().backward()
+
+    assert torch.all(mu.grad.isfinite())
+    assert torch.all(cov.grad.isfinite())
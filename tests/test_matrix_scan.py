@@ -0,0 +1,43 @@
+import pytest
+import torch
+
+from cheetah.utils import cumulative_matrix_product, matrix_product
+
+
+@pytest.mark.parametrize("num_matrices", [1, 2, 5, 8, 13])
+def test_cumulative_matrix_product_matches_sequential(num_matrices):
+    """
+    Test that the parallel prefix scan computes the same cumulative products as a
+    sequential loop, for sequence lengths that are and are not powers of two.
+    """
+    matrices = torch.randn(3, num_matrices, 4, 4, dtype=torch.float64)
+
+    result = cumulative_matrix_product(matrices)
+
+    expected = []
+    product = torch.eye(4, dtype=torch.float64).expand(3, 4, 4)
+    for i in range(num_matrices):
+        product = matrices[:, i] @ product
+        expected.append(product)
+    expected = torch.stack(expected, dim=-3)
+
+    assert result.shape == (3, num_matrices, 4, 4)
+    assert torch.allclose(result, expected)
+
+
+@pytest.mark.parametrize("num_matrices", [1, 2, 5, 8, 13])
+def test_matrix_product_matches_sequential(num_matrices):
+    """
+    Test that the tree reduction computes the same product as a sequential loop, for
+    sequence lengths that are and are not powers of two.
+    """
+    matrices = torch.randn(2, 3, num_matrices, 4, 4, dtype=torch.float64)
+
+    result = matrix_product(matrices)
+
+    expected = torch.eye(4, dtype=torch.float64).expand(2, 3, 4, 4)
+    for i in range(num_matrices):
+        expected = matrices[..., i, :, :] @ expected
+
+    assert result.shape == (2, 3, 4, 4)
+    assert torch.allclose(result, expected)
@@ -4,7 +4,11 @@ import scipy.stats
 import torch
 
 import cheetah
-from cheetah.utils import is_mps_available_and_functional
+from cheetah.utils import (
+    is_mps_available_and_functional,
+    unbiased_weighted_covariance,
+    unbiased_weighted_std,
+)
 
 
 def test_create_from_parameters():
@@ -485,3 +489,197 @@ def test_vectorized_conversion_to_parameter_beam_and_back():
         original_beam.total_charge, roundtrip_converted_beam.total_charge
     )
     assert torch.allclose(original_beam.s, roundtrip_converted_beam.s)
+
+
+@pytest.mark.parametrize("is_compact", [False, True])
+def test_backward_through_moments_one_after_another(is_compact):
+    """
+    Test that several moments and the particles of a beam that requires gradients can
+    be backpropagated through one after the other, i.e. that they do not share a cached
+    autograd graph.
+    """
+    beam = cheetah.ParticleBeam.from_parameters(
+        num_particles=1_000, sigma_x=torch.tensor(2e-5), sigma_y=torch.tensor(3e-5)
+    )
+    particles = (
+        beam.phase_space.clone() if is_compact else beam.particles.clone()
+    ).requires_grad_(True)
+    beam = cheetah.ParticleBeam(particles=particles, energy=beam.energy)
+
+    beam.sigma_x.backward()
+    beam.sigma_y.backward()
+    beam.mu_px.backward()
+    beam.particles[..., 0].sum().backward()
+
+    assert particles.grad is not None
+    assert torch.all(particles.grad[..., 2] != 0.0)
+
+    # Without gradients, the moments are still cached
+    with torch.no_grad():
+        assert beam._moments()[1] is beam._moments()[1]
+
+
+def test_moments_cached_until_particles_change():
+    """
+    Test that the moments of a `ParticleBeam` are computed once and shared by all
+    moment properties, and recomputed when the particles or survival probabilities
+    change.
+    """
+    beam = cheetah.ParticleBeam.from_parameters(
+        num_particles=10_000, sigma_x=torch.tensor(2e-5), dtype=torch.float64
+    )
+
+    assert torch.allclose(
+        beam.sigma_x,
+        unbiased_weighted_std(beam.x, beam.survival_probabilities, dim=-1),
+    )
+    assert torch.allclose(
+        beam.cov_xpx,
+        unbiased_weighted_covariance(
+            beam.x, beam.px, beam.survival_probabilities, dim=-1
+        ),
+    )
+
+    mean, covariance = beam._moments()
+    _ = beam.emittance_x, beam.beta_y
+    assert beam._moments()[0] is mean
+    assert beam._moments()[1] is covariance
+
+    # Modify particles in place
+    beam.x = beam.x * 2
+    assert beam._moments()[1] is not covariance
+    assert torch.isclose(beam.sigma_x, 2 * covariance[0, 0].sqrt())
+
+    # Replace survival probabilities
+    covariance = beam._moments()[1]
+    beam.survival_probabilities = torch.zeros_like(beam.survival_probabilities)
+    beam.survival_probabilities[:5_000] = 1.0
+    assert beam._moments()[1] is not covariance
+    assert torch.allclose(
+        beam.sigma_x,
+        unbiased_weighted_std(beam.x, beam.survival_probabilities, dim=-1),
+    )
+
+
+def test_compact_beam_storage_and_properties():
+    """
+    Test that a compact beam only stores the 6 phase space coordinates, while still
+    exposing the same particles and statistics as a regular beam.
+    """
+    beam = cheetah.ParticleBeam.from_parameters(
+        num_particles=10_000, sigma_x=torch.tensor(2e-5), dtype=torch.float64
+    )
+    compact_beam = beam.as_compact_beam()
+
+    assert compact_beam.is_compact and not beam.is_compact
+    assert compact_beam.phase_space.shape == (10_000, 6)
+    assert "particles" not in dict(compact_beam.named_buffers())
+    assert torch.allclose(compact_beam.particles, beam.particles)
+    assert torch.allclose(compact_beam.sigma_x, beam.sigma_x)
+    assert torch.allclose(compact_beam.emittance_y, beam.emittance_y)
+    assert torch.allclose(
+        compact_beam.as_parameter_beam().cov, beam.as_parameter_beam().cov
+    )
+
+    # Setters modify the stored phase space coordinates
+    compact_beam.x = compact_beam.x * 2
+    assert torch.allclose(compact_beam.particles[..., 0], 2 * beam.x)
+    assert torch.allclose(compact_beam.sigma_x, 2 * beam.sigma_x)
+
+    # Cloning and indexing keep the beam compact
+    assert compact_beam.clone().is_compact
+    assert compact_beam.clone().phase_space.data_ptr() != (
+        compact_beam.phase_space.data_ptr()
+    )
+
+
+@pytest.mark.parametrize(
+    "element",
+    [
+        cheetah.Drift(length=torch.tensor(1.0)),
+        cheetah.Quadrupole(length=torch.tensor(0.2), k1=torch.tensor(4.2)),
+        cheetah.Quadrupole(
+            length=torch.tensor(0.2),
+            k1=torch.tensor(4.2),
+            misalignment=torch.tensor([1e-4, -2e-4]),
+            tracking_method="drift_kick_drift",
+        ),
+        cheetah.Dipole(length=torch.tensor(0.5), angle=torch.tensor(0.1)),
+        cheetah.Dipole(
+            length=torch.tensor(0.5),
+            angle=torch.tensor(0.1),
+            tracking_method="drift_kick_drift",
+        ),
+        cheetah.TransverseDeflectingCavity(
+            length=torch.tensor(1.0),
+            voltage=torch.tensor(1e7),
+            phase=torch.tensor(0.2),
+            frequency=torch.tensor(2.8e9),
+        ),
+        cheetah.Screen(
+            misalignment=torch.tensor([1e-4, 2e-4]), is_active=True, is_blocking=True
+        ),
+        cheetah.SpaceChargeKick(effect_length=torch.tensor(1.0)),
+        cheetah.Sextupole(
+            length=torch.tensor(0.2),
+            k2=torch.tensor(50.0),
+            tracking_method="second_order",
+        ),
+        cheetah.Cavity(
+            length=torch.tensor(1.0),
+            voltage=torch.tensor(1e7),
+            phase=torch.tensor(20.0),
+            frequency=torch.tensor(1.3e9),
+        ),
+        cheetah.HorizontalCorrector(length=torch.tensor(0.1), angle=torch.tensor(1e-3)),
+    ],
+)
+def test_compact_beam_tracking(element):
+    """
+    Test that compact beams stay compact when tracked through elements and end up with
+    the same particles as regular beams.
+    """
+    incoming = cheetah.ParticleBeam.from_parameters(
+        num_particles=1_000, energy=torch.tensor(1e8), dtype=torch.float64
+    )
+    element = element.to(torch.float64)
+
+    outgoing = element.track(incoming)
+    compact_outgoing = element.track(incoming.as_compact_beam())
+
+    assert compact_outgoing.is_compact
+    assert torch.allclose(compact_outgoing.particles, outgoing.particles)
+
+
+def test_without_lost_particles():
+    """
+    Test that lost particles are removed from a beam, and that the surviving particles
+    of vectorised survival probabilities are packed to the front in their order.
+    """
+    # Too few particles to match the moments of `from_parameters`
+    beam = cheetah.ParticleBeam(
+        particles=torch.cat((torch.randn(5, 6), torch.ones(5, 1)), dim=-1),
+        energy=torch.tensor(1e8),
+    )
+
+    beam.survival_probabilities = torch.tensor([1.0, 0.0, 0.5, 0.0, 1.0])
+    compacted_beam = beam.without_lost_particles()
+
+    assert compacted_beam.num_particles == 3
+    assert compacted_beam.num_dropped_particles == 2
+    assert torch.allclose(compacted_beam.x, beam.x[[0, 2, 4]])
+    assert torch.allclose(compacted_beam.total_charge, beam.total_charge)
+    assert compacted_beam.without_lost_particles() is compacted_beam
+
+    beam.survival_probabilities = torch.tensor(
+        [[1.0, 0.0, 0.5, 0.0, 1.0], [0.0, 0.0, 1.0, 0.0, 0.0]]
+    )
+    compacted_beam = beam.without_lost_particles()
+
+    assert compacted_beam.particles.shape == (2, 3, 7)
+    assert torch.allclose(compacted_beam.x[0], beam.x[[0, 2, 4]])
+    assert torch.allclose(compacted_beam.x[1, 0], beam.x[2])
+    assert torch.allclose(
+        compacted_beam.survival_probabilities[1], torch.tensor([1.0, 0.0, 0.0])
+    )
+    assert torch.allclose(compacted_beam.total_charge, beam.total_charge)
@@ -0,0 +1,81 @@
+import json
+
+import torch
+
+import cheetah
+
+
+def test_profiling_records_elements():
+    """
+    Test that profiling records every element tracked by a segment, including runs of
+    merged skippable elements, along with their transfer map cache accesses.
+    """
+    segment = cheetah.Segment(
+        elements=[
+            cheetah.Drift(length=torch.tensor(0.5), name="drift_1"),
+            cheetah.Quadrupole(
+                length=torch.tensor(0.2), k1=torch.tensor(4.2), name="quad"
+            ),
+            cheetah.BPM(is_active=True, name="bpm"),
+            cheetah.Drift(length=torch.tensor(0.5), name="drift_2"),
+        ]
+    )
+    incoming = cheetah.ParticleBeam.from_parameters(
+        num_particles=1_000, energy=torch.tensor(1e8)
+    )
+
+    with cheetah.profiling() as profile:
+        segment.track(incoming)
+        segment.quad.k1 = torch.tensor(2.0)
+        segment.track(incoming)
+
+    element_profiles = {
+        element_profile.name: element_profile for element_profile in profile.elements
+    }
+
+    assert element_profiles["drift_1...quad"].num_calls == 2
+    assert element_profiles["bpm"].num_calls == 2
+    assert element_profiles["drift_2"].num_calls == 2
+    assert element_profiles["drift_1...quad"].total_time > 0.0
+    assert element_profiles["bpm"].allocated_bytes > 0
+
+    assert element_profiles["drift_1"].cache_misses == 1
+    assert element_profiles["drift_1"].cache_hits == 1
+    assert element_profiles["quad"].cache_misses == 2
+    assert element_profiles["quad"].num_map_rebuilds == 1
+
+    assert "drift_1...quad" in profile.summary(sort_by="cache_misses")
+
+
+def test_profiling_chrome_trace(tmp_path):
+    """Test that the recorded tracking calls can be exported as a Chrome trace."""
+    segment = cheetah.Segment(
+        elements=[
+            cheetah.Drift(length=torch.tensor(0.5), name="drift"),
+            cheetah.Screen(is_active=True, name="screen"),
+        ]
+    )
+    incoming = cheetah.ParameterBeam.from_parameters(energy=torch.tensor(1e8))
+
+    with cheetah.profiling() as profile:
+        segment.track(incoming)
+
+    path = tmp_path / "trace.json"
+    profile.export_chrome_trace(path)
+
+    with path.open() as f:
+        trace = json.load(f)
+
+    assert [event["name"] for event in trace["traceEvents"]] == ["drift", "screen"]
+
+
+def test_profiling_off():
+    """Test that nothing is recorded once the profiling context is left."""
+    segment = cheetah.Segment(elements=[cheetah.Drift(length=torch.tensor(0.5))])
+    incoming = cheetah.ParameterBeam.from_parameters(energy=torch.tensor(1e8))
+
+    with cheetah.profiling() as profile:
+        pass
+    segment.track(incoming)
+
+    assert len(profile.elements) == 0
@@ -207,6 +207,32 @@ def test_quadrupole_drift_kick_drift_tracking(dtype):
     )
 
 
+def test_quadrupole_drift_kick_drift_num_steps():
+    """
+    Test that the number of steps does not change the result of `"drift_kick_drift"`
+    tracking through a quadrupole, as the steps are exact for constant momentum.
+    """
+    incoming = torch.load("tests/resources/bmadx/incoming.pt", weights_only=False).to(
+        torch.float64
+    )
+    outgoings = [
+        cheetah.Quadrupole(
+            length=torch.tensor(1.0, dtype=torch.float64),
+            k1=torch.tensor(10.0, dtype=torch.float64),
+            misalignment=torch.tensor([0.01, -0.02], dtype=torch.float64),
+            tilt=torch.tensor(0.5, dtype=torch.float64),
+            num_steps=num_steps,
+            tracking_method="drift_kick_drift",
+            dtype=torch.float64,
+        ).track(incoming)
+        for num_steps in (1, 10)
+    ]
+
+    assert torch.allclose(
+        outgoings[0].particles, outgoings[1].particles, atol=1e-14, rtol=1e-12
+    )
+
+
 @pytest.mark.parametrize(
     "tracking_method", ["linear", "second_order", "drift_kick_drift"]
 )
@@ -7,7 +7,9 @@ import cheetah
 from .resources import ARESlatticeStage3v1_9 as ocelot_lattice
 
 
-@pytest.mark.parametrize("screen_method", ["histogram", "kde", "cloud-in-cell"])
+@pytest.mark.parametrize(
+    "screen_method", ["histogram", "kde", "binned-kde", "cloud-in-cell"]
+)
 def test_reading_shows_beam_particle(screen_method):
     """
     Test that a screen has a reading that shows some sign of the beam having hit it.
@@ -68,7 +70,9 @@ def test_screen_kde_bandwidth(kde_bandwidth):
     assert torch.any(segment.my_screen.reading > 0.0)
 
 
-@pytest.mark.parametrize("screen_method", ["histogram", "kde", "cloud-in-cell"])
+@pytest.mark.parametrize(
+    "screen_method", ["histogram", "kde", "binned-kde", "cloud-in-cell"]
+)
 def test_reading_shows_beam_parameter(screen_method):
     """
     Test that a screen has a reading that shows some sign of the beam having hit it.
@@ -101,7 +105,9 @@ def test_reading_shows_beam_parameter(screen_method):
 
 
 @pytest.mark.filterwarnings("ignore::cheetah.utils.DefaultParameterWarning")
-@pytest.mark.parametrize("screen_method", ["histogram", "kde", "cloud-in-cell"])
+@pytest.mark.parametrize(
+    "screen_method", ["histogram", "kde", "binned-kde", "cloud-in-cell"]
+)
 def test_reading_shows_beam_ares(screen_method):
     """
     Test that a screen has a reading that shows some sign of the beam having hit it.
@@ -238,3 +244,89 @@ def test_screen_reading_not_unintentionally_modified_particle_beam():
         original_read_beam.species.charge_coulomb
         == read_beam_after_modification.species.charge_coulomb
     )
+
+
+@pytest.mark.parametrize("BeamClass", [cheetah.ParameterBeam, cheetah.ParticleBeam])
+def test_read_beam_is_misaligned_copy(BeamClass):
+    """
+    Test that the read beam of a misaligned screen is a copy of the incoming beam
+    shifted by the screen's misalignment, while the incoming beam remains unchanged.
+    """
+    incoming = BeamClass.from_parameters(mu_x=torch.tensor(1e-4))
+    screen = cheetah.Screen(misalignment=torch.tensor((2e-4, -3e-4)), is_active=True)
+
+    outgoing = screen.track(incoming)
+    read_beam = screen.get_read_beam()
+
+    assert outgoing is not incoming
+    assert read_beam is not incoming
+    assert torch.isclose(incoming.mu_x, torch.tensor(1e-4))
+    assert torch.isclose(read_beam.mu_x, torch.tensor(-1e-4))
+    assert torch.isclose(read_beam.mu_y, incoming.mu_y + 3e-4)
+
+
+def test_histogram_reading_matches_histogramdd():
+    """
+    Test that the `"histogram"` reading of a screen matches `torch.histogramdd`, also
+    for every entry of a vectorised read beam.
+    """
+    screen = cheetah.Screen(
+        resolution=(60, 40),
+        pixel_size=torch.tensor((1e-5, 2e-5), dtype=torch.float64),
+        misalignment=torch.tensor([[0.0, 0.0], [1e-4, -2e-4]], dtype=torch.float64),
+        is_active=True,
+        method="histogram",
+    )
+    incoming = cheetah.ParticleBeam.from_parameters(
+        num_particles=10_000,
+        sigma_x=torch.tensor(2e-4),
+        sigma_y=torch.tensor(3e-4),
+        dtype=torch.float64,
+    )
+
+    screen.track(incoming)
+    read_beam = screen.get_read_beam()
+
+    assert screen.reading.shape == (2, 40, 60)
+    for i in range(2):
+        expected_image, _ = torch.histogramdd(
+            torch.stack((read_beam.x[i], read_beam.y[i])).mT,
+            bins=screen.pixel_bin_edges,
+            weight=read_beam.particle_charges.abs() * read_beam.survival_probabilities,
+        )
+        assert torch.allclose(screen.reading[i], expected_image.mT)
+
+
+@pytest.mark.parametrize("method", ["cloud-in-cell", "binned-kde"])
+def test_sort_deposition_backend_matches_scatter(method):
+    """
+    Test that the readings of screens with the opt-in `"sort"` deposition backend match
+    those with the default `"scatter"` backend.
+    """
+    incoming = cheetah.ParticleBeam.from_parameters(
+        num_particles=10_000,
+        sigma_x=torch.tensor(2e-4),
+        sigma_y=torch.tensor(3e-4),
+        dtype=torch.float64,
+    )
+    scatter_screen = cheetah.Screen(
+        resolution=(60, 40),
+        pixel_size=torch.tensor((1e-5, 2e-5), dtype=torch.float64),
+        is_active=True,
+        method=method,
+        dtype=torch.float64,
+    )
+    sort_screen = cheetah.Screen(
+        resolution=(60, 40),
+        pixel_size=torch.tensor((1e-5, 2e-5), dtype=torch.float64),
+        is_active=True,
+        method=method,
+        deposition_backend="sort",
+        dtype=torch.float64,
+    )
+
+    scatter_screen.track(incoming)
+    sort_screen.track(incoming)
+
+    assert scatter_screen.deposition_backend == "scatter"
+    assert torch.allclose(sort_screen.reading, scatter_screen.reading)
@@ -4,6 +4,11 @@ import pytest
 import torch
 
 import cheetah
+from cheetah.utils.cache import (
+    build_transfer_maps_batched,
+    cache_transfer_map,
+    is_transfer_map_cached,
+)
 from cheetah.utils.warnings import DirtyNameWarning, PhysicsWarning
 
 
@@ -326,3 +331,597 @@ def test_partition_unknown_element():
 
     with pytest.raises(ValueError):
         segment.partition_at("drift_42")
+
+
+def test_tracking_plan_is_cached():
+    """
+    Test that the tracking plan of a `Segment` is reused between calls to `track` and
+    only rebuilt when the skippability of its elements changes.
+    """
+    segment = cheetah.Segment(
+        elements=[
+            cheetah.Drift(length=torch.tensor(0.5), name="d1"),
+            cheetah.Quadrupole(length=torch.tensor(0.3), name="q1"),
+            cheetah.Drift(length=torch.tensor(0.2), name="d2"),
+            cheetah.Screen(name="s1", is_active=True),
+            cheetah.Drift(length=torch.tensor(0.4), name="d3"),
+        ]
+    )
+    incoming_beam = cheetah.ParticleBeam.from_parameters(num_particles=100)
+
+    first_plan = segment.tracking_plan()
+    _ = segment.track(incoming_beam)
+
+    assert len(first_plan) == 3
+    assert segment.tracking_plan() is first_plan
+
+    # Changing the tracking method changes skippability and must trigger a rebuild
+    segment.q1.tracking_method = "drift_kick_drift"
+    second_plan = segment.tracking_plan()
+
+    assert second_plan is not first_plan
+    assert len(second_plan) == 5
+
+    # Tracking with the rebuilt plan must match tracking element by element
+    outgoing_beam = segment.track(incoming_beam)
+    expected_beam = incoming_beam
+    for element in segment.elements:
+        expected_beam = element.track(expected_beam)
+
+    assert torch.allclose(outgoing_beam.particles, expected_beam.particles)
+
+
+def test_tracking_plan_of_skippable_segment():
+    """
+    Test that the tracking plan of an entirely skippable `Segment` is the segment itself
+    and that no submodules are registered for the plan.
+    """
+    segment = cheetah.Segment(
+        elements=[
+            cheetah.Drift(length=torch.tensor(0.5)),
+            cheetah.Quadrupole(length=torch.tensor(0.3), k1=torch.tensor(4.2)),
+        ]
+    )
+    incoming_beam = cheetah.ParameterBeam.from_parameters()
+
+    _ = segment.track(incoming_beam)
+
+    assert segment.tracking_plan() == [segment]
+    assert len(list(segment.children())) == 1
+
+
+def test_cumulative_transfer_maps():
+    """
+    Test that the cumulative transfer maps of a `Segment` match the transfer maps of its
+    subcells and that the last one matches the transfer map of the entire segment.
+    """
+    segment = cheetah.Segment(
+        elements=[
+            cheetah.Drift(length=torch.tensor(0.5), name="d1"),
+            cheetah.Quadrupole(
+                length=torch.tensor(0.3), k1=torch.tensor([4.2, -2.0]), name="q1"
+            ),
+            cheetah.Drift(length=torch.tensor(0.2), name="d2"),
+            cheetah.Dipole(
+                length=torch.tensor(0.4), angle=torch.tensor(0.1), name="b1"
+            ),
+            cheetah.Drift(length=torch.tensor(0.4), name="d3"),
+        ]
+    ).double()
+    energy = torch.tensor(1e8, dtype=torch.float64)
+    species = cheetah.Species("electron", dtype=torch.float64)
+
+    cumulative_tms = segment.cumulative_first_order_transfer_maps(energy, species)
+
+    assert cumulative_tms.shape == (2, 5, 7, 7)
+    for i, name in enumerate(segment.element_names):
+        subcell_tm = segment.subcell(end=name).first_order_transfer_map(energy, species)
+        assert torch.allclose(cumulative_tms[..., i, :, :], subcell_tm)
+    assert torch.allclose(
+        cumulative_tms[..., -1, :, :],
+        segment.first_order_transfer_map(energy, species),
+    )
+
+
+@pytest.mark.parametrize("resolution", [None, 0.1])
+def test_parameter_beam_attrs_along_skippable_segment(resolution):
+    """
+    Test that the beam attributes along a skippable segment computed from the cumulative
+    transfer maps match those from tracking element by element.
+    """
+    segment = cheetah.Segment(
+        elements=[
+            cheetah.Drift(length=torch.tensor(0.5)),
+            cheetah.Quadrupole(length=torch.tensor(0.3), k1=torch.tensor([4.2, -2.0])),
+            cheetah.Drift(length=torch.tensor(0.2)),
+            cheetah.Dipole(length=torch.tensor(0.4), angle=torch.tensor(0.1)),
+        ]
+    ).double()
+    incoming = cheetah.ParameterBeam.from_parameters(
+        mu_x=torch.tensor(1e-4),
+        sigma_p=torch.tensor(1e-3),
+        energy=torch.tensor(1e8),
+        dtype=torch.float64,
+    )
+    attr_names = ("s", "mu_x", "sigma_x", "beta_y", "energy", "cov")
+
+    results = segment.get_beam_attrs_along_segment(
+        attr_names, incoming, resolution=resolution
+    )
+
+    beams = list(segment.beam_along_segment_generator(incoming, resolution=resolution))
+    for result, attr_name in zip(results, attr_names):
+        expected = torch.stack(
+            torch.broadcast_tensors(*(getattr(beam, attr_name) for beam in beams)),
+            dim=-(incoming.UNVECTORIZED_NUM_ATTR_DIMS.get(attr_name, 0) + 1),
+        )
+        assert result.shape == expected.shape
+        assert torch.allclose(result, expected)
+
+
+def test_beam_attrs_along_segment_splits_particle_beam_segment_once(monkeypatch):
+    """
+    Test that getting beam attributes of a `ParticleBeam` along a segment at a given
+    resolution only splits the segment once, for tracking through it.
+    """
+    segment = cheetah.Segment(
+        elements=[
+            cheetah.Drift(length=torch.tensor(0.5)),
+            cheetah.Quadrupole(length=torch.tensor(0.3), k1=torch.tensor(4.2)),
+        ]
+    )
+    incoming = cheetah.ParticleBeam.from_parameters(num_particles=1_000)
+
+    num_split_calls = 0
+    original_split = cheetah.Segment.split
+
+    def counting_split(self, resolution):
+        nonlocal num_split_calls
+        num_split_calls += 1
+        return original_split(self, resolution)
+
+    monkeypatch.setattr(cheetah.Segment, "split", counting_split)
+
+    _ = segment.get_beam_attrs_along_segment("sigma_x", incoming, resolution=0.1)
+
+    assert num_split_calls == 1
+
+
+def test_empty_segment_transfer_map():
+    """
+    Test that the transfer map of an empty `Segment` is the identity, broadcast to the
+    shape of the energy, and that it has no cumulative transfer maps.
+    """
+    segment = cheetah.Segment(elements=[])
+    energy = torch.tensor([1e8, 2e8, 3e8])
+    species = cheetah.Species("electron")
+
+    tm = segment.first_order_transfer_map(energy, species)
+    cumulative_tms = segment.cumulative_first_order_transfer_maps(energy, species)
+
+    assert torch.equal(tm, torch.eye(7).expand(3, 7, 7))
+    assert cumulative_tms.shape == (3, 0, 7, 7)
+
+
+@pytest.mark.parametrize("energy_shape", [(), (3, 1)])
+def test_precompute_first_order_transfer_maps(energy_shape):
+    """
+    Test that the batched precomputation of transfer maps results in the same maps as
+    computing them element by element, and that the precomputed maps are then served
+    from the elements' caches.
+    """
+    segment = cheetah.Segment(
+        elements=[
+            cheetah.Drift(length=torch.tensor(0.3)),
+            cheetah.Quadrupole(
+                length=torch.tensor(0.2),
+                k1=torch.tensor([4.2, -3.0]),
+                misalignment=torch.tensor([1e-4, -2e-4]),
+            ),
+            cheetah.Drift(length=torch.tensor(0.5)),
+            cheetah.Segment(
+                elements=[
+                    cheetah.Quadrupole(
+                        length=torch.tensor(0.2),
+                        k1=torch.tensor([-1.5, 2.0]),
+                        misalignment=torch.tensor([0.0, 3e-4]),
+                    ),
+                    cheetah.Dipole(length=torch.tensor(0.4), angle=torch.tensor(0.1)),
+                ]
+            ),
+            cheetah.Quadrupole(
+                length=torch.tensor(0.2),
+                k1=torch.tensor([0.5, 1.0]),
+                misalignment=torch.tensor([2e-4, 0.0]),
+            ),
+        ]
+    )
+    elements = segment.flattened().elements
+    energy = torch.full(energy_shape, 155e6)
+    species = cheetah.Species("electron")
+
+    expected_maps = [
+        element.first_order_transfer_map.__wrapped__(element, energy, species)
+        for element in elements
+    ]
+
+    segment.precompute_first_order_transfer_maps(energy, species)
+
+    for element, expected_map in zip(elements, expected_maps):
+        cached_map = element.first_order_transfer_map(energy, species)
+        assert id(cached_map) == id(element.first_order_transfer_map(energy, species))
+        assert cached_map.shape == expected_map.shape
+        assert torch.allclose(cached_map, expected_map)
+
+
+@pytest.mark.parametrize("energy_shape", [(), (3, 1)])
+@pytest.mark.parametrize(
+    "make_elements",
+    [
+        lambda: [
+            cheetah.Quadrupole(
+                length=torch.tensor(0.2),
+                k1=torch.tensor(4.2),
+                misalignment=torch.tensor([1e-4, 0.0]),
+                tilt=torch.tensor(0.1),
+            ),
+            cheetah.Quadrupole(length=torch.tensor(0.3), k1=torch.tensor(-2.0)),
+        ],
+        lambda: [
+            cheetah.Dipole(
+                length=torch.tensor(0.4),
+                angle=torch.tensor(0.1),
+                dipole_e1=torch.tensor(0.02),
+                k1=torch.tensor(0.3),
+            ),
+            cheetah.Dipole(
+                length=torch.tensor(0.5),
+                angle=torch.tensor(-0.2),
+                tilt=torch.tensor(0.3),
+            ),
+        ],
+        lambda: [
+            cheetah.Sextupole(length=torch.tensor(0.2), k2=torch.tensor(10.0)),
+            cheetah.Sextupole(length=torch.tensor(0.1), k2=torch.tensor(-5.0)),
+        ],
+        lambda: [
+            cheetah.Cavity(
+                length=torch.tensor(1.0),
+                voltage=torch.tensor(1e7),
+                phase=torch.tensor(10.0),
+                frequency=torch.tensor(1.3e9),
+            ),
+            cheetah.Cavity(
+                length=torch.tensor(0.5),
+                voltage=torch.tensor(2e7),
+                phase=torch.tensor(-5.0),
+                frequency=torch.tensor(1.3e9),
+            ),
+        ],
+        lambda: [
+            cheetah.Solenoid(length=torch.tensor(0.2), k=torch.tensor(1.0)),
+            cheetah.Solenoid(length=torch.tensor(0.3), k=torch.tensor(2.0)),
+        ],
+        lambda: [
+            cheetah.CombinedCorrector(
+                length=torch.tensor(0.1),
+                horizontal_angle=torch.tensor(1e-3),
+                vertical_angle=torch.tensor(2e-3),
+            ),
+            cheetah.CombinedCorrector(
+                length=torch.tensor(0.2),
+                horizontal_angle=torch.tensor(-1e-3),
+                vertical_angle=torch.tensor(0.0),
+            ),
+        ],
+        lambda: [
+            cheetah.Screen(misalignment=torch.tensor([1e-4, 0.0])),
+            cheetah.Screen(misalignment=torch.tensor([0.0, 2e-4])),
+        ],
+        lambda: [
+            cheetah.Aperture(x_max=torch.tensor(1e-3), y_max=torch.tensor(2e-3)),
+            cheetah.Aperture(x_max=torch.tensor(2e-3), y_max=torch.tensor(1e-3)),
+        ],
+    ],
+    ids=lambda make_elements: type(make_elements()[0]).__name__,
+)
+@pytest.mark.parametrize(
+    "method_name", ["first_order_transfer_map", "second_order_transfer_map"]
+)
+def test_batched_transfer_maps_match_individual_maps(
+    make_elements, method_name, energy_shape
+):
+    """
+    Test that building the transfer maps of a group of elements of the same type in
+    one batched computation gives the same maps as computing them element by element,
+    including for elements whose map does not depend on their defining tensors.
+    """
+    elements = make_elements()
+    method = getattr(type(elements[0]), method_name, None)
+    if not hasattr(method, "__wrapped__"):
+        pytest.skip(f"{type(elements[0]).__name__} does not cache {method_name}")
+
+    energy = torch.full(energy_shape, 155e6)
+    species = cheetah.Species("electron")
+    expected_maps = [
+        method.__wrapped__(element, energy, species) for element in elements
+    ]
+
+    build_transfer_maps_batched(elements, method_name, energy, species)
+
+    for element, expected_map in zip(elements, expected_maps):
+        assert is_transfer_map_cached(element, method_name, energy, species)
+        cached_map = getattr(element, method_name)(energy, species)
+        assert cached_map.shape == expected_map.shape
+        assert torch.allclose(cached_map, expected_map)
+
+
+def test_batched_transfer_maps_without_element_dimension():
+    """
+    Test that a batched second-order transfer map that does not depend on the stacked
+    defining tensors is shared by all elements of the group, even if the group has as
+    many elements as the map has entries along its first dimension.
+    """
+
+    class ConstantSecondOrderDrift(cheetah.Drift):
+        @cache_transfer_map
+        def second_order_transfer_map(self, energy, species):
+            return torch.arange(7.0**3).view(7, 7, 7)
+
+    elements = [
+        ConstantSecondOrderDrift(length=torch.tensor(0.1 * (i + 1))) for i in range(7)
+    ]
+    energy = torch.tensor(155e6)
+    species = cheetah.Species("electron")
+
+    build_transfer_maps_batched(elements, "second_order_transfer_map", energy, species)
+
+    for element in elements:
+        assert is_transfer_map_cached(
+            element, "second_order_transfer_map", energy, species
+        )
+        assert torch.equal(
+            element.second_order_transfer_map(energy, species),
+            torch.arange(7.0**3).view(7, 7, 7),
+        )
+
+
+def test_upstream_beam_cache(monkeypatch):
+    """
+    Test that a segment caching upstream beams only re-tracks the elements downstream
+    of a changed element, and that the result matches tracking without the cache.
+    """
+    cavity = cheetah.Cavity(
+        length=torch.tensor(1.0377),
+        voltage=torch.tensor(0.01815975e9),
+        phase=torch.tensor(0.0),
+        frequency=torch.tensor(1.3e9),
+    )
+    quadrupole = cheetah.Quadrupole(length=torch.tensor(0.2), k1=torch.tensor(4.2))
+    segment = cheetah.Segment(
+        elements=[
+            cheetah.Drift(length=torch.tensor(0.5)),
+            cavity,
+            cheetah.Drift(length=torch.tensor(0.3)),
+            quadrupole,
+            cheetah.Drift(length=torch.tensor(0.4)),
+        ],
+        cache_upstream_beams=True,
+    )
+    incoming = cheetah.ParticleBeam.from_parameters(
+        num_particles=1_000, energy=torch.tensor(1e8)
+    )
+
+    num_cavity_calls = 0
+    original_cavity_track = cavity.track
+
+    def counting_cavity_track(incoming):
+        nonlocal num_cavity_calls
+        num_cavity_calls += 1
+        return original_cavity_track(incoming)
+
+    monkeypatch.setattr(cavity, "track", counting_cavity_track)
+
+    segment.track(incoming)
+    assert num_cavity_calls == 1
+
+    quadrupole.k1 = torch.tensor(-2.0)
+    cached_outgoing = segment.track(incoming)
+    assert num_cavity_calls == 1
+
+    segment.cache_upstream_beams = False
+    uncached_outgoing = segment.track(incoming)
+    assert num_cavity_calls == 2
+
+    assert torch.allclose(cached_outgoing.particles, uncached_outgoing.particles)
+
+    # Changing an upstream element in place must invalidate the cache
+    segment.cache_upstream_beams = True
+    segment.track(incoming)
+    assert num_cavity_calls == 3
+    cavity.voltage.mul_(2.0)
+    segment.track(incoming)
+    assert num_cavity_calls == 4
+
+
+def test_upstream_beam_cache_with_gradients():
+    """
+    Test that beams requiring gradients are not cached, so that repeated backward
+    passes through a segment caching upstream beams work.
+    """
+    segment = cheetah.Segment(
+        elements=[
+            cheetah.Drift(length=torch.tensor(0.5)),
+            cheetah.Quadrupole(length=torch.tensor(0.2), k1=torch.tensor(4.2)),
+            cheetah.BPM(is_active=True),
+            cheetah.Drift(length=torch.tensor(0.4)),
+        ],
+        cache_upstream_beams=True,
+    )
+    mu_x = torch.tensor(1e-4, requires_grad=True)
+    incoming = cheetah.ParameterBeam.from_parameters(
+        mu_x=mu_x, energy=torch.tensor(1e8)
+    )
+
+    for _ in range(2):
+        outgoing = segment.track(incoming)
+        outgoing.mu_x.backward()
+
+    single_grad = torch.autograd.grad(segment.track(incoming).mu_x, mu_x)[0]
+    assert torch.isclose(mu_x.grad, 2 * single_grad)
+
+
+@pytest.mark.parametrize("x_max", [torch.tensor(1e-4), torch.tensor([1e-4, 2e-4])])
+def test_drop_lost_particles(x_max):
+    """
+    Test that a segment dropping lost particles removes them after an aperture, keeps
+    count of the removed particles and yields the same beam statistics as a segment
+    keeping them, also when the aperture is vectorised.
+    """
+    segment = cheetah.Segment(
+        elements=[
+            cheetah.Drift(length=torch.tensor(0.5)),
+            cheetah.Aperture(x_max=x_max, y_max=torch.tensor(1e-3)),
+            cheetah.Quadrupole(length=torch.tensor(0.2), k1=torch.tensor(4.2)),
+            cheetah.Drift(length=torch.tensor(0.4)),
+        ]
+    )
+    incoming = cheetah.ParticleBeam.from_parameters(
+        num_particles=10_000, sigma_x=torch.tensor(2e-4), dtype=torch.float64
+    )
+    segment = segment.to(torch.float64)
+
+    outgoing = segment.track(incoming)
+    segment.drop_lost_particles = True
+    compacted_outgoing = segment.track(incoming)
+
+    assert compacted_outgoing.num_particles < outgoing.num_particles
+    assert (
+        compacted_outgoing.num_particles + compacted_outgoing.num_dropped_particles
+        == incoming.num_particles
+    )
+    assert torch.allclose(compacted_outgoing.total_charge, outgoing.total_charge)
+    assert torch.allclose(
+        compacted_outgoing.num_particles_survived, outgoing.num_particles_survived
+    )
+    assert torch.allclose(compacted_outgoing.sigma_x, outgoing.sigma_x)
+    assert torch.allclose(compacted_outgoing.mu_px, outgoing.mu_px)
+
+
+def test_track_recording_losses():
+    """
+    Test that tracking with `record_losses=True` records the element and position at
+    which every particle is lost, also in nested segments, and that the per-element
+    losses add up to the particles lost along the segment.
+    """
+    segment = cheetah.Segment(
+        elements=[
+            cheetah.Drift(length=torch.tensor(0.5), name="drift_1"),
+            cheetah.Aperture(
+                x_max=torch.tensor(2e-4), y_max=torch.tensor(1.0), name="aperture_1"
+            ),
+            cheetah.Drift(length=torch.tensor(0.5), name="drift_2"),
+            cheetah.Segment(
+                elements=[
+                    cheetah.Aperture(
+                        x_max=torch.tensor(1.0),
+                        y_max=torch.tensor(1e-4),
+                        name="aperture_2",
+                    )
+                ]
+            ),
+        ]
+    )
+    incoming = cheetah.ParticleBeam.from_parameters(
+        num_particles=1_000, sigma_x=torch.tensor(2e-4), sigma_y=torch.tensor(1e-4)
+    )
+
+    outgoing, loss_map = segment.track(incoming, record_losses=True)
+
+    assert torch.allclose(segment.track(incoming).particles, outgoing.particles)
+    assert loss_map.element_names == ["drift_1", "aperture_1", "drift_2", "aperture_2"]
+    assert torch.isclose(
+        loss_map.num_lost, incoming.num_particles - outgoing.num_particles_survived
+    )
+    assert set(loss_map.losses_by_element_name().keys()) == {
+        "aperture_1",
+        "aperture_2",
+    }
+
+    first_lost = loss_map.element_indices == 1
+    assert torch.isclose(
+        first_lost.sum().to(loss_map.num_lost_per_element.dtype),
+        loss_map.num_lost_per_element[1],
+    )
+    assert torch.all(loss_map.s[first_lost] == 0.5)
+    assert torch.all(loss_map.s[loss_map.element_indices == 3] == 1.0)
+    assert torch.all(loss_map.s[~loss_map.is_lost].isnan())
+
+
+def test_track_recording_losses_reuses_tracking_plan():
+    """
+    Test that tracking with `record_losses=True` reuses the tracking plan of the
+    flattened segment between calls, and rebuilds it when an element of a nested
+    segment is replaced.
+    """
+    inner_segment = cheetah.Segment(
+        elements=[
+            cheetah.Aperture(
+                x_max=torch.tensor(1.0), y_max=torch.tensor(1e-4), name="aperture"
+            )
+        ]
+    )
+    segment = cheetah.Segment(
+        elements=[
+            cheetah.Drift(length=torch.tensor(0.5), name="drift_1"),
+            inner_segment,
+            cheetah.Drift(length=torch.tensor(0.5), name="drift_2"),
+        ]
+    )
+    incoming = cheetah.ParticleBeam.from_parameters(
+        num_particles=1_000, sigma_y=torch.tensor(1e-4)
+    )
+
+    _ = segment.track(incoming, record_losses=True)
+    first_plan = segment.__dict__["_flattened_segment"].tracking_plan()
+    _ = segment.track(incoming, record_losses=True)
+
+    assert segment.__dict__["_flattened_segment"].tracking_plan() is first_plan
+
+    inner_segment.elements[0] = cheetah.Drift(length=torch.tensor(0.1), name="drift")
+    outgoing, loss_map = segment.track(incoming, record_losses=True)
+
+    assert segment.__dict__["_flattened_segment"].tracking_plan() is not first_plan
+    assert loss_map.element_names == ["drift_1", "drift", "drift_2"]
+    assert torch.allclose(loss_map.num_lost, torch.tensor(0.0))
+    assert torch.allclose(outgoing.particles, segment.track(incoming).particles)
+
+
+def test_track_recording_losses_with_incompatible_options():
+    """
+    Test that tracking with `record_losses=True` raises an error if lost particles are
+    to be dropped, and warns that the upstream beam cache is not used if it is enabled.
+    """
+    segment = cheetah.Segment(
+        elements=[
+            cheetah.Drift(length=torch.tensor(0.5)),
+            cheetah.Aperture(x_max=torch.tensor(2e-4), y_max=torch.tensor(1.0)),
+        ],
+        drop_lost_particles=True,
+    )
+    incoming = cheetah.ParticleBeam.from_parameters(
+        num_particles=1_000, sigma_x=torch.tensor(2e-4)
+    )
+
+    with pytest.raises(ValueError):
+        _ = segment.track(incoming, record_losses=True)
+
+    segment.drop_lost_particles = False
+    segment.cache_upstream_beams = True
+    with pytest.warns(UserWarning):
+        outgoing, loss_map = segment.track(incoming, record_losses=True)
+
+    assert "_upstream_beam_cache" not in segment.__dict__
+    assert torch.isclose(
+        loss_map.num_lost, incoming.num_particles - outgoing.num_particles_survived
+    )
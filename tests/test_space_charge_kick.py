@@ -6,6 +6,7 @@ from scipy.constants import physical_constants
 from torch import nn
 
 import cheetah
+from cheetah.accelerator import space_charge_kick
 from cheetah.utils import compute_relativistic_factors
 
 
@@ -407,3 +408,363 @@ def test_space_charge_with_aperture_cutoff():
     )
     # Check that the number of surviving particles is less than the initial number
     assert outgoing_beam_with_aperture.survival_probabilities.sum(dim=-1).max() < 10_000
+
+
+def test_integrated_green_function_matches_cell_corners():
+    """
+    Test that the integrated Green function computed from a single octant matches the
+    difference of the integrated potential between the eight corners of every cell,
+    also in its mirror images in the 2x larger array.
+    """
+    kick = cheetah.SpaceChargeKick(
+        effect_length=torch.tensor(0.1), grid_shape=(4, 5, 6), dtype=torch.float64
+    )
+    scaled_cell_size = torch.tensor([1e-5, 2e-5, 5e-6], dtype=torch.float64)
+
+    green_function = kick._integrated_green_function(scaled_cell_size)
+
+    assert green_function.shape == (8, 10, 12)
+    for i, j, k in [(0, 0, 0), (1, 2, 3), (3, 4, 5)]:
+        expected = sum(
+            (-1) ** (sx + sy + sz)
+            * kick._integrated_potential(
+                (i + 0.5 - sx) * scaled_cell_size[0],
+                (j + 0.5 - sy) * scaled_cell_size[1],
+                (k + 0.5 - sz) * scaled_cell_size[2],
+            )
+            for sx in (0, 1)
+            for sy in (0, 1)
+            for sz in (0, 1)
+        )
+        assert torch.isclose(green_function[i, j, k], expected)
+        assert torch.isclose(green_function[-i, -j, -k], expected)
+
+
+def test_integrated_green_function_cache():
+    """
+    Test that with quantised cell sizes, the Fourier transformed integrated Green
+    function is reused from the shared cache by different kicks, and that the grid it is
+    computed for is only slightly larger than requested.
+    """
+    space_charge_kick._green_function_cache.clear()
+    incoming = cheetah.ParticleBeam.from_parameters(
+        num_particles=10_000, total_charge=torch.tensor(1e-9)
+    )
+    kick = cheetah.SpaceChargeKick(
+        effect_length=torch.tensor(0.1),
+        grid_shape=(16, 16, 16),
+        cell_size_resolution=0.01,
+    )
+    other_kick = cheetah.SpaceChargeKick(
+        effect_length=torch.tensor(0.2),
+        grid_shape=(16, 16, 16),
+        cell_size_resolution=0.01,
+    )
+
+    outgoing = kick.track(incoming)
+    assert len(space_charge_kick._green_function_cache) == 1
+
+    assert torch.allclose(kick.track(incoming).particles, outgoing.particles)
+    _ = other_kick.track(incoming)
+    assert len(space_charge_kick._green_function_cache) == 1
+
+    grid_dimensions = torch.tensor([[3e-4, 2e-4, 1e-5]])
+    cell_size = kick._cell_size(incoming, grid_dimensions)
+    assert torch.all(cell_size * 8 >= grid_dimensions)
+    assert torch.all(cell_size * 8 <= grid_dimensions * 1.0101)
+
+
+def test_exact_cell_size_by_default():
+    """
+    Test that by default, the cell sizes are not quantised, remain differentiable with
+    respect to the grid dimensions, and that the integrated Green function is not
+    cached.
+    """
+    space_charge_kick._green_function_cache.clear()
+    incoming = cheetah.ParticleBeam.from_parameters(
+        num_particles=10_000, total_charge=torch.tensor(1e-9)
+    )
+    kick = cheetah.SpaceChargeKick(
+        effect_length=torch.tensor(0.1), grid_shape=(16, 16, 16)
+    )
+
+    _ = kick.track(incoming)
+    assert len(space_charge_kick._green_function_cache) == 0
+
+    grid_dimensions = torch.tensor([[3e-4, 2e-4, 1e-5]], requires_grad=True)
+    cell_size = kick._cell_size(incoming, grid_dimensions)
+    assert torch.allclose(cell_size * 8, grid_dimensions)
+
+    cell_size.sum().backward()
+    assert torch.allclose(grid_dimensions.grad, torch.full((1, 3), 1 / 8))
+
+
+def test_symmetric_beam_stays_centered():
+    """
+    Test that the space charge kick on a beam that is symmetric around its centre does
+    not shift the beam's centroid, i.e. that the forces are interpolated from the same
+    grid points that the charges are deposited on.
+    """
+    incoming = cheetah.ParticleBeam.uniform_3d_ellipsoid(
+        num_particles=100_000,
+        total_charge=torch.tensor(1e-8),
+        energy=torch.tensor(1e6),
+        radius_x=torch.tensor(1e-3),
+        radius_y=torch.tensor(1e-3),
+        radius_tau=torch.tensor(1e-3),
+        sigma_px=torch.tensor(1e-15),
+        sigma_py=torch.tensor(1e-15),
+        sigma_p=torch.tensor(1e-15),
+    )
+    kick = cheetah.SpaceChargeKick(effect_length=torch.tensor(1e-3))
+
+    outgoing = kick.track(incoming)
+
+    assert outgoing.sigma_px > 1e-4
+    assert outgoing.mu_px.abs() < 0.01 * outgoing.sigma_px
+    assert outgoing.mu_py.abs() < 0.01 * outgoing.sigma_py
+
+
+def test_2p5d_solver_matches_3d_solver_for_long_bunch():
+    """
+    Test that for a bunch much longer than wide, the transverse kicks of the 2.5D
+    solver match those of the 3D solver.
+    """
+    incoming = cheetah.ParticleBeam.from_parameters(
+        num_particles=100_000,
+        sigma_x=torch.tensor(1e-4),
+        sigma_y=torch.tensor(2e-4),
+        sigma_tau=torch.tensor(1e-2),
+        sigma_px=torch.tensor(1e-15),
+        sigma_py=torch.tensor(1e-15),
+        sigma_p=torch.tensor(1e-15),
+        total_charge=torch.tensor(1e-9),
+        energy=torch.tensor(1e7),
+        dtype=torch.float64,
+    )
+    kick_3d = cheetah.SpaceChargeKick(
+        effect_length=torch.tensor(1.0), solver="3d", dtype=torch.float64
+    )
+    kick_2p5d = cheetah.SpaceChargeKick(
+        effect_length=torch.tensor(1.0), solver="2.5d", dtype=torch.float64
+    )
+
+    outgoing_3d = kick_3d.track(incoming)
+    outgoing_2p5d = kick_2p5d.track(incoming)
+
+    # Linear coefficients of the transverse kicks
+    kick_x_3d, kick_x_2p5d = (
+        (outgoing.px * incoming.x).sum() / incoming.x.square().sum()
+        for outgoing in (outgoing_3d, outgoing_2p5d)
+    )
+    kick_y_3d, kick_y_2p5d = (
+        (outgoing.py * incoming.y).sum() / incoming.y.square().sum()
+        for outgoing in (outgoing_3d, outgoing_2p5d)
+    )
+    assert kick_x_3d > 0
+    assert torch.isclose(kick_x_2p5d, kick_x_3d, rtol=2e-2)
+    assert torch.isclose(kick_y_2p5d, kick_y_3d, rtol=2e-2)
+
+
+def test_2d_solver_matches_2p5d_solver_for_uniform_bunch():
+    """
+    Test that for a longitudinally uniform bunch, the transverse kicks of the 2D solver
+    match those of the 2.5D solver.
+    """
+    incoming = cheetah.ParticleBeam.from_parameters(
+        num_particles=100_000,
+        sigma_x=torch.tensor(1e-4),
+        sigma_y=torch.tensor(1e-4),
+        sigma_px=torch.tensor(1e-15),
+        sigma_py=torch.tensor(1e-15),
+        sigma_p=torch.tensor(1e-15),
+        total_charge=torch.tensor(1e-9),
+        energy=torch.tensor(1e7),
+    )
+    particles = incoming.particles.clone()
+    particles[..., 4] = (torch.rand(incoming.num_particles) - 0.5) * 1e-2
+    incoming = cheetah.ParticleBeam(
+        particles=particles,
+        energy=incoming.energy,
+        particle_charges=incoming.particle_charges,
+    )
+    kick_2d = cheetah.SpaceChargeKick(
+        effect_length=torch.tensor(1.0), grid_shape=(32, 32, 64), solver="2d"
+    )
+    kick_2p5d = cheetah.SpaceChargeKick(
+        effect_length=torch.tensor(1.0), grid_shape=(32, 32, 64), solver="2.5d"
+    )
+
+    outgoing_2d = kick_2d.track(incoming)
+    outgoing_2p5d = kick_2p5d.track(incoming)
+
+    assert torch.allclose(outgoing_2d.sigma_px, outgoing_2p5d.sigma_px, rtol=3e-2)
+    assert torch.allclose(outgoing_2d.sigma_py, outgoing_2p5d.sigma_py, rtol=3e-2)
+
+
+@pytest.mark.parametrize("solver", ["2d", "2.5d"])
+def test_transverse_solver_vectorized(solver):
+    """
+    Test that the transverse solvers can be applied to a vectorised beam, and that
+    every entry of the vector dimensions matches tracking it on its own.
+    """
+    incoming = cheetah.ParticleBeam.from_parameters(
+        num_particles=10_000,
+        sigma_x=torch.tensor([1e-4, 2e-4, 3e-4]),
+        sigma_tau=torch.tensor(1e-3),
+        total_charge=torch.tensor([[1e-9], [2e-9]]),
+        energy=torch.tensor(1e7),
+    )
+    kick = cheetah.SpaceChargeKick(effect_length=torch.tensor(0.5), solver=solver)
+
+    outgoing = kick.track(incoming)
+
+    assert outgoing.particles.shape == (2, 3, 10_000, 7)
+    single = cheetah.ParticleBeam(
+        particles=incoming.particles[2],
+        energy=incoming.energy,
+        particle_charges=incoming.particle_charges[1, 0],
+    )
+    assert torch.allclose(
+        outgoing.particles[1, 2], kick.track(single).particles, atol=1e-6
+    )
+
+
+def test_with_space_charge_matches_manual_kicks():
+    """
+    Test that inserting space-charge kicks into a drift with `Segment.with_space_charge`
+    gives the same lattice and tracking result as placing the kicks manually.
+    """
+    section_length = torch.tensor(0.42)
+    incoming = cheetah.ParticleBeam.uniform_3d_ellipsoid(
+        num_particles=10_000,
+        total_charge=torch.tensor(1e-8),
+        energy=torch.tensor(2.5e8),
+        radius_x=torch.tensor(1e-3),
+        radius_y=torch.tensor(1e-3),
+        radius_tau=torch.tensor(2e-6),
+        sigma_px=torch.tensor(1e-15),
+        sigma_py=torch.tensor(1e-15),
+        sigma_p=torch.tensor(1e-15),
+    )
+    manual_segment = cheetah.Segment(
+        elements=[
+            cheetah.Drift(section_length / 6),
+            cheetah.SpaceChargeKick(section_length / 3),
+            cheetah.Drift(section_length / 3),
+            cheetah.SpaceChargeKick(section_length / 3),
+            cheetah.Drift(section_length / 3),
+            cheetah.SpaceChargeKick(section_length / 3),
+            cheetah.Drift(section_length / 6),
+        ]
+    )
+    segment = cheetah.Segment(
+        elements=[cheetah.Drift(section_length), cheetah.Marker()]
+    ).with_space_charge(incoming, max_step=1.001 * section_length / 3)
+
+    assert [type(element) for element in segment.elements] == [
+        cheetah.Drift,
+        cheetah.SpaceChargeKick,
+        cheetah.CustomTransferMap,
+        cheetah.SpaceChargeKick,
+        cheetah.CustomTransferMap,
+        cheetah.SpaceChargeKick,
+        cheetah.CustomTransferMap,
+    ]
+    assert torch.isclose(segment.length, section_length)
+
+    outgoing = segment.track(incoming)
+    manual_outgoing = manual_segment.track(incoming)
+
+    assert torch.allclose(outgoing.particles, manual_outgoing.particles, atol=1e-7)
+
+
+def test_with_space_charge_unsplittable_elements():
+    """
+    Test that elements that cannot be split get half a kick at their entrance and exit,
+    that adjacent kicks are merged, and that the effect lengths of all kicks add up to
+    the length of the segment.
+    """
+    segment = cheetah.Segment(
+        elements=[
+            cheetah.Quadrupole(length=torch.tensor(0.3), k1=torch.tensor(4.0)),
+            cheetah.Dipole(length=torch.tensor(0.4), angle=torch.tensor(0.01)),
+            cheetah.Dipole(length=torch.tensor(0.4), angle=torch.tensor(0.01)),
+            cheetah.Drift(length=torch.tensor(0.5)),
+        ]
+    )
+    incoming = cheetah.ParticleBeam.from_parameters(num_particles=1_000)
+
+    segment_with_space_charge = segment.with_space_charge(
+        incoming, max_step=torch.tensor(0.2), solver="2d"
+    )
+
+    kicks = [
+        element
+        for element in segment_with_space_charge.elements
+        if isinstance(element, cheetah.SpaceChargeKick)
+    ]
+    assert len(kicks) == 2 + 3 + 3
+    assert all(kick.solver == "2d" for kick in kicks)
+    assert torch.isclose(
+        sum(kick.effect_length for kick in kicks), segment.length, rtol=1e-6
+    )
+    assert torch.isclose(segment_with_space_charge.length, segment.length)
+    for element, next_element in zip(
+        segment_with_space_charge.elements, segment_with_space_charge.elements[1:]
+    ):
+        assert isinstance(element, cheetah.SpaceChargeKick) != isinstance(
+            next_element, cheetah.SpaceChargeKick
+        )
+
+
+def test_compact_beam_is_kicked_without_expansion():
+    """
+    Test that a compact beam is kicked in its 6-dimensional storage without ever
+    building its 7-dimensional particle vectors, and that it receives the same kick as
+    the equivalent full beam.
+    """
+    incoming = cheetah.ParticleBeam.from_parameters(
+        num_particles=10_000,
+        sigma_px=torch.tensor(1e-15),
+        sigma_py=torch.tensor(1e-15),
+        total_charge=torch.tensor(1e-9),
+    )
+    compact_incoming = incoming.as_compact_beam()
+    element = cheetah.SpaceChargeKick(effect_length=torch.tensor(0.5))
+
+    outgoing = element.track(incoming)
+    compact_outgoing = element.track(compact_incoming)
+
+    assert compact_outgoing.is_compact
+    assert "_particles_cache" not in compact_incoming.__dict__
+    assert "_particles_cache" not in compact_outgoing.__dict__
+    assert torch.allclose(compact_outgoing.phase_space, outgoing.phase_space)
+
+
+@pytest.mark.parametrize("solver", ["3d", "2.5d"])
+def test_sort_deposition_backend_matches_scatter(solver):
+    """
+    Test that the space-charge kick with the opt-in `"sort"` deposition backend matches
+    the kick with the default `"scatter"` backend.
+    """
+    incoming = cheetah.ParticleBeam.from_parameters(
+        num_particles=10_000,
+        sigma_px=torch.tensor(1e-15),
+        sigma_py=torch.tensor(1e-15),
+        total_charge=torch.tensor(1e-9),
+        dtype=torch.float64,
+    )
+    scatter_kick = cheetah.SpaceChargeKick(
+        effect_length=torch.tensor(0.5, dtype=torch.float64), solver=solver
+    )
+    sort_kick = cheetah.SpaceChargeKick(
+        effect_length=torch.tensor(0.5, dtype=torch.float64),
+        solver=solver,
+        deposition_backend="sort",
+    )
+
+    assert scatter_kick.deposition_backend == "scatter"
+    assert torch.allclose(
+        sort_kick.track(incoming).particles, scatter_kick.track(incoming).particles
+    )
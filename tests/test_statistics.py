@@ -4,6 +4,7 @@ from cheetah.utils import (
     match_distribution_moments,
     unbiased_weighted_covariance,
     unbiased_weighted_covariance_matrix,
+    unbiased_weighted_mean_and_covariance_matrix,
     unbiased_weighted_variance,
 )
 
@@ -126,6 +127,28 @@ def test_unbiased_weighted_covariance_matrix_torch():
     assert torch.allclose(computed_covariance_matrix, expected_covariance_matrix)
 
 
+def test_unbiased_weighted_mean_and_covariance_matrix():
+    """
+    Test that the fused computation of the weighted mean and covariance matrix agrees
+    with computing them separately, also for vectorised weights.
+    """
+    series = torch.arange(5.0)
+    data = torch.stack([series, series.square(), series.pow(3)], dim=-1)
+    weights = torch.tensor([[0.5, 1.0, 1.0, 0.9, 0.9], [0.4, 1.2, 1.4, 0.6, 0.7]])
+
+    mean, covariance = unbiased_weighted_mean_and_covariance_matrix(data, weights)
+
+    expected_mean = (data * weights.unsqueeze(-1)).sum(dim=-2) / weights.sum(
+        dim=-1, keepdim=True
+    )
+    expected_covariance = unbiased_weighted_covariance_matrix(data, weights)
+
+    assert mean.shape == (2, 3)
+    assert covariance.shape == (2, 3, 3)
+    assert torch.allclose(mean, expected_mean)
+    assert torch.allclose(covariance, expected_covariance)
+
+
 def test_match_distribution_moments():
     """
     Test that the first and second moments of the samples after transformation are
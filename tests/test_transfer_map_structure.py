@@ -0,0 +1,94 @@
+import torch
+
+import cheetah
+from cheetah.utils import transfer_map_structure
+from cheetah.utils.transfer_map_structure import (
+    has_affine_offset,
+    is_identity_transfer_map,
+    register_cached_transfer_map,
+)
+
+
+def test_is_identity_transfer_map():
+    """
+    Test that cached identity transfer maps are detected, also when vectorised, and
+    that in-place modifications of a checked transfer map are taken into account.
+    """
+    identity = torch.eye(7).repeat(3, 1, 1)
+    register_cached_transfer_map(identity)
+    assert is_identity_transfer_map(identity)
+
+    identity[1, 0, 1] = 0.5
+    assert not is_identity_transfer_map(identity)
+
+    identity = torch.eye(7).requires_grad_(True)
+    register_cached_transfer_map(identity)
+    assert not is_identity_transfer_map(identity)
+
+
+def test_uncached_transfer_map_is_not_inspected():
+    """
+    Test that the structure of transfer maps that are not cached, e.g. the merged
+    transfer map of a segment, is not inspected, while cached ones are inspected once.
+    """
+    identity = torch.eye(7)
+    assert not is_identity_transfer_map(identity)
+    assert has_affine_offset(identity)
+
+    incoming = cheetah.ParticleBeam.from_parameters(num_particles=1_000)
+    segment = cheetah.Segment(
+        elements=[cheetah.Drift(length=torch.tensor(0.0)) for _ in range(2)]
+    )
+    transfer_map = segment.first_order_transfer_map(incoming.energy, incoming.species)
+    assert torch.equal(transfer_map, torch.eye(7))
+    assert transfer_map not in transfer_map_structure._structure_by_transfer_map
+
+    drift_transfer_map = segment.elements[0].first_order_transfer_map(
+        incoming.energy, incoming.species
+    )
+    assert drift_transfer_map in transfer_map_structure._structure_by_transfer_map
+    assert is_identity_transfer_map(drift_transfer_map)
+
+
+def test_identity_transfer_map_skips_particle_update():
+    """
+    Test that tracking through an element with an identity transfer map does not copy
+    the particles, while the particles of other elements are transformed.
+    """
+    incoming = cheetah.ParticleBeam.from_parameters(num_particles=1_000)
+
+    outgoing = cheetah.Drift(length=torch.tensor(0.0)).track(incoming)
+    assert outgoing.particles is incoming.particles
+
+    outgoing = cheetah.Drift(length=torch.tensor(1.0)).track(incoming)
+    assert outgoing.particles is not incoming.particles
+    assert not torch.allclose(outgoing.particles, incoming.particles)
+
+
+def test_identity_transfer_map_with_vector_dimensions():
+    """
+    Test that an identity transfer map with more vector dimensions than the particles
+    still broadcasts the particles to the vector dimensions of the element.
+    """
+    incoming = cheetah.ParticleBeam.from_parameters(num_particles=1_000)
+
+    outgoing = cheetah.Drift(length=torch.zeros(3)).track(incoming)
+
+    assert outgoing.particles.shape == (3, 1_000, 7)
+    assert torch.allclose(outgoing.particles, incoming.particles)
+
+
+def test_has_affine_offset():
+    """
+    Test that cached transfer maps with a non-zero affine offset are detected, also
+    when vectorised, and that maps requiring gradients are assumed to have one.
+    """
+    transfer_map = torch.eye(7).repeat(3, 1, 1)
+    transfer_map[:, 0, 1] = 0.5
+    register_cached_transfer_map(transfer_map)
+    assert not has_affine_offset(transfer_map)
+
+    transfer_map[2, 5, 6] = 1e-3
+    assert has_affine_offset(transfer_map)
+
+    assert has_affine_offset(torch.eye(7).requires_grad_(True))
@@ -302,8 +302,8 @@ def test_vectorized_solenoid(BeamClass):
         assert outgoing.particle_charges.shape == (100_000,)
 
 
-@pytest.mark.parametrize("BeamClass", [cheetah.ParticleBeam])
-@pytest.mark.parametrize("method", ["kde"])  # Currently only KDE supports vectorisation
+@pytest.mark.parametrize("BeamClass", [cheetah.ParticleBeam, cheetah.ParameterBeam])
+@pytest.mark.parametrize("method", ["histogram", "kde", "binned-kde", "cloud-in-cell"])
 def test_vectorized_screen_2d(BeamClass, method):
     """
     Test that a vectorized `Screen` is able to track a particle beam and produce a